@@ -1,28 +1,53 @@
 import asyncio
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import json
 from math import ceil
 import os
 from datetime import date
-from time import time
+from time import perf_counter, time
 import logging
-from typing import Dict
-from fastapi import BackgroundTasks, FastAPI, HTTPException, Request, Response
+from typing import Dict, Optional
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.exceptions import RequestValidationError
+from starlette.background import BackgroundTask
+import httpx
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from pathlib import Path
 from fastapi import UploadFile, File
-from utils.custom_functions import custom_tool
 from utils.custom_instructions import get_custom_instructions
+from utils.interpreter_factory import create_interpreter
+from utils.interpreter_pool import InterpreterPool
+from utils.streaming import iterate_in_executor
+from utils.session_registry import SessionRegistry
+from utils.sandbox import SandboxCapacityError, SandboxManager
+from utils.message_store import MessageStore, history_keys
+from utils.session_reaper import SessionReaper
+from utils.session_capacity import SessionCapacity, SessionCapacityError
+from utils import hibernation
+from utils.erddap_cache import get_default_cache as get_erddap_cache
+from utils import metrics
+from utils.climate_index import REFRESH_AGE as CLIMATE_INDEX_REFRESH_AGE, get_default_cache as get_climate_index_cache
+from utils.station_index import get_default_index as get_station_index
+from utils.altimetry import get_default_store as get_altimetry_store
+from utils.metadata_sync import SYNC_INTERVAL as METADATA_SYNC_INTERVAL, get_default_sync as get_metadata_sync
+from utils.rapid_poller import POLL_INTERVAL as RAPID_POLL_INTERVAL, get_default_poller as get_rapid_poller
+from utils.batch_analysis import OPERATIONS as BATCH_OPERATIONS, run_batch, shutdown_pool as shutdown_batch_pool
+from utils.datum_table import (
+    FLOOD_DATUMS, REFRESH_INTERVAL as DATUM_REFRESH_INTERVAL, count_datum_exceedances,
+    get_default_table as get_datum_table,
+)
 import redis
+import redis.asyncio as aioredis
 # import magic
 
-from utils.system_prompt import sys_prompt
 from starlette.middleware.base import BaseHTTPMiddleware
 from interpreter.core.core import OpenInterpreter 
 from slowapi.errors import RateLimitExceeded
@@ -33,7 +58,62 @@ logger = logging.getLogger(__name__)
 IDLE_TIMEOUT = 3600  # 1 hour in seconds
 INTERPRETER_PREFIX = "interpreter:"
 LAST_ACTIVE_PREFIX = "last_active:"
-CLEANUP_INTERVAL = 1800  # Run cleanup every 30 minutes
+# Number of pre-warmed interpreters kept ready for new sessions (0 disables the pool)
+INTERPRETER_POOL_SIZE = int(os.getenv("INTERPRETER_POOL_SIZE", "2"))
+# Upper bound on chat turns executing at once; each one occupies a worker thread
+CHAT_MAX_WORKERS = int(os.getenv("CHAT_MAX_WORKERS", "16"))
+
+# Multi-worker session routing. Each worker sets SEA_WORKER_URL to the address the
+# other workers can reach it at (e.g. http://web-1:8001); leaving it unset keeps the
+# single-worker behaviour.
+SEA_WORKER_URL = os.getenv("SEA_WORKER_URL")
+# Shared by all workers; without it forwarded requests are rate limited by the forwarding worker's address
+SEA_WORKER_SECRET = os.getenv("SEA_WORKER_SECRET")
+SESSION_ROUTED_PATHS = ("/chat", "/history", "/clear", "/profile")
+FORWARDED_HEADER = "x-sea-forwarded"
+CLIENT_ADDRESS_HEADER = "x-sea-client-address"
+FORWARDED_AT_HEADER = "x-sea-forwarded-at"
+SIGNATURE_HEADER = "x-sea-signature"
+WORKER_HEADER = "x-sea-worker"
+# Out-of-process sandbox workers. When enabled every session's interpreter and
+# kernel run in a separate worker process with CPU-time and memory ceilings.
+SANDBOX_ENABLED = os.getenv("SANDBOX_ENABLED") == "1"
+SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "3600"))
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "4096"))
+SANDBOX_MAX_WORKERS = int(os.getenv("SANDBOX_MAX_WORKERS", "32"))
+SANDBOX_MIN_FREE_MB = int(os.getenv("SANDBOX_MIN_FREE_MB", "1024"))  # Admission control
+SANDBOX_MAX_CPU_PERCENT = float(os.getenv("SANDBOX_MAX_CPU_PERCENT", "90"))  # Admission control
+SANDBOX_CGROUP_ROOT = os.getenv("SANDBOX_CGROUP_ROOT")  # Writable cgroup v2 dir, optional
+# Chat history storage: code/console payloads above these sizes (bytes) are
+# compressed or written to static/{session_id}/.history, and the oldest console
+# outputs are dropped once a session stores more than its budget
+HISTORY_COMPRESS_THRESHOLD = int(os.getenv("HISTORY_COMPRESS_THRESHOLD", "1024"))
+HISTORY_OFFLOAD_THRESHOLD = int(os.getenv("HISTORY_OFFLOAD_THRESHOLD", str(64 * 1024)))
+HISTORY_SESSION_BUDGET_MB = int(os.getenv("HISTORY_SESSION_BUDGET_MB", "8"))
+
+# Live interpreter sessions allowed at once, and the fraction of container memory
+# in use above which least-recently-used idle sessions are evicted
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "50"))
+MEMORY_HIGH_WATERMARK = float(os.getenv("MEMORY_HIGH_WATERMARK", "0.85"))
+# Sessions evicted for memory per new session, and the wait for the cgroup to catch up between them
+MAX_MEMORY_EVICTIONS = int(os.getenv("MAX_MEMORY_EVICTIONS", "2"))
+EVICTION_SETTLE_SECONDS = float(os.getenv("EVICTION_SETTLE_SECONDS", "0.5"))
+
+# Idle or evicted sessions have their kernel variables snapshotted to
+# static/{session_id}/.hibernate and restored on their next message. Snapshots
+# are kept this long (seconds) and capped at this size per session.
+HIBERNATE_RETENTION = int(os.getenv("HIBERNATE_RETENTION", str(24 * 3600)))
+HIBERNATE_MAX_MB = int(os.getenv("HIBERNATE_MAX_MB", "512"))
+
+# Download and convert the altimetry NetCDF at startup (0 leaves it to the first kernel that asks)
+ALTIMETRY_AT_STARTUP = os.getenv("ALTIMETRY_AT_STARTUP", "1") == "1"
+
+CAPACITY_RETRY_AFTER = 30  # Seconds clients are asked to wait when no capacity is available
+
+HOP_BY_HOP_HEADERS = {
+    "host", "content-length", "connection", "keep-alive", "transfer-encoding",
+    "te", "trailer", "upgrade", "proxy-authorization", "proxy-authenticate",
+}
 
 # Constants for file upload
 STATIC_DIR = Path("static")
@@ -42,14 +122,22 @@ MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_EXTENSIONS = {'.csv', '.txt', '.json', '.nc', '.xlsx', '.tif'}
 
 # Rate limiting
-UPLOAD_RATE_LIMIT = "5/minute"
+UPLOAD_RATE_LIMIT = os.getenv("UPLOAD_RATE_LIMIT", "5/minute")
 MAX_UPLOADS_PER_SESSION = 10  # Maximum files per session
 CLAMD_HOST = "localhost"  # Docker service name
 CLAMD_PORT = 3310
-CHAT_RATE_LIMIT = "10/minute"
+CHAT_RATE_LIMIT = os.getenv("CHAT_RATE_LIMIT", "10/minute")
+# Kernels post from the app's own host, so they share one /batch limit
+BATCH_RATE_LIMIT = os.getenv("BATCH_RATE_LIMIT", "30/minute")
+# Batches running at once; each one already spreads over the whole process pool
+BATCH_MAX_IN_FLIGHT = int(os.getenv("BATCH_MAX_IN_FLIGHT", "2"))
+
+def get_client_address(request: Request) -> str:
+    """Rate limit key, using the original client for requests forwarded by another worker"""
+    return getattr(request.state, "client_address", None) or get_remote_address(request)
 
 # Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address)
+limiter = Limiter(key_func=get_client_address)
 
 class InterpreterError(Exception):
     """Custom exception for interpreter-related errors"""
@@ -101,6 +189,76 @@ class RequestSizeLimitMiddleware(BaseHTTPMiddleware):
                 )
         return await call_next(request)
 
+async def forward_request(request: Request, worker_url: str) -> StreamingResponse:
+    """Proxy a request to the worker that owns its session and stream the reply back"""
+    # Drop any x-sea-* headers the client sent, only this worker's own may reach the owner
+    headers = {
+        k: v for k, v in request.headers.items()
+        if k.lower() not in HOP_BY_HOP_HEADERS and not k.lower().startswith("x-sea-")
+    }
+    headers[FORWARDED_HEADER] = session_registry.worker_id
+    client_address = get_client_address(request)
+    signed = session_registry.sign_forward(client_address)
+    if signed:
+        headers[CLIENT_ADDRESS_HEADER] = client_address
+        headers[FORWARDED_AT_HEADER], headers[SIGNATURE_HEADER] = signed
+    upstream_request = forward_client.build_request(
+        request.method,
+        worker_url + request.url.path,
+        params=request.query_params,
+        headers=headers,
+        content=await request.body(),
+    )
+    upstream = await forward_client.send(upstream_request, stream=True)
+    return StreamingResponse(
+        upstream.aiter_raw(),
+        status_code=upstream.status_code,
+        headers={k: v for k, v in upstream.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS},
+        background=BackgroundTask(upstream.aclose),
+    )
+
+class SessionRoutingMiddleware(BaseHTTPMiddleware):
+    """Route session requests to the worker holding that session's interpreter"""
+    async def dispatch(self, request, call_next):
+        session_id = request.headers.get("x-session-id")
+        if (
+            session_registry is None
+            or not session_id
+            or not request.url.path.rstrip("/").endswith(SESSION_ROUTED_PATHS)
+        ):
+            return await call_next(request)
+
+        forwarded_by = request.headers.get(FORWARDED_HEADER)
+        try:
+            if forwarded_by:
+                # Only trust the original client address if a live worker signed it with the shared secret;
+                # the worker id alone is no credential, every response names it
+                signed = session_registry.verify_forward(
+                    forwarded_by,
+                    request.headers.get(CLIENT_ADDRESS_HEADER),
+                    request.headers.get(FORWARDED_AT_HEADER),
+                    request.headers.get(SIGNATURE_HEADER),
+                )
+                if signed and await session_registry.worker_url_for(forwarded_by):
+                    request.state.client_address = request.headers.get(CLIENT_ADDRESS_HEADER)
+            else:
+                owner = await session_registry.claim(session_id)
+                if owner != session_registry.worker_id:
+                    _, worker_url = await session_registry.owner(session_id)
+                    if worker_url:
+                        try:
+                            return await forward_request(request, worker_url)
+                        except httpx.TransportError as e:
+                            logger.error(f"Worker {owner} unreachable for session {session_id}: {str(e)}")
+                    await session_registry.claim(session_id, take_over=True)
+        except redis.RedisError as e:
+            logger.error(f"Session registry unavailable, serving {session_id} locally: {str(e)}")
+
+        response = await call_next(request)
+        response.headers[WORKER_HEADER] = session_registry.worker_id
+        return response
+
+app.add_middleware(SessionRoutingMiddleware)
 app.add_middleware(RequestSizeLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
@@ -108,6 +266,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["x-history-length"],
 )
 
 @app.exception_handler(RateLimitExceeded)
@@ -170,121 +329,292 @@ async def check_session_upload_limit(session_id: str) -> bool:
     file_count = sum(1 for _ in session_dir.glob("*") if _.is_file())
     return file_count < MAX_UPLOADS_PER_SESSION
 
-redis_client = redis.Redis(host="redis", port=6379, db=0)
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+# Async client so Redis round trips don't block the event loop
+aioredis_client = aioredis.Redis(host=REDIS_HOST, port=6379, db=0)
+# Interpreter chat turns and kernel start-up run here, off the event loop
+chat_executor = ThreadPoolExecutor(max_workers=CHAT_MAX_WORKERS, thread_name_prefix="chat")
+message_store = MessageStore(
+    aioredis_client,
+    STATIC_DIR,
+    compress_threshold=HISTORY_COMPRESS_THRESHOLD,
+    offload_threshold=HISTORY_OFFLOAD_THRESHOLD,
+    session_budget=HISTORY_SESSION_BUDGET_MB * 1024 * 1024,
+)
+# Session -> worker registry, only used when running more than one worker
+session_registry = (
+    SessionRegistry(aioredis_client, SEA_WORKER_URL, secret=SEA_WORKER_SECRET) if SEA_WORKER_URL else None
+)
+# No read timeout, forwarded chat turns stream for as long as the owner keeps sending
+forward_client = httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=None))
 # Global dictionary to store interpreter instances
 # Not thread safe, but should be ok for proof of concept
 interpreter_instances: Dict[str, OpenInterpreter] = {}
+# Sessions with a chat turn in flight, never evicted
+busy_sessions = set()
+session_capacity = SessionCapacity(MAX_SESSIONS, MEMORY_HIGH_WATERMARK, MAX_MEMORY_EVICTIONS, EVICTION_SETTLE_SECONDS)
+capacity_lock = asyncio.Lock()
+# Sessions whose chat turns run under the sampling profiler, and their last profile
+profiled_sessions = set()
+session_profiles: Dict[str, dict] = {}
+batch_slots = asyncio.Semaphore(BATCH_MAX_IN_FLIGHT)
+
+sandbox_manager = SandboxManager(
+    cpu_seconds=SANDBOX_CPU_SECONDS,
+    memory_bytes=SANDBOX_MEMORY_MB * 1024 * 1024,
+    max_workers=SANDBOX_MAX_WORKERS,
+    min_free_bytes=SANDBOX_MIN_FREE_MB * 1024 * 1024,
+    max_cpu_percent=SANDBOX_MAX_CPU_PERCENT,
+    cgroup_root=SANDBOX_CGROUP_ROOT,
+) if SANDBOX_ENABLED else None
+
+interpreter_pool = InterpreterPool(
+    sandbox_manager.spawn if sandbox_manager else create_interpreter,
+    size=INTERPRETER_POOL_SIZE,
+)
+
+def restore_messages(interpreter, messages):
+    """Load a previous conversation into a fresh interpreter"""
+    if hasattr(interpreter, "set_messages"):
+        interpreter.set_messages(messages)
+    else:
+        interpreter.messages = messages
 
 def get_or_create_interpreter(session_id: str) -> OpenInterpreter:
-    """Get existing interpreter or create new one"""
+    """Get existing interpreter or hand out a pre-warmed one"""
     try:
         # Return existing instance if it exists
-        if session_id in interpreter_instances:
+        started = perf_counter()
+        existing = interpreter_instances.get(session_id)
+        if existing is not None and getattr(existing, "alive", True):
             logger.info(f"Retrieved existing interpreter for session {session_id}")
-            return interpreter_instances[session_id]
-        
-        # Create new interpreter instance with default settings
-        interpreter = OpenInterpreter()
-        interpreter.system_message += sys_prompt
-        interpreter.llm.model = "gpt-4o-2024-11-20"
-        interpreter.llm.temperature = 0.2
-        # Setting to maximim for gpt-4o as per documentation
-        # https://platform.openai.com/docs/models#gpt-4o
-        interpreter.llm.context_window = 128000
-        interpreter.llm.max_tokens = 16383
-        interpreter.max_output = 16383
+            metrics.INTERPRETER_ACQUIRE_SECONDS.observe(perf_counter() - started, source="existing")
+            return existing
         
-        interpreter.llm.max_budget = 0.03
-        interpreter.computer.import_computer_api = False
-        interpreter.computer.run("python", custom_tool)
-        interpreter.llm.supports_functions = True
-        interpreter.auto_run = True
+        interpreter = interpreter_pool.acquire()
+        interpreter.session_id = session_id
+        if existing is not None:
+            # The session's sandbox worker died (e.g. hit its memory ceiling), keep the conversation
+            logger.warning(f"Sandbox for session {session_id} exited, starting a new one")
+            restore_messages(interpreter, existing.messages)
         
         # Store the instance
         interpreter_instances[session_id] = interpreter
         logger.info(f"Created new interpreter for session {session_id}")
-        
-        # Store last active time in Redis
-        redis_client.set(f"{LAST_ACTIVE_PREFIX}{session_id}", str(time()))
+        metrics.INTERPRETER_ACQUIRE_SECONDS.observe(
+            perf_counter() - started, source="replaced" if existing is not None else "new"
+        )
         
         return interpreter
 
+    except SandboxCapacityError:
+        raise
     except Exception as e:
         logger.error(f"Error in get_or_create_interpreter: {str(e)}")
         raise InterpreterError(f"Failed to create/retrieve interpreter: {str(e)}")
-    
 
-async def periodic_cleanup():
-    """Background task for periodic cleanup of idle sessions"""
+def hibernate_and_reset(session_id: str, interpreter):
+    """Snapshot the kernel's variables, then shut the interpreter down"""
+    try:
+        hibernation.hibernate(
+            interpreter,
+            hibernation.snapshot_path(STATIC_DIR, session_id),
+            max_bytes=HIBERNATE_MAX_MB * 1024 * 1024,
+        )
+    except Exception as e:
+        logger.error(f"Error hibernating session {session_id}: {str(e)}")
+    interpreter.reset()
+
+async def evict_session(session_id: str):
+    """Shut down a session's interpreter but keep its history and variables so it can be resumed"""
+    interpreter = interpreter_instances.pop(session_id, None)
+    if interpreter:
+        await asyncio.to_thread(hibernate_and_reset, session_id, interpreter)
+    session_capacity.stats["evicted"] += 1
+    logger.info(f"Evicted session {session_id}, history and kernel snapshot kept for resume")
+
+async def make_room_for_session(session_id: str):
+    """Evict least-recently-used idle sessions until a new session fits"""
+    if session_id in interpreter_instances:
+        return
+    async with capacity_lock:
+        # Earliest idle deadline == least recently used
+        await session_capacity.make_room(
+            interpreter_instances, busy_sessions, lambda sid: session_reaper.deadline(sid) or 0, evict_session
+        )
+
+
+@app.on_event("startup")
+async def start_session_reaper():
+    """Start reclaiming sessions as they go idle"""
+    asyncio.create_task(session_reaper.run())
+
+async def refresh_climate_indices_forever():
+    """Keep the shared climate index cache fresh so kernels never wait on the upstreams"""
     while True:
         try:
-            logger.info("Running periodic cleanup of idle sessions")
-            await cleanup_idle_sessions()
-            await asyncio.sleep(CLEANUP_INTERVAL)
+            refreshed = await asyncio.to_thread(get_climate_index_cache().refresh_all)
+            logger.info(f"Climate index refresh done, {len(refreshed)} source(s) changed")
         except Exception as e:
-            logger.error(f"Error in periodic cleanup: {str(e)}")
-            await asyncio.sleep(60)  # Wait a minute before retrying if there's an error
+            logger.exception(f"Error refreshing climate indices: {str(e)}")
+        await asyncio.sleep(CLIMATE_INDEX_REFRESH_AGE)
 
 @app.on_event("startup")
-async def start_periodic_cleanup():
-    """Start the periodic cleanup task when the app starts"""
-    asyncio.create_task(periodic_cleanup())
+async def start_climate_index_refresh():
+    """Warm the climate index cache and refresh it on a schedule"""
+    asyncio.create_task(refresh_climate_indices_forever())
+
+async def sync_metadata_forever():
+    """Keep fd_metadata.geojson and the station index in step with the UHSLC metadata API"""
+    while True:
+        try:
+            result = await get_metadata_sync().sync()
+            logger.info(f"Metadata sync: {result}")
+        except Exception as e:
+            logger.error(f"Error syncing station metadata: {str(e)}")
+        await asyncio.sleep(METADATA_SYNC_INTERVAL)
+
+@app.on_event("startup")
+async def start_metadata_sync():
+    """Sync station metadata at startup and on a schedule"""
+    asyncio.create_task(sync_metadata_forever())
+
+async def poll_rapid_forever():
+    """Keep the shared RAPID ring buffer current so kernels never download the RAPID files"""
+    while True:
+        try:
+            result = await get_rapid_poller().poll()
+            logger.info(f"RAPID poll: {result}")
+        except Exception as e:
+            logger.error(f"Error polling RAPID data: {str(e)}")
+        await asyncio.sleep(RAPID_POLL_INTERVAL)
+
+@app.on_event("startup")
+async def start_rapid_poller():
+    """Poll the RAPID files at startup and on a schedule"""
+    asyncio.create_task(poll_rapid_forever())
+
+async def refresh_datum_tables_forever():
+    """Keep the parsed datum tables in step with the upstream datum table files"""
+    while True:
+        try:
+            result = await asyncio.to_thread(get_datum_table().refresh)
+            logger.info(f"Datum table refresh: {result}")
+        except Exception as e:
+            logger.error(f"Error refreshing datum tables: {str(e)}")
+        await asyncio.sleep(DATUM_REFRESH_INTERVAL)
+
+@app.on_event("startup")
+async def start_datum_table_refresh():
+    """Fetch the datum tables at startup and refresh them on a schedule"""
+    asyncio.create_task(refresh_datum_tables_forever())
+
+@app.on_event("startup")
+async def build_station_index():
+    """Build the station metadata index before the first kernel needs it"""
+    try:
+        await asyncio.to_thread(get_station_index().build)
+    except Exception as e:
+        logger.warning(f"Station index not built at startup: {str(e)}")
+
+async def prepare_altimetry():
+    try:
+        store = get_altimetry_store()
+        await asyncio.to_thread(store.build)
+        stations = await asyncio.to_thread(store.build_station_cache)
+        logger.info(f"Altimetry cache ready, {stations} stations extracted")
+    except Exception as e:
+        logger.warning(f"Altimetry cache not built at startup: {str(e)}")
 
-def clear_session(session_id: str):
+@app.on_event("startup")
+async def start_altimetry_cache():
+    """Download and convert the altimetry file in the background so kernels find it ready"""
+    if not ALTIMETRY_AT_STARTUP:
+        logger.info("Altimetry cache not prepared at startup (ALTIMETRY_AT_STARTUP=0)")
+        return
+    asyncio.create_task(prepare_altimetry())
+
+@app.on_event("startup")
+async def start_session_registry():
+    """Advertise this worker so other workers can forward session requests to it"""
+    if session_registry is not None:
+        await session_registry.register_worker()
+        asyncio.create_task(session_registry.heartbeat_forever())
+        logger.info(f"Registered worker {session_registry.worker_id} at {SEA_WORKER_URL}")
+        if not SEA_WORKER_SECRET:
+            logger.warning("SEA_WORKER_SECRET is not set, forwarded requests share the forwarding worker's rate limits")
+
+@app.on_event("startup")
+async def start_interpreter_pool():
+    """Start pre-warming interpreters for new sessions"""
+    if sandbox_manager is not None:
+        sandbox_manager.start()
+    interpreter_pool.start()
+
+@app.on_event("shutdown")
+async def stop_interpreter_pool():
+    """Shut down idle pre-warmed interpreters"""
+    interpreter_pool.stop()
+    if sandbox_manager is not None:
+        sandbox_manager.stop()
+    chat_executor.shutdown(wait=False, cancel_futures=True)
+    shutdown_batch_pool()
+    if session_registry is not None:
+        await session_registry.unregister_worker()
+    await forward_client.aclose()
+    await aioredis_client.aclose()
+
+async def clear_session(session_id: str):
     """Clear all resources associated with a session"""
     try:
+        session_reaper.forget(session_id)
+        profiled_sessions.discard(session_id)
+        session_profiles.pop(session_id, None)
         # Get interpreter instance
-        interpreter = interpreter_instances.get(session_id)
+        interpreter = interpreter_instances.pop(session_id, None)
         if interpreter:
             # Call reset() to properly terminate all languages and clean up
-            interpreter.reset()
-            # Remove from instances dict
-            del interpreter_instances[session_id]
+            await asyncio.to_thread(interpreter.reset)
         
         # Clear Redis keys
-        redis_client.delete(f"{LAST_ACTIVE_PREFIX}{session_id}")
-        redis_client.delete(f"messages:{session_id}")
+        await aioredis_client.delete(f"{LAST_ACTIVE_PREFIX}{session_id}", *history_keys(session_id))
+        if session_registry is not None:
+            await session_registry.release(session_id)
 
         # Remove session directory and all its contents
         session_dir = STATIC_DIR / session_id
         if session_dir.exists():
-            # Remove all contents recursively
-            import shutil
-            shutil.rmtree(session_dir)
+            # Remove all contents recursively, off the event loop
+            await asyncio.to_thread(shutil.rmtree, session_dir, ignore_errors=True)
         logger.info(f"Cleared session {session_id}")
     except Exception as e:
         logger.error(f"Error clearing session {session_id}: {str(e)}")
         raise
 
-async def cleanup_idle_sessions():
-    """Remove interpreter instances and data for idle sessions"""
+async def expire_session(session_id: str):
+    """Hibernate a session that went idle, and clear it once its snapshot is too old"""
+    if session_id in busy_sessions:
+        # A turn that runs longer than IDLE_TIMEOUT is not idle; check again once it could be
+        session_reaper.schedule(session_id, time() + IDLE_TIMEOUT)
+        return
+    if session_id in interpreter_instances:
+        await evict_session(session_id)
+        session_reaper.schedule(session_id, time() + HIBERNATE_RETENTION)
+        return
+    age = hibernation.snapshot_age(hibernation.snapshot_path(STATIC_DIR, session_id))
+    if age is not None and age < HIBERNATE_RETENTION:
+        session_reaper.schedule(session_id, time() + HIBERNATE_RETENTION - age)
+        return
+    await clear_session(session_id)
 
-    try:
-        current_time = time()
-        logger.info(f"Current time: {current_time}")
-        logger.info(f"interpreter_instances: {list(interpreter_instances.keys())}")
-        # Check all active sessions
-        for session_id in list(interpreter_instances.keys()):
-            try:
-                last_active = redis_client.get(f"{LAST_ACTIVE_PREFIX}{session_id}")
-                if last_active:
-                    logger.info(f"Last active time for session {session_id}: {last_active}")
-                    
-                    last_active_time = float(last_active.decode('utf-8'))
-                    if current_time - last_active_time > IDLE_TIMEOUT:
-                        clear_session(session_id)
-            except Exception as e:
-                logger.error(f"Error cleaning up session {session_id}: {str(e)}")
-                continue
-                
-    except Exception as e:
-        logger.error(f"Error in cleanup_idle_sessions: {str(e)}")
+session_reaper = SessionReaper(IDLE_TIMEOUT, on_expire=expire_session)
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
     return JSONResponse(
         status_code=exc.status_code,
-        content={"detail": exc.detail}
+        content={"detail": exc.detail},
+        headers=getattr(exc, "headers", None)
     )
 
 @app.exception_handler(RequestValidationError)
@@ -310,8 +640,28 @@ async def chat_endpoint(request: Request, background_tasks: BackgroundTasks):
             raise HTTPException(status_code=400, detail="No messages provided")
         
         logger.info(f"Received messages for session {session_id} with station id {station_id}")
-        # Get or create interpreter instance
-        interpreter = get_or_create_interpreter(session_id)
+        turn = metrics.ChatTurn(session_id, profile=session_id in profiled_sessions)
+        started = perf_counter()
+        await make_room_for_session(session_id)
+        turn.span("make_room", perf_counter() - started)
+        # Get or create interpreter instance, a pool miss starts a kernel so keep it off the loop
+        loop = asyncio.get_running_loop()
+        started = perf_counter()
+        interpreter = await loop.run_in_executor(chat_executor, get_or_create_interpreter, session_id)
+        turn.span("get_interpreter", perf_counter() - started)
+        if not interpreter.messages:
+            started = perf_counter()
+            # Resume a session that was evicted (or started on another worker) from its history
+            history = await message_store.get_range(session_id)
+            if history:
+                await loop.run_in_executor(chat_executor, restore_messages, interpreter, history)
+            # ...and reload the variables its kernel had when it hibernated
+            snapshot = hibernation.snapshot_path(STATIC_DIR, session_id)
+            if hibernation.snapshot_age(snapshot) is not None:
+                await loop.run_in_executor(chat_executor, hibernation.resume, interpreter, snapshot)
+            if history:
+                turn.span("resume", perf_counter() - started)
+                metrics.SESSION_RESUME_SECONDS.observe(perf_counter() - started)
 
         interpreter.custom_instructions =  get_custom_instructions(
             today=today,
@@ -323,50 +673,283 @@ async def chat_endpoint(request: Request, background_tasks: BackgroundTasks):
         )
         
         # Update last active time
-        redis_client.set(f"{LAST_ACTIVE_PREFIX}{session_id}", str(time()))
+        session_reaper.touch(session_id)
+        await aioredis_client.set(f"{LAST_ACTIVE_PREFIX}{session_id}", str(time()))
 
-        def event_stream():
+        def start_turn():
+            # Runs on the worker thread, which is the one the profiler samples
+            turn.bind_thread()
+            return interpreter.chat(messages[-1], stream=True)
+
+        async def event_stream():
+            # Only the messages produced by this turn get persisted
+            history_start = len(interpreter.messages)
+            busy_sessions.add(session_id)
+            status = "ok"
             try:
-                for result in interpreter.chat(messages[-1], stream=True):
-                    data = json.dumps(result) if isinstance(result, dict) else result
-                    yield f"data: {data}\n\n"
+                async for result in iterate_in_executor(chat_executor, start_turn):
+                    turn.observe(result)
+                    started = perf_counter()
+                    data = f"data: {json.dumps(result) if isinstance(result, dict) else result}\n\n"
+                    turn.encoded(data, perf_counter() - started)
+                    yield data
             except Exception as e:
+                status = "error"
                 logger.error(f"Error in chat stream: {str(e)}")
-                error_message = {"error": e}
+                error_message = {"error": str(e)}
                 yield f"data: {json.dumps(error_message)}\n\n"
+            except BaseException:
+                status = "cancelled"  # Client went away mid-turn
+                raise
             finally:
-                redis_client.set(
-                f"messages:{session_id}", json.dumps(interpreter.messages)
-            )
+                busy_sessions.discard(session_id)
+                # The idle clock starts when the turn ends, not when it started
+                session_reaper.touch(session_id)
+                started = perf_counter()
+                await message_store.append(session_id, interpreter.messages[history_start:])
+                turn.history_write = perf_counter() - started
+                turn.finish(status)
+                if turn.profiler is not None:
+                    session_profiles[session_id] = {
+                        "finished_at": time(),
+                        "samples": sum(turn.profiler.samples.values()),
+                        "top": turn.profiler.top(),
+                        "collapsed": turn.profiler.collapsed(),
+                    }
 
         return StreamingResponse(event_stream(), media_type="text/event-stream")
     
+    except HTTPException:
+        raise
+    except (SandboxCapacityError, SessionCapacityError) as e:
+        logger.warning(f"Rejected session {session_id}: {str(e)}")
+        metrics.CHAT_TURNS.inc(status="rejected")
+        raise HTTPException(
+            status_code=503,
+            detail="The server is busy. Please try again shortly.",
+            headers={"Retry-After": str(CAPACITY_RETRY_AFTER)},
+        )
     except Exception as e:
         logger.error(f"Unexpected error in chat_endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+metrics.registry.register(metrics.Gauge(
+    "sea_live_sessions", "Sessions with a live interpreter", lambda: len(interpreter_instances)))
+metrics.registry.register(metrics.Gauge(
+    "sea_busy_sessions", "Sessions in the middle of a chat turn", lambda: len(busy_sessions)))
+metrics.registry.register(metrics.Gauge(
+    "sea_pool_ready", "Pre-warmed interpreters ready for new sessions",
+    lambda: interpreter_pool.get_stats()["ready"]))
+metrics.registry.register(metrics.Gauge(
+    "sea_threads", "Threads alive in this worker process", threading.active_count))
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape endpoint for this worker"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/profile")
+async def profile_endpoint(request: Request):
+    """Turn the sampling profiler on or off for the session's chat turns"""
+    session_id = request.headers.get("x-session-id")
+    if not session_id:
+        raise HTTPException(status_code=400, detail="x-session-id header is required")
+    body = await request.json()
+    if body.get("enabled", True):
+        profiled_sessions.add(session_id)
+    else:
+        profiled_sessions.discard(session_id)
+    return {"session_id": session_id, "enabled": session_id in profiled_sessions}
+
+@app.get("/profile")
+def get_profile_endpoint(request: Request):
+    """Profile of the session's most recent profiled chat turn"""
+    session_id = request.headers.get("x-session-id")
+    if not session_id:
+        raise HTTPException(status_code=400, detail="x-session-id header is required")
+    profile = session_profiles.get(session_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No profile recorded for this session")
+    return profile
+
+@app.get("/stats/pool")
+def pool_stats_endpoint():
+    """Pre-warmed interpreter pool hits, misses and refill times"""
+    return interpreter_pool.get_stats()
+
+
+@app.get("/stats/sessions")
+def session_stats_endpoint():
+    """Live and busy sessions, memory pressure, evictions and rejections"""
+    return session_capacity.get_stats(len(interpreter_instances), len(busy_sessions))
+
+
+@app.get("/stats/reaper")
+def reaper_stats_endpoint():
+    """Idle sessions reclaimed and how long after their deadline it happened"""
+    return session_reaper.get_stats()
+
+
+@app.get("/stats/erddap")
+def erddap_stats_endpoint():
+    """Hits, misses and size of the shared ERDDAP cache used by the kernels"""
+    return get_erddap_cache().get_stats()
+
+
+@app.get("/stats/climate_index")
+def climate_index_stats_endpoint():
+    """Whether each climate index is cached and how old it is"""
+    return get_climate_index_cache().get_stats()
+
+
+@app.get("/stats/metadata")
+def metadata_stats_endpoint():
+    """Outcome of this worker's last metadata sync and the current fd_metadata version"""
+    return get_metadata_sync().get_stats()
+
+
+@app.get("/stats/rapid")
+def rapid_stats_endpoint():
+    """Outcome of this worker's last RAPID poll and how many stations are buffered"""
+    return get_rapid_poller().get_stats()
+
+
+@app.get("/rapid/{station_id}")
+def rapid_endpoint(station_id: str, start: Optional[str] = None, end: Optional[str] = None):
+    """Recent hourly RAPID prediction, observation and residual (mm, Station Zero) of a station"""
+    if not station_id.isdigit() or len(station_id) > 3:
+        raise HTTPException(status_code=400, detail="station_id must be a uhslc_id such as 057")
+    try:
+        records, updated_at = get_rapid_poller().ring.read(station_id, start, end)
+    except (KeyError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail=f"No RAPID data for station {station_id}")
+
+    def column(values):
+        return [None if value != value else value for value in values.tolist()]  # NaN is not valid JSON
+
+    return {
+        "station_id": f"{int(station_id):03d}",
+        "updated_at": updated_at,
+        "time": records["time"].tolist(),
+        "prediction_mm": column(records["prediction"]),
+        "observation_mm": column(records["observation"]),
+        "residual_mm": column(records["residual"]),
+    }
+
+
+@app.get("/stats/datums")
+def datum_stats_endpoint():
+    """Outcome of this worker's last datum table refresh and the size of the lookup"""
+    return get_datum_table().get_stats()
+
+
+@app.get("/datums/exceedance")
+def datum_exceedance_endpoint(
+    stations: Optional[str] = None,
+    datums: str = ",".join(FLOOD_DATUMS),
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+):
+    """Hours and days above flood datums (e.g. MHHW, HAT) for comma separated stations (default: all)"""
+    station_ids = [station.strip() for station in stations.split(",") if station.strip()] if stations else None
+    if station_ids and not all(station.isdigit() for station in station_ids):
+        raise HTTPException(status_code=400, detail="stations must be comma separated uhslc_ids such as 057,058")
+    try:
+        frame = count_datum_exceedances(station_ids, datums.split(","), start, end)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e).strip("'"))
+    except FileNotFoundError:
+        raise HTTPException(status_code=503, detail="Datum tables are not available yet")
+    return json.loads(frame.to_json(orient="records"))  # Missing counts and thresholds become null
+
+
+@app.get("/datums/{station_id}")
+def datum_endpoint(station_id: str):
+    """Datum elevations of a station in mm above Station Zero"""
+    if not station_id.isdigit() or len(station_id) > 3:
+        raise HTTPException(status_code=400, detail="station_id must be a uhslc_id such as 057")
+    try:
+        return {"station_id": f"{int(station_id):03d}", "datums_mm": get_datum_table().station(station_id)}
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No datum table for station {station_id}")
+    except FileNotFoundError:
+        raise HTTPException(status_code=503, detail="Datum tables are not available yet")
+
+
+@app.post("/batch")
+@limiter.limit(BATCH_RATE_LIMIT)
+async def batch_endpoint(request: Request):
+    """Run trend, annual_max, exceedance or monthly_means over many stations of the station store"""
+    body = await request.json()
+    operation = body.get("operation")
+    if operation not in BATCH_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"operation must be one of {', '.join(BATCH_OPERATIONS)}")
+    if batch_slots.locked():
+        raise HTTPException(
+            status_code=503,
+            detail="Too many batch analyses are running. Please try again shortly.",
+            headers={"Retry-After": str(CAPACITY_RETRY_AFTER)},
+        )
+    try:
+        async with batch_slots:
+            frame = await asyncio.to_thread(
+                run_batch, operation, body.get("stations"), body.get("bbox"), body.get("start"), body.get("end"),
+                body.get("datum") or "MHHW",
+            )
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e).strip("'"))
+    except FileNotFoundError:
+        raise HTTPException(status_code=503, detail="Datum tables are not available yet")
+    table = json.loads(frame.to_json(orient="split", index=False))  # Columns once, then plain rows
+    return {"columns": table["columns"], "rows": table["data"], **frame.attrs}
+
+
+@app.get("/workers")
+def workers_endpoint():
+    """Resource usage of each sandbox worker and the host"""
+    if sandbox_manager is None:
+        raise HTTPException(status_code=404, detail="Sandbox workers are not enabled")
+    return sandbox_manager.report()
+
+
 @app.get("/history")
-def history_endpoint(request: Request):
+async def history_endpoint(
+    request: Request,
+    response: Response,
+    since: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+):
+    """Return the session's messages starting at index `since`, at most `limit` of them"""
     session_id = request.headers.get("x-session-id")
     if not session_id:
         return {"error": "x-session-id header is required"}
 
-    stored_messages = redis_client.get(f"messages:{session_id}")
-    if stored_messages:
-        return json.loads(stored_messages)
-    return []
+    # Lets the frontend work out which messages it still lacks
+    response.headers["x-history-length"] = str(await message_store.length(session_id))
+    return await message_store.get_range(session_id, since=since, limit=limit)
+
+
+@app.get("/history/usage")
+async def history_usage_endpoint(request: Request):
+    """Storage used by the session's chat history"""
+    session_id = request.headers.get("x-session-id")
+    if not session_id:
+        raise HTTPException(status_code=400, detail="x-session-id header is required")
+    return await message_store.usage(session_id)
 
 
 @app.post("/clear")
-def clear_endpoint(request: Request):
+async def clear_endpoint(request: Request):
     try:
         session_id = request.headers.get("x-session-id")
         if not session_id:
             raise HTTPException(status_code=400, detail="x-session-id header is required")
 
         # redis_client.delete(f"messages:{session_id}")
-        clear_session(session_id)
+        await clear_session(session_id)
         return {"status": "Chat history cleared"}
     except redis.RedisError as e:
         logger.error(f"Redis error in clear_endpoint: {str(e)}")
@@ -0,0 +1,149 @@
+"""
+Micro-benchmark of the climate index parsers in utils/climate_index.py
+against the line-by-line pandas parsers they replaced.
+
+Builds synthetic source files in each upstream format (PSL year-per-row
+tables, the ERSST PDO table, the Wisconsin PMM/AMM files and the JPL IOD
+JSON), checks that both implementations agree, and reports the median time
+of each. `--years` scales the inputs beyond the real files' ~75-170 years,
+up to 340 (the legacy parsers use pandas' nanosecond timestamps, which
+start in 1678).
+
+Usage:
+    python bench/bench_climate_parsers.py
+    python bench/bench_climate_parsers.py --years 340 --repeat 20
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from io import StringIO
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.climate_index import MISSING_VALUES, parse  # noqa: E402
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+def legacy_fractional_year_to_datetime(year):
+    year_int = int(year)
+    fraction = year - year_int
+    start_of_year = datetime(year_int, 1, 1)
+    days_in_year = (datetime(year_int + 1, 1, 1) - start_of_year).days
+    return start_of_year + timedelta(days=fraction * days_in_year)
+
+
+def legacy_parse(climate_index_name, raw_data):
+    """The parsers as they were before vectorization"""
+    if climate_index_name in ["ONI", "PNA", "TNA", "AO", "NAO"]:
+        missing = MISSING_VALUES[climate_index_name]
+        lines = raw_data.splitlines()
+        data = []
+        for line in lines[1:]:
+            if line.strip() and line.split()[0].isdigit():
+                year_data = [float(x) if x != missing else np.nan for x in line.split()]
+                if year_data[0] == missing:
+                    break
+                data.append(year_data)
+        df = pd.DataFrame(data, columns=["Year"] + [f"Month_{i}" for i in range(1, 13)])
+        df = df.melt(id_vars=["Year"], var_name="Month", value_name="value")
+        df["Month"] = df["Month"].str.extract(r"(\d+)").astype(int)
+        df["time"] = pd.to_datetime(df[["Year", "Month"]].assign(Day=15))
+        df["value"] = df["value"].replace(missing, np.nan)
+        df.sort_values(by="time", inplace=True)
+        return df[["time", "value"]]
+    if climate_index_name == "PDO":
+        data = pd.read_csv(StringIO(raw_data), sep=r"\s+", skiprows=1)
+        data = data.melt(id_vars=["Year"], var_name="Month", value_name="value")
+        data["Month"] = data["Month"].map({month: index for index, month in enumerate(MONTHS, start=1)})
+        data = data.dropna(subset=["Month"])
+        data["Month"] = data["Month"].astype(int)
+        data["time"] = pd.to_datetime(data[["Year", "Month"]].assign(Day=15))
+        data["value"] = data["value"].replace(MISSING_VALUES["PDO"], np.nan)
+        data.sort_values(by="time", inplace=True)
+        return data[["time", "value"]]
+    if climate_index_name == "IOD":
+        items = json.loads(raw_data)['items']
+        df = pd.DataFrame({
+            "time": [legacy_fractional_year_to_datetime(float(item['x'])) for item in items],
+            "value": [float(item['y']) for item in items],
+        })
+        monthly_means = df.set_index('time').resample('ME').mean()
+        monthly_means.index = monthly_means.index + pd.Timedelta(days=15)
+        return monthly_means.reset_index()
+    columns = ["Year", "Month", "SST", "Wind"]
+    data = pd.read_csv(StringIO(raw_data), sep=r"\s+", names=columns, skiprows=1)
+    data["time"] = pd.to_datetime(data[["Year", "Month"]].assign(Day=15))
+    data = data.rename(columns={"SST" if "-SST" in climate_index_name else "Wind": "value"})
+    data.sort_values(by="time", inplace=True)
+    return data[["time", "value"]]
+
+
+def sources(years, seed=0):
+    """Synthetic raw files in each upstream format, keyed by index name"""
+    rng = np.random.default_rng(seed)
+    first = 2025 - years
+    values = np.round(rng.normal(0, 1, (years, 12)), 2)
+    values[-1, 6:] = -99.90
+    psl = f"{first:5d}{2024:5d}\n" + "".join(
+        f"{first + i:5d}" + "".join(f"{v:9.2f}" for v in row) + "\n" for i, row in enumerate(values)
+    ) + "  -99.90\n  ONI from CPC\n  Provided by NOAA/PSL\n"
+
+    pdo_values = np.where(values == -99.90, 99.99, values)
+    pdo = "ERSST PDO Index:\n Year   " + "    ".join(MONTHS) + "\n" + "".join(
+        f"{first + i:5d}" + "".join(f"{v:7.2f}" for v in row) + "\n" for i, row in enumerate(pdo_values)
+    )
+
+    mmodes = "Year Mo SST Wind\n" + "".join(
+        f"{first + i // 12} {i % 12 + 1} {rng.normal():.2f} {rng.normal():.2f}\n" for i in range(years * 12)
+    )
+
+    weeks = np.arange(first, 2025, 7 / 365.25)
+    iod = json.dumps({"items": [{"x": float(x), "y": round(float(y), 3)} for x, y in zip(weeks, rng.normal(0, 0.5, len(weeks)))]})
+    return {"ONI": psl, "PDO": pdo, "PMM-SST": mmodes, "IOD": iod}
+
+
+def check(name, legacy, times, values):
+    legacy_times = pd.to_datetime(legacy["time"]).to_numpy("datetime64[s]")
+    legacy_values = legacy["value"].to_numpy(np.float32)
+    if name == "IOD":
+        # The old resample labelled each month's mean with the 15th of the following month
+        legacy_times = (legacy_times.astype("datetime64[M]") - 1).astype("datetime64[D]") + 14
+    assert np.array_equal(legacy_times.astype("datetime64[s]"), times), f"{name}: times differ"
+    assert np.allclose(legacy_values, values, equal_nan=True, atol=1e-5), f"{name}: values differ"
+
+
+def median_seconds(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=int, default=75, help="Years of data in each synthetic file")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    if not 1 <= args.years <= 340:
+        parser.error("--years must be between 1 and 340")
+
+    print(f"{'index':<8} {'legacy ms':>10} {'vectorized ms':>14} {'speedup':>8}")
+    for name, raw in sources(args.years).items():
+        times, values = parse(name, raw)
+        check(name, legacy_parse(name, raw), times, values)
+        legacy = median_seconds(lambda: legacy_parse(name, raw), args.repeat)
+        vectorized = median_seconds(lambda: parse(name, raw), args.repeat)
+        print(f"{name:<8} {legacy * 1e3:>10.3f} {vectorized * 1e3:>14.3f} {legacy / vectorized:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
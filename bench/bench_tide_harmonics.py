@@ -0,0 +1,77 @@
+"""
+Micro-benchmark of the harmonic tide predictor in utils/tide_harmonics.py.
+
+Builds a synthetic constituent table (68 constituents with slowly varying
+monthly coefficients, like utide's nodal corrections), checks predictions
+against a direct sum of every constituent's cosine, and reports points per
+second for an evenly spaced series and for irregular times. It needs
+neither utide nor any station data.
+
+Usage:
+    python bench/bench_tide_harmonics.py
+    python bench/bench_tide_harmonics.py --points 5000000 --repeat 5
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.tide_harmonics import FIRST_MONTH, _months, evaluate  # noqa: E402
+
+
+def synthetic_table(constituents=68, seed=0):
+    rng = np.random.default_rng(seed)
+    months = np.arange(len(_months()))
+    omega = np.sort(rng.uniform(0.01, 1.2, constituents))  # rad/hour, long period to sixth-diurnal
+    amplitude = rng.exponential(80, constituents)  # mm
+    base = amplitude * np.exp(1j * rng.uniform(0, 2 * np.pi, constituents))
+    nodal = 1 + 0.04 * np.sin(2 * np.pi * months / (18.61 * 12))[:, None] * rng.uniform(-1, 1, constituents)
+    return {"omega": omega, "coefficients": base * nodal, "mean": np.float64(2000)}
+
+
+def direct(table, times, chunk=20000):
+    months = (times.astype("datetime64[s]").astype("datetime64[M]") - FIRST_MONTH).astype(np.int64)
+    out = np.empty(len(times))
+    for first in range(0, len(times), chunk):
+        part = slice(first, first + chunk)
+        phasors = np.exp(1j * np.outer(times[part] / 3600.0, table["omega"]))
+        out[part] = table["mean"] + (table["coefficients"][months[part]] * phasors).real.sum(axis=1)
+    return out
+
+
+def best_seconds(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=2_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    table = synthetic_table()
+    rng = np.random.default_rng(1)
+    start = np.datetime64("1950-01-01", "s").astype(np.int64)
+    cases = {
+        "6 min": start + np.arange(args.points, dtype=np.int64) * 360,
+        "irregular": np.sort(start + rng.integers(0, 150 * 365 * 86400, args.points)),
+    }
+    print(f"{'times':<10} {'points/s':>12} {'max error mm':>13}")
+    for name, times in cases.items():
+        sample = times[:: max(1, len(times) // 100_000)]
+        error = np.abs(evaluate(table, sample) - direct(table, sample)).max()
+        seconds = best_seconds(lambda: evaluate(table, times), args.repeat)
+        print(f"{name:<10} {args.points / seconds:>12,.0f} {error:>13.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Stub OpenAI-compatible chat completions server for benchmarks.
+
+Streams a deterministic reply for every request: a short preamble followed
+by a code block that reads from the stub UHSLC server, and, once the code's
+output has been sent back, a closing summary. Requests that offer tools get
+the code as an `execute` tool call (as Open Interpreter asks for with
+function calling); other requests get it as a fenced markdown block.
+
+Usage:
+    python bench/fake_llm.py --port 9301 --data-url http://127.0.0.1:9302
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI()
+config = {
+    "data_url": "http://127.0.0.1:9302",
+    "first_token_delay": 0.2,
+    "token_delay": 0.005,
+    "stations": 20,
+}
+
+PREAMBLE = "Let me load the recent observations for station {station} and summarize them."
+SUMMARY = (
+    "Station {station} recorded a mean sea level of the value printed above over the last month. "
+    "The residuals stay within the usual range for this season, and no flooding thresholds were crossed."
+)
+CODE = """import pandas as pd
+df = get_sea_level_data("{station}", "2024-01-01", "2024-01-31", frequency="hourly")
+rapid = pd.read_csv("{data_url}/stations/RAPID/{station}_mm_StationZero_GMT.csv")
+rapid["Residual"] = rapid["Observation"] - rapid["Prediction"]
+print(round(df["sea_level"].mean(), 1), round(rapid["Residual"].abs().max(), 1))
+"""
+
+
+def _tokens(text):
+    """Split text into small word-sized deltas, the way a model streams it"""
+    pieces, start = [], 0
+    for i, char in enumerate(text):
+        if char in " \n" and i > start:
+            pieces.append(text[start:i])
+            start = i
+    pieces.append(text[start:])
+    return [piece for piece in pieces if piece]
+
+
+def _station_for(messages):
+    """Pick a deterministic station id from the conversation's first user message"""
+    first = next((m.get("content") for m in messages if m.get("role") == "user"), "") or ""
+    if isinstance(first, list):
+        first = json.dumps(first)
+    return f"{int(hashlib.sha256(first.encode()).hexdigest(), 16) % config['stations'] + 1:03d}"
+
+
+def _chunk(completion_id, model, delta, finish_reason=None):
+    return "data: " + json.dumps({
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }) + "\n\n"
+
+
+async def _stream(body):
+    messages = body.get("messages", [])
+    model = body.get("model", "sea-bench")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    station = _station_for(messages)
+    ran_code = messages and messages[-1].get("role") in ("tool", "function")
+    use_tools = bool(body.get("tools") or body.get("functions"))
+
+    await asyncio.sleep(config["first_token_delay"])
+    yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+
+    if ran_code:
+        for token in _tokens(SUMMARY.format(station=station)):
+            yield _chunk(completion_id, model, {"content": token})
+            await asyncio.sleep(config["token_delay"])
+        yield _chunk(completion_id, model, {}, "stop")
+        yield "data: [DONE]\n\n"
+        return
+
+    for token in _tokens(PREAMBLE.format(station=station)):
+        yield _chunk(completion_id, model, {"content": token})
+        await asyncio.sleep(config["token_delay"])
+
+    code = CODE.format(station=station, data_url=config["data_url"])
+    if use_tools:
+        call_id = f"call_{uuid.uuid4().hex[:24]}"
+        yield _chunk(completion_id, model, {"tool_calls": [{
+            "index": 0, "id": call_id, "type": "function",
+            "function": {"name": "execute", "arguments": ""},
+        }]})
+        arguments = json.dumps({"language": "python", "code": code})
+        for start in range(0, len(arguments), 8):
+            yield _chunk(completion_id, model, {"tool_calls": [{
+                "index": 0, "function": {"arguments": arguments[start:start + 8]},
+            }]})
+            await asyncio.sleep(config["token_delay"])
+        yield _chunk(completion_id, model, {}, "tool_calls")
+    else:
+        for token in _tokens(f"\n\n```python\n{code}```\n"):
+            yield _chunk(completion_id, model, {"content": token})
+            await asyncio.sleep(config["token_delay"])
+        yield _chunk(completion_id, model, {}, "stop")
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if not body.get("stream"):
+        # Collapse the stream into one message for non-streaming callers
+        content = "".join([
+            json.loads(line[6:])["choices"][0]["delta"].get("content") or ""
+            async for line in _stream(body) if line.startswith("data: {")
+        ])
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "sea-bench"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+    return StreamingResponse(_stream(body), media_type="text/event-stream")
+
+
+@app.get("/v1/models")
+def models():
+    return {"object": "list", "data": [{"id": "sea-bench", "object": "model", "owned_by": "bench"}]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9301)
+    parser.add_argument("--data-url", default=config["data_url"])
+    parser.add_argument("--first-token-delay", type=float, default=config["first_token_delay"])
+    parser.add_argument("--token-delay", type=float, default=config["token_delay"])
+    parser.add_argument("--stations", type=int, default=config["stations"], help="Stations the data server has")
+    args = parser.parse_args()
+    config.update(
+        data_url=args.data_url,
+        first_token_delay=args.first_token_delay,
+        token_delay=args.token_delay,
+        stations=args.stations,
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
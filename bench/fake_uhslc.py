@@ -0,0 +1,285 @@
+"""
+Stub UHSLC data server for benchmarks.
+
+Serves synthetic but realistically shaped versions of the files the app and
+the kernels read: ERDDAP Fast Delivery csvp queries, FD station CSVs,
+hourly and high/low tide predictions, datum tables, RAPID files, the
+station metadata (metaapi/select2 and meta.geojson) and the climate index
+sources, at the paths they have upstream. Values
+are generated from a few tidal constituents plus seeded noise, so every run
+serves identical bytes. Static files carry an ETag and honour If-None-Match
+and `Range: bytes=N-`, like the real server.
+
+Usage:
+    python bench/fake_uhslc.py --port 9302 --stations 20
+"""
+import argparse
+import hashlib
+import json
+import sys
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+import numpy as np
+import pandas as pd
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import HTMLResponse, PlainTextResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.bench_climate_parsers import sources as climate_sources  # noqa: E402
+
+app = FastAPI()
+config = {"stations": 20}
+
+FD_START = "2015-01-01"
+FD_END = "2024-12-31 23:00"
+CONSTITUENTS = ((12.4206, 600.0), (12.0, 180.0), (23.9345, 250.0), (25.8193, 170.0))  # period h, amplitude mm
+DATUMS = (
+    ("MHHW", 2350), ("MHW", 2250), ("MTL", 1800), ("MSL", 1790), ("DTL", 1780),
+    ("MLW", 1350), ("MLLW", 1210), ("LAT", 900), ("HAT", 2750), ("STND", 0),
+)
+NOT_FOUND = "Error {\n    code=404;\n    message=\"Not Found: Your query produced no matching results.\";\n}\n"
+
+
+def _station_number(station_id):
+    number = int(station_id)
+    if not 1 <= number <= config["stations"]:
+        raise HTTPException(status_code=404, detail="Unknown station")
+    return number
+
+
+def _epoch_hours(start, end):
+    return np.arange(
+        np.datetime64(pd.Timestamp(start).to_datetime64(), "h"),
+        np.datetime64(pd.Timestamp(end).to_datetime64(), "h") + 1,
+    )
+
+
+def tide(number, times):
+    """Tide prediction (mm above Station Zero) at datetime64 times"""
+    t = times.astype("datetime64[s]").astype(np.int64) / 3600.0
+    phase = number * 0.7
+    level = np.full(t.shape, 1800.0)
+    for period, amplitude in CONSTITUENTS:
+        level += amplitude * np.cos(2 * np.pi * t / period + phase)
+    return level
+
+
+def observed(number, hours):
+    """Observed sea level: tide plus a slow trend and seeded noise, with a few gaps"""
+    rng = np.random.default_rng(number)
+    t = hours.astype("datetime64[h]").astype(np.int64).astype(np.float64)
+    level = tide(number, hours) + 3.0 * (t - t[0]) / 8766 + rng.normal(0, 40, t.shape)
+    level = np.round(level).astype(np.int64)
+    level[rng.random(t.shape) < 0.01] = -32767
+    return level
+
+
+def _serve(request, body, media_type="text/csv"):
+    """Static file semantics: ETag, conditional GET and open-ended byte ranges"""
+    etag = '"' + hashlib.md5(body).hexdigest() + '"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+    range_header = request.headers.get("range", "")
+    if range_header.startswith("bytes=") and range_header.endswith("-"):
+        offset = int(range_header[6:-1])
+        if offset >= len(body):
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{len(body)}"})
+        headers["Content-Range"] = f"bytes {offset}-{len(body) - 1}/{len(body)}"
+        return Response(body[offset:], status_code=206, media_type=media_type, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
+
+
+@lru_cache(maxsize=64)
+def fd_csv(number, frequency):
+    hours = _epoch_hours(FD_START, FD_END)
+    levels = observed(number, hours)
+    frame = pd.DataFrame({"time": pd.to_datetime(hours), "sea_level": levels})
+    if frequency == "daily":
+        frame = frame[frame["sea_level"] != -32767].set_index("time").resample("D").mean().round()
+        frame = frame.fillna(-32767).astype(np.int64).reset_index()
+    columns = [frame["time"].dt.year, frame["time"].dt.month, frame["time"].dt.day]
+    if frequency == "hourly":
+        columns.append(frame["time"].dt.hour)
+    columns.append(frame["sea_level"])
+    return pd.concat(columns, axis=1).to_csv(header=False, index=False).encode()
+
+
+@lru_cache(maxsize=64)
+def tide_hourly_csv(number):
+    hours = _epoch_hours("1983-01-01", "2030-12-31 23:00")
+    times = pd.to_datetime(hours).strftime("%d-%b-%Y %H")
+    frame = pd.DataFrame({"Time_GMT": times, "TidePrediction_mm": np.round(tide(number, hours)).astype(np.int64)})
+    return frame.to_csv(index=False).encode()
+
+
+@lru_cache(maxsize=64)
+def tide_high_low_csv(number):
+    minutes = np.arange(
+        np.datetime64("2023-01-01T00:00", "m"), np.datetime64("2030-01-01T00:00", "m"), 6
+    )
+    level = tide(number, minutes)
+    rising = np.diff(level) > 0
+    turns = np.flatnonzero(rising[:-1] != rising[1:]) + 1
+    frame = pd.DataFrame({
+        "Date_Time_GMT": pd.to_datetime(minutes[turns]).strftime("%d-%b-%Y %H:%M"),
+        "Tide_Prediction_mm": np.round(level[turns]).astype(np.int64),
+        "Tide_Type": np.where(rising[turns - 1], "High Tide", "Low Tide"),
+    })
+    return frame.to_csv(index=False).encode()
+
+
+@lru_cache(maxsize=64)
+def datum_csv(number):
+    rows = [
+        ("Status", "Accepted", "Datum status"),
+        ("Epoch", "01-Jan-1983 to 31-Dec-2001", "Tidal datum analysis period"),
+    ]
+    offset = number * 7
+    for name, value in DATUMS:
+        rows.append((name, str(value + offset if name != "STND" else 0), f"{name} (mm)"))
+    rows.append(("Max", str(3100 + offset), "Highest observed water level (mm)"))
+    rows.append(("Max Time", "12-Jan-2016 03", "Time of highest observed water level (GMT)"))
+    return pd.DataFrame(rows, columns=["Name", "Value", "Description"]).to_csv(index=False).encode()
+
+
+def rapid_csv(number, days=30):
+    now = np.datetime64(datetime.now(timezone.utc).replace(tzinfo=None), "h")
+    hours = np.arange(now - days * 24, now + 1)
+    frame = pd.DataFrame({
+        "Time": pd.to_datetime(hours).strftime("%Y-%m-%d %H:%M:%S"),
+        "Prediction": np.round(tide(number, hours)).astype(np.int64),
+        "Observation": observed(number, hours),
+    })
+    return frame.to_csv(index=False).encode()
+
+
+@app.get("/erddap/tabledap/{dataset}.csvp")
+def erddap(dataset: str, request: Request):
+    if dataset not in ("global_hourly_fast", "global_daily_fast"):
+        raise HTTPException(status_code=404, detail="Unknown dataset")
+    query = dict(parse_qsl(request.url.query, keep_blank_values=True))
+    number = int(query.get("uhslc_id", "0"))
+    if not 1 <= number <= config["stations"]:
+        return PlainTextResponse(NOT_FOUND, status_code=404)
+    hours = _epoch_hours(FD_START, FD_END)
+    # time%3E=X and time%3C=X parse as keys "time>" and "time<" (ERDDAP's >= and <=)
+    start = np.datetime64(query.get("time>", FD_START).rstrip("Z"), "h")
+    end = np.datetime64(query.get("time<", FD_END).rstrip("Z"), "h")
+    keep = (hours >= start) & (hours <= end)
+    levels = observed(number, hours)[keep].astype(np.float64)
+    hours = hours[keep]
+    if dataset == "global_daily_fast":
+        keep = hours.astype(np.int64) % 24 == 12
+        hours, levels = hours[keep], levels[keep]
+    if len(hours) == 0:
+        return PlainTextResponse(NOT_FOUND, status_code=404)
+    levels[levels == -32767] = np.nan
+    frame = pd.DataFrame({
+        "sea_level (millimeters)": levels,
+        "time (UTC)": pd.to_datetime(hours).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    })
+    return PlainTextResponse(frame.to_csv(index=False, na_rep="NaN"), media_type="text/csv")
+
+
+@app.get("/data/csv/fast/{frequency}/", response_class=HTMLResponse)
+def fd_listing(frequency: str):
+    prefix = "h" if frequency == "hourly" else "d"
+    links = "".join(f'<a href="{prefix}{n:03d}.csv">{prefix}{n:03d}.csv</a>\n' for n in range(1, config["stations"] + 1))
+    return f"<html><body>{links}</body></html>"
+
+
+@app.get("/data/csv/fast/{frequency}/{name}.csv")
+def fd_file(frequency: str, name: str, request: Request):
+    if frequency not in ("hourly", "daily"):
+        raise HTTPException(status_code=404, detail="Unknown frequency")
+    return _serve(request, fd_csv(_station_number(name[1:]), frequency))
+
+
+@app.get("/stations/TIDES_DATUMS/fd/TidePrediction_GMT_StationZero/{name}")
+def tide_hourly(name: str, request: Request):
+    return _serve(request, tide_hourly_csv(_station_number(name[:3])))
+
+
+@app.get("/stations/TIDES_DATUMS/fd/LST/fd{station_id}/{name}")
+def tide_station_file(station_id: str, name: str, request: Request):
+    number = _station_number(station_id)
+    if name.startswith("datumTable_"):
+        return _serve(request, datum_csv(number))
+    if "TidePrediction_HighLow" in name:
+        return _serve(request, tide_high_low_csv(number))
+    raise HTTPException(status_code=404, detail="Unknown file")
+
+
+def meta_geojson():
+    # A couple of stations beyond the FD set, which the metadata sync filters out
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [-180 + 17.0 * n % 360, -60 + 7.0 * n % 120]},
+            "properties": {
+                "uhslc_id": n, "name": f"Station {n:03d}", "country": "Bench",
+                "fd_span": {"oldest": FD_START[:10], "latest": FD_END[:10]},
+            },
+        }
+        for n in range(1, config["stations"] + 3)
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+
+@app.get("/metaapi/select2")
+def select2(request: Request):
+    results = [{"id": f"{n:03d}", "text": f"Station {n:03d}"} for n in range(1, config["stations"] + 1)]
+    return _serve(request, json.dumps({"results": results}).encode(), media_type="application/json")
+
+
+@app.get("/data/meta.geojson")
+def meta(request: Request):
+    return _serve(request, json.dumps(meta_geojson()).encode(), media_type="application/geo+json")
+
+
+@app.get("/stations/RAPID/{name}")
+def rapid(name: str, request: Request):
+    return _serve(request, rapid_csv(_station_number(name[:3])))
+
+
+@lru_cache(maxsize=1)
+def climate_files():
+    """Synthetic climate index sources, keyed by their upstream path"""
+    files = climate_sources(years=75)
+    paths = {
+        f"data/correlation/{name.lower()}.data": files["ONI"] for name in ("ONI", "PNA", "TNA", "AO", "NAO")
+    }
+    paths["pub/data/cmb/ersst/v5/index/ersst.v5.pdo.dat"] = files["PDO"]
+    paths["dvimont/MModes/RealTime/PMM.txt"] = paths["dvimont/MModes/RealTime/AMM.txt"] = files["PMM-SST"]
+    paths["api/v1/chartable_values/"] = files["IOD"]
+    return {path: text.encode() for path, text in paths.items()}
+
+
+@app.get("/data/correlation/{name}")
+@app.get("/pub/data/cmb/ersst/v5/index/{name}")
+@app.get("/dvimont/MModes/RealTime/{name}")
+@app.get("/api/v1/chartable_values/")
+def climate_index(request: Request):
+    body = climate_files().get(request.url.path.lstrip("/"))
+    if body is None:
+        raise HTTPException(status_code=404, detail="Unknown file")
+    return _serve(request, body, media_type="text/plain")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9302)
+    parser.add_argument("--stations", type=int, default=config["stations"])
+    args = parser.parse_args()
+    config["stations"] = args.stations
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
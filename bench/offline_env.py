@@ -0,0 +1,49 @@
+"""
+Environment that keeps the app's startup tasks off the network and out of data/.
+
+Every job the app starts on boot (metadata sync, RAPID polling, datum
+refresh, climate indices, altimetry, ...) reads its source URL and cache
+directory from the environment. `offline_env` points all of them at
+bench/fake_uhslc.py and a scratch directory. Every script that starts the app (bench/run_bench.py,
+scripts/load_test_routing.py) builds its environment here, so a new startup
+task only has to be added in one place.
+"""
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def start_fake_uhslc(port, stations):
+    """Start bench/fake_uhslc.py on localhost and return its process and URL"""
+    proc = subprocess.Popen([
+        sys.executable, str(ROOT / "bench" / "fake_uhslc.py"), "--port", str(port), "--stations", str(stations),
+    ])
+    return proc, f"http://127.0.0.1:{port}"
+
+
+def offline_env(data_url, workdir):
+    """App environment variables for every data source and cache, served by fake_uhslc at data_url"""
+    workdir = Path(workdir)
+    return dict(
+        ERDDAP_BASE_URL=f"{data_url}/erddap/tabledap",
+        ERDDAP_CACHE_DIR=str(workdir / "erddap"),
+        STATION_STORE_DIR=str(workdir / "stations"),
+        METADATA_BASE_URL=data_url,
+        METADATA_SYNC_CACHE_DIR=str(workdir / "metadata_sync"),
+        FD_METADATA_PATH=str(workdir / "metadata" / "fd_metadata.geojson"),
+        STATION_INDEX_DIR=str(workdir / "station_index"),
+        # No multi-GB NetCDF download or grid build; a kernel that asks gets a 404 from the stub
+        ALTIMETRY_AT_STARTUP="0",
+        ALTIMETRY_URL=f"{data_url}/altimetry/cmems_altimetry_regrid.nc",
+        ALTIMETRY_PATH=str(workdir / "altimetry" / "cmems_altimetry_regrid.nc"),
+        ALTIMETRY_CACHE_DIR=str(workdir / "altimetry_cache"),
+        RAPID_BASE_URL=f"{data_url}/stations/RAPID",
+        RAPID_CACHE_DIR=str(workdir / "rapid"),
+        TIDES_BASE_URL=f"{data_url}/stations/TIDES_DATUMS/fd",
+        TIDE_STORE_DIR=str(workdir / "tides"),
+        DATUM_CACHE_DIR=str(workdir / "datums"),
+        CLIMATE_INDEX_BASE_URL=data_url,
+        CLIMATE_INDEX_CACHE_DIR=str(workdir / "climate_index"),
+    )
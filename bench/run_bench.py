@@ -0,0 +1,315 @@
+"""
+End-to-end benchmark for the SEA API that needs no network access.
+
+Starts the stub LLM (bench/fake_llm.py), the stub UHSLC data server
+(bench/fake_uhslc.py) and the app itself, all on localhost, with the app's
+LLM and ERDDAP endpoints pointed at the stubs. Then N concurrent simulated
+users each upload a file, run a few chat turns (every turn streams a code
+block that the kernel executes against the stub data server), fetch their
+history and clear their session.
+
+Reports p50/p95/p99 latency per operation, time to first token, throughput
+and the peak RSS of the app's process tree (workers and kernels included).
+Results can be saved as a named baseline under bench/baselines/ and later
+runs compared against it; a comparison exits non-zero when something got
+slower than the tolerance allows.
+
+Needs a reachable Redis (REDIS_HOST, default localhost) and the app's
+dependencies.
+
+Usage:
+    python bench/run_bench.py --sessions 8 --turns 2 --save main
+    python bench/run_bench.py --sessions 8 --turns 2 --compare main
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+import numpy as np
+import psutil
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench.offline_env import offline_env, start_fake_uhslc  # noqa: E402
+
+BASELINE_DIR = ROOT / "bench" / "baselines"
+PROMPTS = (
+    "What was the mean sea level at this station last month?",
+    "How large were the residuals between observations and predictions recently?",
+    "Show me the highest water level in the RAPID data.",
+)
+UPLOAD_BODY = b"time,value\n" + b"".join(f"2024-01-{d:02d},{1000 + d}\n".encode() for d in range(1, 29))
+
+
+def start_servers(args, workdir):
+    app_url = f"http://127.0.0.1:{args.base_port}"
+    llm_url = f"http://127.0.0.1:{args.base_port + 1}"
+    fake_uhslc, data_url = start_fake_uhslc(args.base_port + 2, args.stations)
+    procs = [
+        fake_uhslc,
+        subprocess.Popen([
+            sys.executable, str(ROOT / "bench" / "fake_llm.py"),
+            "--port", str(args.base_port + 1), "--data-url", data_url, "--stations", str(args.stations),
+            "--first-token-delay", str(args.first_token_delay), "--token-delay", str(args.token_delay),
+        ]),
+    ]
+    env = dict(
+        os.environ,
+        LLM_API_BASE=f"{llm_url}/v1",
+        LLM_MODEL="openai/sea-bench",
+        OPENAI_API_KEY="sk-bench",
+        **offline_env(data_url, workdir),
+        INTERPRETER_POOL_SIZE=str(args.pool_size),
+        CHAT_RATE_LIMIT="100000/minute",
+        UPLOAD_RATE_LIMIT="100000/minute",
+        BATCH_RATE_LIMIT="100000/minute",
+        REDIS_HOST=os.getenv("REDIS_HOST", "localhost"),
+    )
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(args.base_port), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    procs.append(app)
+    return procs, app, {"app": app_url, "llm": llm_url, "data": data_url}
+
+
+async def wait_ready(urls, timeout=120):
+    checks = [f"{urls['data']}/data/csv/fast/hourly/", f"{urls['llm']}/v1/models", f"{urls['app']}/stats/pool"]
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        for url in checks:
+            while True:
+                try:
+                    (await client.get(url)).raise_for_status()
+                    break
+                except httpx.HTTPError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"{url} did not come up")
+                    await asyncio.sleep(0.5)
+
+
+class RssMonitor:
+    """Samples the summed RSS of a process and all its descendants"""
+
+    def __init__(self, pid, interval=0.25):
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                processes = [self.process] + self.process.children(recursive=True)
+                rss = 0
+                for process in processes:
+                    try:
+                        rss += process.memory_info().rss
+                    except psutil.Error:
+                        pass
+                self.peak = max(self.peak, rss)
+            except psutil.Error:
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.ttft = []
+        self.stream_bytes = 0
+
+    def record(self, op, seconds, ok):
+        self.latencies.setdefault(op, []).append(seconds)
+        if not ok:
+            self.errors[op] = self.errors.get(op, 0) + 1
+
+
+async def chat_turn(client, url, session_id, history, prompt, recorder):
+    history.append({"role": "user", "type": "message", "content": prompt})
+    started = time.perf_counter()
+    first_token = None
+    ok = True
+    async with client.stream(
+        "POST", f"{url}/chat", headers={"x-session-id": session_id},
+        json={"messages": history, "station_id": None},
+    ) as response:
+        ok = response.status_code == 200
+        async for line in response.aiter_lines():
+            recorder.stream_bytes += len(line) + 1
+            if not line.startswith("data: "):
+                continue
+            try:
+                chunk = json.loads(line[6:])
+            except ValueError:
+                continue
+            if "error" in chunk:
+                ok = False
+            if first_token is None and chunk.get("role") == "assistant" and chunk.get("content"):
+                first_token = time.perf_counter() - started
+    recorder.record("chat", time.perf_counter() - started, ok)
+    if first_token is not None:
+        recorder.ttft.append(first_token)
+
+
+async def user(client, url, turns, recorder):
+    session_id = f"bench-{uuid.uuid4()}"
+    headers = {"x-session-id": session_id}
+
+    started = time.perf_counter()
+    response = await client.post(f"{url}/upload", headers=headers, files={"file": ("bench.csv", UPLOAD_BODY, "text/csv")})
+    recorder.record("upload", time.perf_counter() - started, response.status_code == 200)
+
+    history = []
+    for turn in range(turns):
+        await chat_turn(client, url, session_id, history, PROMPTS[turn % len(PROMPTS)], recorder)
+
+    started = time.perf_counter()
+    response = await client.get(f"{url}/history", headers=headers)
+    recorder.record("history", time.perf_counter() - started, response.status_code == 200)
+
+    started = time.perf_counter()
+    response = await client.post(f"{url}/clear", headers=headers)
+    recorder.record("clear", time.perf_counter() - started, response.status_code == 200)
+
+
+async def run_load(url, sessions, turns):
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=sessions * 2, max_keepalive_connections=sessions * 2)
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(30.0, read=600.0)) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(user(client, url, turns, recorder) for _ in range(sessions)))
+        elapsed = time.perf_counter() - started
+    return recorder, elapsed
+
+
+def _percentiles(values):
+    if not values:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(values), "p50": round(p50, 4), "p95": round(p95, 4), "p99": round(p99, 4)}
+
+
+def summarize(args, recorder, elapsed, peak_rss):
+    operations = {}
+    for op, values in recorder.latencies.items():
+        operations[op] = dict(_percentiles(values), errors=recorder.errors.get(op, 0))
+    requests = sum(len(values) for values in recorder.latencies.values())
+    return {
+        "config": {
+            "sessions": args.sessions,
+            "turns": args.turns,
+            "pool_size": args.pool_size,
+            "first_token_delay": args.first_token_delay,
+            "token_delay": args.token_delay,
+        },
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "elapsed_seconds": round(elapsed, 3),
+        "operations": operations,
+        "ttft": _percentiles(recorder.ttft),
+        "requests_per_second": round(requests / elapsed, 3),
+        "turns_per_second": round(len(recorder.latencies.get("chat", [])) / elapsed, 3),
+        "stream_bytes": recorder.stream_bytes,
+        "peak_rss_mb": round(peak_rss / 1024 / 1024, 1),
+    }
+
+
+def print_report(results):
+    print(f"{'operation':>10} {'count':>6} {'errors':>6} {'p50 s':>9} {'p95 s':>9} {'p99 s':>9}")
+    rows = dict(results["operations"], ttft=dict(results["ttft"], errors=0))
+    for op, stats in rows.items():
+        if stats["count"]:
+            print(f"{op:>10} {stats['count']:>6} {stats['errors']:>6} "
+                  f"{stats['p50']:>9.3f} {stats['p95']:>9.3f} {stats['p99']:>9.3f}")
+    print(f"throughput: {results['requests_per_second']} req/s, {results['turns_per_second']} chat turns/s")
+    print(f"peak RSS: {results['peak_rss_mb']} MB, streamed {results['stream_bytes']} bytes")
+
+
+def compare(results, baseline, tolerance):
+    """Print current vs baseline and return the metrics that regressed beyond `tolerance`"""
+    checks = []  # (name, baseline, current, higher_is_better)
+    rows = dict(results["operations"], ttft=results["ttft"])
+    base_rows = dict(baseline["operations"], ttft=baseline["ttft"])
+    for op, stats in rows.items():
+        for quantile in ("p50", "p95", "p99"):
+            if quantile in stats and quantile in base_rows.get(op, {}):
+                checks.append((f"{op} {quantile}", base_rows[op][quantile], stats[quantile], False))
+    checks.append(("requests/s", baseline["requests_per_second"], results["requests_per_second"], True))
+    checks.append(("peak RSS MB", baseline["peak_rss_mb"], results["peak_rss_mb"], False))
+
+    regressions = []
+    print(f"\n{'metric':>16} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, before, after, higher_is_better in checks:
+        change = (after - before) / before if before else 0.0
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:>16} {before:>10.3f} {after:>10.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent simulated users")
+    parser.add_argument("--turns", type=int, default=2, help="Chat turns per user")
+    parser.add_argument("--stations", type=int, default=20, help="Stations served by the stub data server")
+    parser.add_argument("--pool-size", type=int, default=2, help="INTERPRETER_POOL_SIZE for the app")
+    parser.add_argument("--first-token-delay", type=float, default=0.2, help="Stub LLM delay before streaming")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="Stub LLM delay between tokens")
+    parser.add_argument("--base-port", type=int, default=9300)
+    parser.add_argument("--save", metavar="NAME", help="Save results as bench/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="Compare against bench/baselines/NAME.json")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative slowdown (default 10%%)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="sea-bench-") as workdir:
+        procs, app, urls = start_servers(args, workdir)
+        try:
+            asyncio.run(wait_ready(urls))
+            with RssMonitor(app.pid) as monitor:
+                recorder, elapsed = asyncio.run(run_load(urls["app"], args.sessions, args.turns))
+        finally:
+            for proc in procs:
+                proc.terminate()
+            for proc in procs:
+                proc.wait()
+
+    results = summarize(args, recorder, elapsed, monitor.peak)
+    print_report(results)
+
+    if args.save:
+        BASELINE_DIR.mkdir(parents=True, exist_ok=True)
+        path = BASELINE_DIR / f"{args.save}.json"
+        path.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Saved baseline to {path.relative_to(ROOT)}")
+
+    if args.compare:
+        baseline = json.loads((BASELINE_DIR / f"{args.compare}.json").read_text())
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed more than {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
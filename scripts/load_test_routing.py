@@ -0,0 +1,140 @@
+"""
+Load test for multi-worker session routing.
+
+Starts N uvicorn workers on consecutive ports (each with its own
+SEA_WORKER_URL), spreads requests for a fixed set of sessions round-robin
+across them the way a non-sticky load balancer would, and reports the
+throughput for each worker count. Requests that land on a worker that does
+not own the session are forwarded, so the numbers include routing overhead.
+
+Needs a reachable Redis (REDIS_HOST, default localhost) and the app's
+dependencies. No LLM calls are made: the test drives /history, which only
+reads from Redis. The workers' startup tasks fetch from the stub data
+server (bench/fake_uhslc.py) and cache into a scratch directory, never
+into data/.
+
+Usage:
+    python scripts/load_test_routing.py --workers 1 2 4 --sessions 200 --requests 5000
+"""
+import argparse
+import asyncio
+import os
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.offline_env import offline_env, start_fake_uhslc  # noqa: E402
+
+
+def start_workers(count, base_port, data_url, workdir):
+    procs = []
+    secret = secrets.token_hex(16)
+    for i in range(count):
+        port = base_port + i
+        env = dict(
+            os.environ,
+            **offline_env(data_url, workdir),
+            SEA_WORKER_URL=f"http://127.0.0.1:{port}",
+            SEA_WORKER_SECRET=secret,
+            INTERPRETER_POOL_SIZE="0",
+            REDIS_HOST=os.getenv("REDIS_HOST", "localhost"),
+        )
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+            cwd=ROOT, env=env,
+        ))
+    return procs
+
+
+async def wait_ready(urls, timeout=60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        for url in urls:
+            while True:
+                try:
+                    await client.get(f"{url}/stats/pool")
+                    break
+                except httpx.TransportError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"Worker at {url} did not start")
+                    await asyncio.sleep(0.5)
+
+
+async def run_load(urls, sessions, total_requests, concurrency):
+    session_ids = [f"loadtest-{uuid.uuid4()}" for _ in range(sessions)]
+    owners = Counter()
+    errors = 0
+    counter = iter(range(total_requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def user():
+            nonlocal errors
+            for i in counter:
+                url = urls[i % len(urls)]
+                session_id = session_ids[i % len(session_ids)]
+                try:
+                    response = await client.get(f"{url}/history", headers={"x-session-id": session_id})
+                    response.raise_for_status()
+                    owners[response.headers.get("x-sea-worker")] += 1
+                except httpx.HTTPError:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        # Leave nothing behind in Redis
+        for i, session_id in enumerate(session_ids):
+            await client.post(f"{urls[i % len(urls)]}/clear", headers={"x-session-id": session_id})
+
+    return total_requests / elapsed, owners, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--base-port", type=int, default=9100)
+    parser.add_argument("--data-port", type=int, default=9099, help="Port of the stub data server")
+    args = parser.parse_args()
+
+    baseline = None
+    print(f"{'workers':>8} {'req/s':>10} {'scaling':>8} {'errors':>7}  responses by owning worker")
+    fake_uhslc, data_url = start_fake_uhslc(args.data_port, stations=20)
+    try:
+        for count in args.workers:
+            with tempfile.TemporaryDirectory(prefix="sea-routing-") as workdir:
+                procs = start_workers(count, args.base_port, data_url, workdir)
+                urls = [f"http://127.0.0.1:{args.base_port + i}" for i in range(count)]
+                try:
+                    asyncio.run(wait_ready(urls))
+                    throughput, owners, errors = asyncio.run(
+                        run_load(urls, args.sessions, args.requests, args.concurrency)
+                    )
+                finally:
+                    for proc in procs:
+                        proc.terminate()
+                    for proc in procs:
+                        proc.wait()
+            baseline = baseline or throughput / count
+            efficiency = throughput / (baseline * count)
+            print(f"{count:>8} {throughput:>10.1f} {efficiency:>8.0%} {errors:>7}  {dict(owners)}")
+    finally:
+        fake_uhslc.terminate()
+        fake_uhslc.wait()
+
+
+if __name__ == "__main__":
+    main()
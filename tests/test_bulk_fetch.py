@@ -0,0 +1,118 @@
+import socket
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic
+
+import pytest
+import requests
+
+from utils.bulk_fetch import BulkFetcher, Manifest, RetryableError
+
+
+class Handler(BaseHTTPRequestHandler):
+    """/ok/{name} answers 200; /fail/{status}/{times}/{name} answers `status` the first `times` times"""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] += 1
+            hits = server.hits[self.path]
+            server.times.append(monotonic())
+        parts = self.path.strip("/").split("/")
+        status = 200
+        if parts[0] == "fail" and hits <= int(parts[2]):
+            status = int(parts[1])
+        body = f"{self.path} {hits}".encode()
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.hits, httpd.times, httpd.lock = Counter(), [], threading.Lock()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def fetcher(**kwargs):
+    kwargs = {"rate_per_host": 1000.0, "backoff": 0.0, "timeout": 5, **kwargs}
+    return BulkFetcher(**kwargs)
+
+
+def test_success(server):
+    response = fetcher().get(f"{server.url}/ok/a")
+    assert response.status_code == 200
+    assert response.content == b"/ok/a 1"
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_retries_rate_limited_and_server_errors(server, status):
+    response = fetcher(retries=3).get(f"{server.url}/fail/{status}/2/a")
+    assert response.status_code == 200
+    assert server.hits[f"/fail/{status}/2/a"] == 3
+
+
+def test_other_errors_are_returned_not_retried(server):
+    response = fetcher().get(f"{server.url}/fail/404/5/a")
+    assert response.status_code == 404
+    assert server.hits["/fail/404/5/a"] == 1
+
+
+def test_gives_up_after_max_attempts(server):
+    with pytest.raises(RetryableError):
+        fetcher(retries=2).get(f"{server.url}/fail/503/99/a")
+    assert server.hits["/fail/503/99/a"] == 3
+
+
+def test_retries_connection_errors():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]  # Nothing listens here once the socket is closed
+    attempts = []
+    bulk = fetcher(retries=2)
+    original = bulk._get
+    bulk._get = lambda url, **kwargs: attempts.append(url) or original(url, **kwargs)
+    with pytest.raises(requests.ConnectionError):
+        bulk.get(f"http://127.0.0.1:{port}/ok/a")
+    assert len(attempts) == 3
+
+
+def test_rate_limits_requests_to_a_host(server):
+    bulk = fetcher(rate_per_host=20.0, burst=1, max_workers=4)
+    started = monotonic()
+    summary = bulk.run(range(6), lambda key: {"status": bulk.get(f"{server.url}/ok/{key}").status_code})
+    assert summary["done"] == 6
+    # One token up front, then one every 1/20 s
+    assert monotonic() - started >= 5 / 20 * 0.9
+    gaps = [later - earlier for earlier, later in zip(server.times, server.times[1:])]
+    assert min(gaps) >= 1 / 20 * 0.5
+
+
+def test_manifest_resume_skips_finished_units(server, tmp_path):
+    path = tmp_path / "manifest.json"
+    paths = {"a": "/ok/a", "b": "/fail/404/1/b", "c": "/ok/c"}  # b fails on the first run only
+    bulk = fetcher()
+
+    def work(key):
+        response = bulk.get(server.url + paths[key])
+        return {"size": len(response.content)} if response.status_code == 200 else None
+
+    first = bulk.run(paths, work, manifest=Manifest(path))
+    assert (first["done"], first["failed"]) == (2, 1)
+    second = bulk.run(paths, work, manifest=Manifest(path))
+    assert (second["skipped"], second["done"], second["failed"]) == (2, 1, 0)
+    assert server.hits == Counter({"/ok/a": 1, "/ok/c": 1, "/fail/404/1/b": 2})
+    assert Manifest(path).get("b") == {"size": len(b"/fail/404/1/b 2")}
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from utils import session_capacity
+from utils.session_capacity import SessionCapacity, SessionCapacityError, memory_usage_fraction
+
+GIB = 1024 ** 3
+
+
+def fake_cgroup(tmp_path, monkeypatch, limit, current, inactive_file=None):
+    files = {"memory.max": str(limit), "memory.current": str(current)}
+    if inactive_file is not None:
+        files["memory.stat"] = f"anon {current - inactive_file}\nfile {inactive_file}\ninactive_file {inactive_file}\n"
+    for name, text in files.items():
+        (tmp_path / name).write_text(text + "\n")
+    monkeypatch.setattr(session_capacity, "CGROUP_MEMORY_MAX", tmp_path / "memory.max")
+    monkeypatch.setattr(session_capacity, "CGROUP_MEMORY_CURRENT", tmp_path / "memory.current")
+    monkeypatch.setattr(session_capacity, "CGROUP_MEMORY_STAT", tmp_path / "memory.stat")
+
+
+def test_large_file_cache_is_not_counted(tmp_path, monkeypatch):
+    # 1 GiB of sessions plus 6.5 GiB of page cache from memory-mapped stores, under an 8 GiB limit
+    fake_cgroup(tmp_path, monkeypatch, limit=8 * GIB, current=int(7.5 * GIB), inactive_file=int(6.5 * GIB))
+    assert memory_usage_fraction() == 0.125
+    assert not SessionCapacity(max_sessions=50, memory_high_watermark=0.85).over_memory()
+
+
+def test_working_set_over_the_watermark(tmp_path, monkeypatch):
+    fake_cgroup(tmp_path, monkeypatch, limit=8 * GIB, current=int(7.8 * GIB), inactive_file=int(0.5 * GIB))
+    assert SessionCapacity(max_sessions=50, memory_high_watermark=0.85).over_memory()
+
+
+def test_missing_memory_stat_counts_everything(tmp_path, monkeypatch):
+    fake_cgroup(tmp_path, monkeypatch, limit=4 * GIB, current=3 * GIB)
+    assert memory_usage_fraction() == 0.75
+
+
+def make_room(capacity, sessions, busy=()):
+    evicted = []
+
+    async def evict(session_id):
+        sessions.pop(session_id)
+        evicted.append(session_id)
+
+    asyncio.run(capacity.make_room(sessions, set(busy), lambda sid: sessions[sid], evict))
+    return evicted
+
+
+def test_memory_that_stays_high_stops_after_max_evictions(tmp_path, monkeypatch):
+    # The cgroup still reports the evicted sessions' memory, as it does right after an eviction
+    fake_cgroup(tmp_path, monkeypatch, limit=8 * GIB, current=int(7.8 * GIB), inactive_file=0)
+    sessions = {f"s{i}": i for i in range(10)}
+    capacity = SessionCapacity(max_sessions=50, memory_high_watermark=0.85, max_memory_evictions=2, settle_seconds=0)
+    assert make_room(capacity, sessions) == ["s0", "s1"]
+    assert len(sessions) == 8
+
+
+def test_memory_back_under_the_watermark_stops_evicting(tmp_path, monkeypatch):
+    fake_cgroup(tmp_path, monkeypatch, limit=8 * GIB, current=int(7.8 * GIB), inactive_file=0)
+    sessions = {f"s{i}": i for i in range(10)}
+
+    async def evict(session_id):
+        sessions.pop(session_id)
+        (tmp_path / "memory.current").write_text(f"{4 * GIB}\n")
+
+    capacity = SessionCapacity(max_sessions=50, memory_high_watermark=0.85, max_memory_evictions=5, settle_seconds=0)
+    asyncio.run(capacity.make_room(sessions, set(), lambda sid: sessions[sid], evict))
+    assert len(sessions) == 9
+
+
+def test_session_cap_evicts_as_many_as_needed(tmp_path, monkeypatch):
+    fake_cgroup(tmp_path, monkeypatch, limit=8 * GIB, current=GIB, inactive_file=0)
+    sessions = {f"s{i}": i for i in range(6)}
+    capacity = SessionCapacity(max_sessions=3, memory_high_watermark=0.85, max_memory_evictions=1, settle_seconds=0)
+    assert make_room(capacity, sessions, busy={"s0"}) == ["s1", "s2", "s3", "s4"]
+
+
+def test_all_sessions_busy_is_rejected(tmp_path, monkeypatch):
+    fake_cgroup(tmp_path, monkeypatch, limit=8 * GIB, current=int(7.8 * GIB), inactive_file=0)
+    sessions = {"s0": 0, "s1": 1}
+    capacity = SessionCapacity(max_sessions=50, memory_high_watermark=0.85, settle_seconds=0)
+    with pytest.raises(SessionCapacityError):
+        make_room(capacity, sessions, busy=set(sessions))
+    assert capacity.stats["rejected"] == 1
@@ -0,0 +1,41 @@
+from time import time
+
+from utils import session_registry
+from utils.session_registry import SessionRegistry
+
+
+class FakeRedis:
+    def register_script(self, script):
+        return None
+
+
+def registry(worker_id, secret="shared"):
+    return SessionRegistry(FakeRedis(), "http://127.0.0.1:8001", worker_id=worker_id, secret=secret)
+
+
+def test_signed_forward_is_trusted():
+    timestamp, signature = registry("web-1").sign_forward("203.0.113.7")
+    assert registry("web-2").verify_forward("web-1", "203.0.113.7", timestamp, signature)
+
+
+def test_worker_id_alone_is_not_trusted():
+    owner = registry("web-2")
+    assert not owner.verify_forward("web-1", "203.0.113.7", None, None)
+    assert not owner.verify_forward("web-1", "203.0.113.7", str(int(time())), "0" * 64)
+
+
+def test_changed_client_address_or_other_secret_is_rejected():
+    timestamp, signature = registry("web-1").sign_forward("203.0.113.7")
+    assert not registry("web-2").verify_forward("web-1", "198.51.100.1", timestamp, signature)
+    assert not registry("web-2", secret="other").verify_forward("web-1", "203.0.113.7", timestamp, signature)
+
+
+def test_old_signature_is_rejected(monkeypatch):
+    timestamp, signature = registry("web-1").sign_forward("203.0.113.7")
+    monkeypatch.setattr(session_registry, "time", lambda: int(timestamp) + session_registry.FORWARD_MAX_AGE + 1)
+    assert not registry("web-2").verify_forward("web-1", "203.0.113.7", timestamp, signature)
+
+
+def test_no_secret_signs_and_trusts_nothing():
+    assert registry("web-1", secret=None).sign_forward("203.0.113.7") is None
+    assert not registry("web-2", secret=None).verify_forward("web-1", "203.0.113.7", str(int(time())), "x")
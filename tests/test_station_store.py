@@ -0,0 +1,38 @@
+import numpy as np
+
+from utils.station_store import MISSING_VALUE, StationStore
+
+START = 1_700_000_000 // 3600 * 3600
+
+
+def hours(first, count):
+    return START + (first + np.arange(count, dtype=np.int64)) * 3600
+
+
+def test_append_replaces_the_tail(tmp_path):
+    store = StationStore(tmp_path, "hourly")
+    store.ingest("001", hours(0, 10), np.arange(10))
+    assert store.append("001", hours(8, 5), np.arange(100, 105)) == 13
+    first_time, values = store.read("001")
+    assert first_time == START
+    assert values.tolist() == list(range(8)) + list(range(100, 105))
+
+
+def test_append_after_a_gap_fills_it_with_missing_values(tmp_path):
+    store = StationStore(tmp_path, "hourly")
+    store.ingest("001", hours(0, 3), np.arange(3))
+    store.append("001", hours(5, 2), [7, 8])
+    assert store.read("001")[1].tolist() == [0, 1, 2, MISSING_VALUE, MISSING_VALUE, 7, 8]
+
+
+def test_shorter_append_leaves_mapped_readers_intact(tmp_path):
+    writer = StationStore(tmp_path, "hourly")
+    writer.ingest("001", hours(0, 4096), np.arange(4096))
+    reader = StationStore(tmp_path, "hourly")
+    _, before = reader.read("001")  # Memory-mapped, as in a kernel
+
+    writer.append("001", hours(10, 2), [-1, -2])
+    # The old mapping still covers the cut pages and their old contents
+    assert before[-1] == 4095
+    assert before[10:12].tolist() == [10, 11]
+    assert StationStore(tmp_path, "hourly").read("001")[1].tolist() == list(range(10)) + [-1, -2]
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from utils.tide_harmonics import FIRST_MONTH, _months, evaluate, solve_constituents
+
+# Cycles per hour of the five largest constituents, with synthetic amplitudes (mm)
+CONSTITUENTS = {"M2": (0.0805114007, 600.0), "S2": (0.0833333333, 180.0), "N2": (0.0789992487, 120.0),
+                "K1": (0.0417807462, 250.0), "O1": (0.0387306544, 170.0)}
+START = np.datetime64("2020-01-01", "s").astype(np.int64)
+
+
+def synthetic_table(constituents=20, seed=0):
+    """Constituent table with slowly varying monthly coefficients, like utide's nodal corrections"""
+    rng = np.random.default_rng(seed)
+    months = np.arange(len(_months()))
+    omega = np.sort(rng.uniform(0.01, 1.2, constituents))
+    base = rng.exponential(80, constituents) * np.exp(1j * rng.uniform(0, 2 * np.pi, constituents))
+    nodal = 1 + 0.04 * np.sin(2 * np.pi * months / (18.61 * 12))[:, None] * rng.uniform(-1, 1, constituents)
+    return {"omega": omega, "coefficients": base * nodal, "mean": np.float64(2000)}
+
+
+def direct(table, times):
+    """Sum of every constituent's cosine, one sample at a time in float64"""
+    months = (times.astype("datetime64[s]").astype("datetime64[M]") - FIRST_MONTH).astype(np.int64)
+    phasors = np.exp(1j * np.outer(times / 3600.0, table["omega"]))
+    return table["mean"] + (table["coefficients"][months] * phasors).real.sum(axis=1)
+
+
+@pytest.mark.parametrize("step", [360, 3600, 86400])
+def test_even_spacing_matches_direct_sum(step):
+    table = synthetic_table()
+    # Starts mid-month and crosses month boundaries, so blocks are cut at the month edges
+    times = np.datetime64("1999-12-20T03:00", "s").astype(np.int64) + np.arange(20000, dtype=np.int64) * step
+    times = times[times < np.datetime64("2100-12-01", "s").astype(np.int64)]
+    np.testing.assert_allclose(evaluate(table, times), direct(table, times), atol=1e-6)
+
+
+def test_irregular_times_match_direct_sum():
+    table = synthetic_table()
+    rng = np.random.default_rng(1)
+    times = np.datetime64("1900-01-01", "s").astype(np.int64) + rng.integers(0, 200 * 365 * 86400, 20000)
+    # Unsorted on purpose: results come back in the caller's order
+    np.testing.assert_allclose(evaluate(table, times), direct(table, times), atol=0.05)
+
+
+def test_times_outside_the_table_are_rejected():
+    with pytest.raises(ValueError):
+        evaluate(synthetic_table(), [np.datetime64("2101-01-01", "s").astype(np.int64)])
+
+
+def synthetic_hourly(times):
+    heights = np.full(len(times), 1800.0)
+    for k, (frequency, amplitude) in enumerate(CONSTITUENTS.values()):
+        heights += amplitude * np.cos(2 * np.pi * frequency * times / 3600.0 - 0.7 * k)
+    return heights
+
+
+def rms(errors):
+    return float(np.sqrt(np.mean(errors ** 2)))
+
+
+def test_solved_table_reproduces_the_fitted_series_and_utide():
+    utide = pytest.importorskip("utide")
+    times = START + np.arange(366 * 24, dtype=np.int64) * 3600
+    heights = synthetic_hourly(times)
+    heights[::50] = np.nan  # Gaps, like MISSING_VALUE hours
+    constit = list(CONSTITUENTS)
+    table = solve_constituents(times, heights, lat=21.3, constit=constit)
+
+    valid = np.isfinite(heights)
+    assert rms(evaluate(table, times)[valid] - heights[valid]) < 5
+
+    # Far from the fit window the table must still follow utide's own nodal-corrected reconstruction
+    coef = utide.solve(
+        times[valid].astype("datetime64[s]"), heights[valid], lat=21.3, method="ols", conf_int="none",
+        trend=False, constit=constit, verbose=False,
+    )
+    rng = np.random.default_rng(2)
+    checks = {
+        "1950 hourly": np.datetime64("1950-03-01", "s").astype(np.int64) + np.arange(2000, dtype=np.int64) * 3600,
+        "2090 6 min": np.datetime64("2090-01-01", "s").astype(np.int64) + np.arange(5000, dtype=np.int64) * 360,
+        "irregular": START + rng.integers(-30 * 365 * 86400, 30 * 365 * 86400, 5000),
+    }
+    for label, check in checks.items():
+        reference = utide.reconstruct(check.astype("datetime64[s]"), coef, verbose=False, min_SNR=0, min_PE=0)["h"]
+        assert rms(evaluate(table, check) - reference) < 1, label
@@ -0,0 +1,318 @@
+"""
+Shared access to the regridded CMEMS altimetry (cmems_altimetry_regrid.nc).
+
+The NetCDF file is downloaded once (under a file lock, so concurrent kernels
+don't each fetch it) and then converted once into plain .npy grids under
+data/cache/altimetry:
+
+    anomaly.npy       float32 (time, lat, lon), cm
+    climatology.npy   float32 (12, lat, lon), cm
+    valid.npy         bool (lat, lon), cells with any data
+    time.npy, lat.npy, lon.npy
+
+Kernels memory-map these, so a point time series or a bounding box only
+reads the pages it needs, and every session shares the same page cache
+instead of holding its own decoded copy of the dataset. Alongside the grids,
+the series of the nearest ocean cell to every FD station is extracted into
+station_anomaly.npy/station_climatology.npy (one row per station), so a
+station lookup is a single contiguous read.
+
+Longitudes follow the file's 0-360 convention; lookups accept -180-180 too.
+"""
+import fcntl
+import json
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from time import time
+
+import numpy as np
+import pandas as pd
+import requests
+
+from utils.station_index import get_default_index as get_station_index, haversine_km
+
+logger = logging.getLogger(__name__)
+
+ALTIMETRY_PATH = Path(os.getenv("ALTIMETRY_PATH", "data/altimetry/cmems_altimetry_regrid.nc"))
+ALTIMETRY_URL = os.getenv(
+    "ALTIMETRY_URL", "https://uhslc.soest.hawaii.edu/mwidlans/dev/SEA/SEAdata/cmems_altimetry_regrid.nc")
+CACHE_DIR = Path(os.getenv("ALTIMETRY_CACHE_DIR", "data/cache/altimetry"))
+ANOMALY_VARIABLE = "absolute_dynamic_topography_monthly_anomaly"
+CLIMATOLOGY_VARIABLE = "absolute_dynamic_topography_monthly_climatology"
+MAX_SEARCH_DEGREES = 3  # How far from a coastal point to look for an ocean cell
+CURRENT_FILE = "CURRENT"
+GRIDS = ("anomaly", "climatology", "time", "lat", "lon", "valid")
+STATION_TABLES = ("station_ids", "station_cells", "station_anomaly", "station_climatology")
+
+
+def _save(path, array):
+    tmp = path.with_name(f".{path.name}.tmp.npy")
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
+
+class AltimetryStore:
+    def __init__(self, source=ALTIMETRY_PATH, url=ALTIMETRY_URL, cache_dir=CACHE_DIR, check_interval=30):
+        self.source = Path(source)
+        self.url = url
+        self.dir = Path(cache_dir)
+        self.check_interval = check_interval
+        self._grids = None
+        self._stations = None
+        self._build = None
+        self._checked = 0
+        self._stations_checked = 0
+
+    @contextmanager
+    def _locked(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with open(self.dir / "build.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def download(self):
+        """Download the NetCDF file unless it is already there (or another process just fetched it)"""
+        with self._locked():
+            if self.source.exists():
+                return self.source
+            self.source.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.source.with_name(f".{self.source.name}.part")
+            started = time()
+            with requests.get(self.url, stream=True, timeout=60) as response:
+                response.raise_for_status()
+                with open(tmp, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=1 << 20):
+                        f.write(chunk)
+            os.replace(tmp, self.source)
+            logger.info(f"Downloaded {self.url} ({self.source.stat().st_size} bytes) in {time() - started:.1f}s")
+            return self.source
+
+    def _source_stamp(self):
+        stat = self.source.stat()
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def _current(self):
+        try:
+            name = (self.dir / CURRENT_FILE).read_text().strip()
+            return name, json.loads((self.dir / name / "meta.json").read_text())
+        except (OSError, ValueError):
+            return None, None
+
+    def build(self, force=False):
+        """Convert the NetCDF file into .npy grids in a new build directory and make it current"""
+        import xarray as xr
+
+        if not self.source.exists():
+            self.download()
+        with self._locked():
+            stamp = self._source_stamp()
+            name, meta = self._current()
+            if not force and meta is not None and meta["source"] == stamp:
+                return name
+            started = time()
+            name = f"build-{time():.6f}"
+            build_dir = self.dir / name
+            build_dir.mkdir()
+            with xr.open_dataset(self.source) as dataset:
+                anomaly = dataset[ANOMALY_VARIABLE].squeeze(drop=True).transpose("time_anom", "lat", "lon")
+                climatology = dataset[CLIMATOLOGY_VARIABLE].squeeze(drop=True).transpose("time_clim", "lat", "lon")
+                lat = dataset["lat"].values.astype(np.float64)
+                lon = dataset["lon"].values.astype(np.float64) % 360
+                lat_order, lon_order = np.argsort(lat), np.argsort(lon)
+                grids = {
+                    "anomaly": anomaly.values.astype(np.float32)[:, lat_order][:, :, lon_order],
+                    "climatology": climatology.values.astype(np.float32)[:, lat_order][:, :, lon_order],
+                    "time": pd.to_datetime(anomaly["time_anom"].values).to_numpy("datetime64[s]"),
+                    "lat": lat[lat_order],
+                    "lon": lon[lon_order],
+                }
+            grids["valid"] = np.isfinite(grids["anomaly"]).any(axis=0)  # Ocean cells
+            for grid, array in grids.items():
+                np.save(build_dir / f"{grid}.npy", np.ascontiguousarray(array))
+            (build_dir / "meta.json").write_text(json.dumps({
+                "source": stamp, "shape": list(grids["anomaly"].shape), "seconds": round(time() - started, 3),
+            }))
+            tmp = self.dir / f"{CURRENT_FILE}.tmp"
+            tmp.write_text(name)
+            os.replace(tmp, self.dir / CURRENT_FILE)
+            # Keep the previous build around for kernels that still have it mapped
+            for old in sorted(path for path in self.dir.glob("build-*") if path.is_dir())[:-2]:
+                shutil.rmtree(old, ignore_errors=True)
+            logger.info(f"Built altimetry cache {name} from {self.source}")
+            return name
+
+    def _load(self):
+        now = time()
+        if self._grids is not None and now - self._checked < self.check_interval:
+            return self._grids
+        self._checked = now
+        name, meta = self._current()
+        if meta is None or not self.source.exists() or meta["source"] != self._source_stamp():
+            name = self.build()
+        if name != self._build:
+            self._grids = {grid: np.load(self.dir / name / f"{grid}.npy", mmap_mode="r") for grid in GRIDS}
+            self._stations = None
+            self._build = name
+        return self._grids
+
+    def nearest_cell(self, lat, lon, max_degrees=MAX_SEARCH_DEGREES):
+        """(lat index, lon index, distance_km) of the closest grid cell with data, searching up to max_degrees away"""
+        grids = self._load()
+        lats, lons, valid = grids["lat"], grids["lon"], grids["valid"]
+        lon = lon % 360
+        lat_rows = np.flatnonzero(np.abs(lats - lat) <= max_degrees)
+        lon_gap = np.abs((lons - lon + 180) % 360 - 180)
+        lon_columns = np.flatnonzero(lon_gap <= max_degrees / max(np.cos(np.radians(lat)), 0.05))
+        window = valid[np.ix_(lat_rows, lon_columns)]
+        if not window.any():
+            raise ValueError(f"No altimetry within {max_degrees} degrees of ({lat}, {lon})")
+        rows, columns = np.nonzero(window)
+        distances = haversine_km(lat, lon, lats[lat_rows[rows]], lons[lon_columns[columns]])
+        best = int(np.argmin(distances))
+        return int(lat_rows[rows[best]]), int(lon_columns[columns[best]]), float(distances[best])
+
+    def build_station_cache(self):
+        """Extract the nearest ocean cell's series for every FD station into per-station tables"""
+        grids = self._load()
+        stations = get_station_index().stations
+        ids, cells = [], []
+        for station in stations:
+            try:
+                row, column, distance = self.nearest_cell(float(station["lat"]), float(station["lon"]))
+            except ValueError:
+                continue
+            ids.append(station["uhslc_id"])
+            cells.append((row, column, distance))
+        cells = np.array(cells, dtype=[("lat_index", "<i4"), ("lon_index", "<i4"), ("distance_km", "<f8")])
+        tables = {
+            "station_ids": np.array(ids, np.int32),
+            "station_cells": cells,
+            # Fancy indexing reads one column of pages per station; done once here instead of per query
+            "station_anomaly": np.ascontiguousarray(
+                grids["anomaly"][:, cells["lat_index"], cells["lon_index"]].T, np.float32),
+            "station_climatology": np.ascontiguousarray(
+                grids["climatology"][:, cells["lat_index"], cells["lon_index"]].T, np.float32),
+        }
+        with self._locked():
+            build_dir = self.dir / self._build
+            for table, array in tables.items():
+                _save(build_dir / f"{table}.npy", array)
+            (build_dir / "stations.json").write_text(json.dumps({"station_index": get_station_index().get_stats()["build"]}))
+        self._stations = None
+        return len(ids)
+
+    def _station_tables(self):
+        self._load()
+        build_dir = self.dir / self._build
+        now = time()
+        if self._stations is not None and now - self._stations_checked < self.check_interval:
+            return self._stations
+        self._stations_checked = now
+        try:
+            station_build = json.loads((build_dir / "stations.json").read_text())["station_index"]
+        except (OSError, ValueError, KeyError):
+            station_build = None
+        if station_build != get_station_index().get_stats()["build"]:
+            self.build_station_cache()  # Stations were added or moved since the last extraction
+        if self._stations is None:
+            self._stations = {table: np.load(build_dir / f"{table}.npy", mmap_mode="r") for table in STATION_TABLES}
+        return self._stations
+
+    def point(self, lat, lon):
+        """(times, anomaly cm, cell lat, cell lon, distance km) at the nearest ocean cell to a point"""
+        grids = self._load()
+        row, column, distance = self.nearest_cell(lat, lon)
+        return grids["time"], grids["anomaly"][:, row, column], grids["lat"][row], grids["lon"][column], distance
+
+    def station(self, station_id):
+        """(times, anomaly cm, climatology cm, cell row) for a station from the per-station cache"""
+        tables = self._station_tables()
+        ids = tables["station_ids"]
+        position = int(np.searchsorted(ids, int(station_id)))
+        if position == len(ids) or ids[position] != int(station_id):
+            raise KeyError(f"No altimetry near station {station_id}")
+        return (self._grids["time"], tables["station_anomaly"][position], tables["station_climatology"][position],
+                tables["station_cells"][position])
+
+    def bbox(self, lat_min, lat_max, lon_min, lon_max, start=None, end=None):
+        """(times, lats, lons, anomaly view) for a box; lon_min > lon_max (in 0-360) crosses the prime meridian"""
+        grids = self._load()
+        times, lats, lons = grids["time"], grids["lat"], grids["lon"]
+        first = 0 if start is None else int(np.searchsorted(times, np.datetime64(pd.Timestamp(start), "s")))
+        last = len(times) if end is None else int(np.searchsorted(times, np.datetime64(pd.Timestamp(end), "s"), "right"))
+        rows = slice(int(np.searchsorted(lats, lat_min)), int(np.searchsorted(lats, lat_max, "right")))
+        west, east = lon_min % 360, lon_max % 360
+        if lon_max - lon_min >= 360:
+            west, east = 0, 360
+        if west <= east:
+            columns = slice(int(np.searchsorted(lons, west)), int(np.searchsorted(lons, east, "right")))
+            return times[first:last], lats[rows], lons[columns], grids["anomaly"][first:last, rows, columns]
+        # Crossing 0/360: the only case that has to copy
+        columns = np.concatenate([np.flatnonzero(lons >= west), np.flatnonzero(lons <= east)])
+        return times[first:last], lats[rows], lons[columns], grids["anomaly"][first:last, rows][:, :, columns]
+
+    def climatology(self, lat, lon):
+        grids = self._load()
+        row, column, _ = self.nearest_cell(lat, lon)
+        return grids["climatology"][:, row, column]
+
+    def get_stats(self):
+        name, meta = self._current()
+        return {"build": name, "source_exists": self.source.exists(), **(meta or {})}
+
+
+_default_store = None
+
+
+def get_default_store():
+    global _default_store
+    if _default_store is None:
+        _default_store = AltimetryStore()
+    return _default_store
+
+
+def get_altimetry_point(lat, lon):
+    """Monthly SSH anomaly (cm, DAC included) at the nearest ocean grid cell to (lat, lon)"""
+    times, anomaly, cell_lat, cell_lon, distance = get_default_store().point(lat, lon)
+    frame = pd.DataFrame({"time": pd.to_datetime(times), "ssh_anomaly_cm": anomaly})
+    frame.attrs.update(cell_lat=float(cell_lat), cell_lon=float(cell_lon), distance_km=distance)
+    return frame
+
+
+def get_altimetry_station(station_id):
+    """Monthly SSH anomaly (cm) at the ocean grid cell nearest an FD station, from the per-station cache"""
+    store = get_default_store()
+    times, anomaly, _, cell = store.station(station_id)
+    frame = pd.DataFrame({"time": pd.to_datetime(times), "ssh_anomaly_cm": anomaly})
+    frame.attrs.update(
+        cell_lat=float(store._grids["lat"][cell["lat_index"]]),
+        cell_lon=float(store._grids["lon"][cell["lon_index"]]),
+        distance_km=float(cell["distance_km"]),
+    )
+    return frame
+
+
+def get_altimetry_climatology(lat=None, lon=None, station_id=None):
+    """12-month SSH climatology (cm) at a station's or a point's nearest ocean cell"""
+    if station_id is not None:
+        values = get_default_store().station(station_id)[2]
+    else:
+        values = get_default_store().climatology(lat, lon)
+    return pd.DataFrame({"month": np.arange(1, 13), "ssh_climatology_cm": values})
+
+
+def get_altimetry_bbox(lat_min, lat_max, lon_min, lon_max, start=None, end=None):
+    """SSH anomaly (cm) in a lat/lon box as an xarray DataArray (time, lat, lon), read lazily from the shared cache"""
+    import xarray as xr
+
+    times, lats, lons, anomaly = get_default_store().bbox(lat_min, lat_max, lon_min, lon_max, start, end)
+    return xr.DataArray(
+        anomaly, coords={"time": times, "lat": lats, "lon": lons}, dims=("time", "lat", "lon"),
+        name="ssh_anomaly_cm",
+    )
@@ -0,0 +1,230 @@
+"""
+Server-side analyses over many stations of the hourly station store.
+
+`run_batch` takes a station set (ids, a lat/lon box or every station in
+the store), a time range and one operation:
+
+    trend          least-squares linear trend (mm/year) of the valid hours
+    annual_max     highest hourly value of each year and when it happened
+    exceedance     hours and days above a datum from the datum tables
+    monthly_means  mean of the valid hours of each month
+
+Stations are split into chunks and analysed on a process pool. Each worker
+memory-maps the station files itself, so nothing but the station ids and
+the result rows cross process boundaries. The app serves it as POST
+/batch; kernels call `run_batch_analysis`, which posts to the app and
+only runs the analysis itself when the app can't be reached.
+"""
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+import requests
+
+from utils.station_store import MISSING_VALUE, _to_epoch, get_store
+
+logger = logging.getLogger(__name__)
+
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", str(min(8, len(os.sched_getaffinity(0))))))
+BATCH_API_URL = os.getenv("BATCH_API_URL", "http://127.0.0.1:8001/batch")
+BATCH_TIMEOUT = 300
+CHUNKS_PER_WORKER = 4
+MIN_PARALLEL_STATIONS = 8  # Smaller batches run inline, a pool round trip costs more than they do
+SECONDS_PER_YEAR = 365.2425 * 86400
+OPERATIONS = ("trend", "annual_max", "exceedance", "monthly_means")
+
+
+def _trend(station_id, first_time, values, valid, threshold):
+    hours = np.flatnonzero(valid)
+    if len(hours) < 2:
+        return [{"station_id": station_id, "trend_mm_per_year": np.nan, "mean_mm": np.nan, "hours_valid": len(hours)}]
+    years = hours * (3600 / SECONDS_PER_YEAR)
+    heights = values[hours].astype(np.float64)
+    years -= years.mean()
+    mean = heights.mean()
+    slope = np.dot(years, heights - mean) / np.dot(years, years)
+    return [{
+        "station_id": station_id,
+        "trend_mm_per_year": float(slope),
+        "mean_mm": float(mean),
+        "hours_valid": len(hours),
+        "start": pd.Timestamp(first_time + int(hours[0]) * 3600, unit="s").isoformat(),
+        "end": pd.Timestamp(first_time + int(hours[-1]) * 3600, unit="s").isoformat(),
+    }]
+
+
+def _periods(first_time, count, unit):
+    """Calendar years ("Y") or months ("M") covered by `count` hours from first_time, and the hour each starts at"""
+    first, last = (np.datetime64(seconds, "s").astype(f"datetime64[{unit}]")
+                   for seconds in (first_time, first_time + (count - 1) * 3600))
+    labels = np.arange(first, last + 1)
+    starts = (labels.astype("datetime64[s]").astype(np.int64) - first_time) // 3600
+    starts[0] = 0
+    return labels, starts
+
+
+def _annual_max(station_id, first_time, values, valid, threshold):
+    if not valid.any():
+        return []
+    years, starts = _periods(first_time, len(values), "Y")
+    ends = np.append(starts[1:], len(values))
+    counts = np.add.reduceat(valid, starts)
+    masked = np.where(valid, values, np.iinfo(np.int32).min)
+    rows = []
+    for year, first, last, count in zip(years, starts, ends, counts):
+        if count == 0:
+            continue
+        peak = first + int(np.argmax(masked[first:last]))
+        rows.append({
+            "station_id": station_id,
+            "year": int(str(year)),
+            "max_mm": int(values[peak]),
+            "time": pd.Timestamp(first_time + peak * 3600, unit="s").isoformat(),
+            "hours_valid": int(count),
+        })
+    return rows
+
+
+def _exceedance(station_id, first_time, values, valid, threshold):
+    from utils.datum_table import hours_and_days_above
+
+    row = {"station_id": station_id, "threshold_mm": threshold, "hours_valid": int(np.count_nonzero(valid)),
+           "hours_above": None, "days_above": None}
+    if np.isfinite(threshold):
+        row["hours_above"], row["days_above"] = hours_and_days_above(first_time, values, valid, threshold)
+    return [row]
+
+
+def _monthly_means(station_id, first_time, values, valid, threshold):
+    if not valid.any():
+        return []
+    months, starts = _periods(first_time, len(values), "M")
+    counts = np.add.reduceat(valid, starts)
+    sums = np.add.reduceat(np.where(valid, values, 0).astype(np.float64), starts)
+    return [
+        {"station_id": station_id, "month": str(month), "mean_mm": float(total / count), "hours_valid": int(count)}
+        for month, total, count in zip(months, sums, counts) if count
+    ]
+
+
+ANALYSES = {"trend": _trend, "annual_max": _annual_max, "exceedance": _exceedance, "monthly_means": _monthly_means}
+
+
+def analyze_stations(operation, station_ids, start=None, end=None, thresholds=None):
+    """Rows of one operation over a list of stations, and the ids that aren't in the store"""
+    store = get_store("hourly")
+    analysis = ANALYSES[operation]
+    rows, missing = [], []
+    for position, station_id in enumerate(station_ids):
+        try:
+            first_time, values = store.read(station_id, start, end)
+        except KeyError:
+            missing.append(station_id)
+            continue
+        threshold = np.nan if thresholds is None else thresholds[position]
+        rows.extend(analysis(station_id, int(first_time), values, values != MISSING_VALUE, threshold))
+    return rows, missing
+
+
+_pool = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the app has threads and an event loop that a forked child would inherit mid-flight
+        _pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def resolve_stations(stations=None, bbox=None):
+    """Station ids of an explicit list, a (lat_min, lat_max, lon_min, lon_max) box, or every station in the store"""
+    if bbox is not None:
+        from utils.station_index import find_stations_in_bbox
+
+        if len(bbox) != 4:
+            raise ValueError("bbox must be [lat_min, lat_max, lon_min, lon_max]")
+        station_ids = find_stations_in_bbox(*bbox)["station_id"].tolist()
+        if stations:
+            wanted = {f"{int(station_id):03d}" for station_id in stations}
+            station_ids = [station_id for station_id in station_ids if station_id in wanted]
+        return station_ids
+    if stations:
+        return list(dict.fromkeys(f"{int(station_id):03d}" for station_id in stations))
+    return get_store("hourly").stations()
+
+
+def run_batch(operation, stations=None, bbox=None, start=None, end=None, datum="MHHW", workers=None):
+    """Run one operation over a station set and return the result table as a DataFrame.
+
+    frame.attrs holds the stations that had no data (`missing`) and the time taken (`seconds`).
+    """
+    if operation not in ANALYSES:
+        raise ValueError(f"Unknown operation {operation}; choose one of {', '.join(OPERATIONS)}")
+    started = perf_counter()
+    station_ids = resolve_stations(stations, bbox)
+    # Fail on a bad range here rather than in every worker
+    first, last = (None if bound is None else _to_epoch(bound) for bound in (start, end))
+    if first is not None and last is not None and first > last:
+        raise ValueError(f"start ({start}) is after end ({end})")
+    thresholds = None
+    if operation == "exceedance":
+        from utils.datum_table import get_default_table
+
+        thresholds = get_default_table().values(station_ids, datum) if station_ids else np.empty(0)
+
+    workers = BATCH_WORKERS if workers is None else workers
+    if workers <= 1 or len(station_ids) < MIN_PARALLEL_STATIONS:
+        rows, missing = analyze_stations(operation, station_ids, start, end, thresholds)
+    else:
+        size = -(-len(station_ids) // (workers * CHUNKS_PER_WORKER))
+        bounds = range(0, len(station_ids), size)
+        futures = [
+            get_pool().submit(analyze_stations, operation, station_ids[first:first + size], start, end,
+                              None if thresholds is None else thresholds[first:first + size])
+            for first in bounds
+        ]
+        rows, missing = [], []
+        for future in futures:
+            chunk_rows, chunk_missing = future.result()
+            rows.extend(chunk_rows)
+            missing.extend(chunk_missing)
+
+    frame = pd.DataFrame(rows)
+    if operation == "exceedance" and len(frame):
+        frame.insert(1, "datum", datum.strip().upper())
+        frame[["hours_above", "days_above"]] = frame[["hours_above", "days_above"]].astype("Int64")
+    frame.attrs.update(missing=missing, seconds=round(perf_counter() - started, 3))
+    logger.info(f"Batch {operation} over {len(station_ids)} stations in {frame.attrs['seconds']}s")
+    return frame
+
+
+def run_batch_analysis(operation, stations=None, bbox=None, start=None, end=None, datum="MHHW"):
+    """Run an analysis over many stations on the server and return the result table as a DataFrame.
+
+    operation is one of "trend", "annual_max", "exceedance" (hours/days above `datum`) or "monthly_means".
+    Pick stations with a list of ids and/or bbox=(lat_min, lat_max, lon_min, lon_max); all stations by default.
+    """
+    body = {"operation": operation, "stations": stations, "bbox": bbox, "start": start, "end": end, "datum": datum}
+    try:
+        response = requests.post(BATCH_API_URL, json=body, timeout=BATCH_TIMEOUT)
+    except requests.ConnectionError as e:
+        logger.warning(f"Batch API unreachable ({str(e)}), running the analysis in this process")
+        return run_batch(operation, stations, bbox, start, end, datum, workers=1)
+    if response.status_code != 200:
+        raise RuntimeError(f"Batch {operation} failed: HTTP {response.status_code} {response.text}")
+    result = response.json()
+    frame = pd.DataFrame(result["rows"], columns=result["columns"])
+    frame.attrs.update(missing=result["missing"], seconds=result["seconds"])
+    return frame
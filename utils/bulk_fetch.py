@@ -0,0 +1,209 @@
+"""
+Bulk download engine for the offline packing scripts.
+
+Work units (a station file, a station-month, ...) run on a bounded thread
+pool that shares one pooled `requests.Session`. Requests are rate limited
+per host with a token bucket and retried with exponential backoff on
+connection errors, 429 and 5xx responses. Finished units are recorded in a
+JSON manifest, so an interrupted run picks up where it stopped.
+"""
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from time import monotonic, sleep
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RetryableError(Exception):
+    """A response that should be retried (rate limited or server error)"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts up to `burst`"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            sleep(wait)
+
+
+class Manifest:
+    """Persistent record of finished work units"""
+
+    def __init__(self, path, save_interval=2.0):
+        self.path = Path(path)
+        self.save_interval = save_interval
+        self.lock = threading.Lock()
+        self.saved_at = monotonic()
+        try:
+            self.done = json.loads(self.path.read_text()).get("done", {})
+        except (OSError, ValueError):
+            self.done = {}
+
+    def __contains__(self, key):
+        return key in self.done
+
+    def get(self, key):
+        return self.done.get(key)
+
+    def mark_done(self, key, info=None):
+        with self.lock:
+            self.done[key] = info or {}
+            if monotonic() - self.saved_at >= self.save_interval:
+                self._save()
+
+    def forget(self, key):
+        with self.lock:
+            self.done.pop(key, None)
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"done": self.done}))
+        os.replace(tmp, self.path)
+        self.saved_at = monotonic()
+
+
+class BulkFetcher:
+    def __init__(self, max_workers=8, rate_per_host=4.0, burst=None, retries=4, backoff=1.0,
+                 timeout=60, session=None):
+        self.max_workers = max_workers
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+        self._bytes = 0
+        self._bytes_lock = threading.Lock()
+
+    def _bucket(self, host):
+        with self._buckets_lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate_per_host, self.burst)
+            return bucket
+
+    def retry(self, fn, *args, host="default", **kwargs):
+        """Call fn under the host's rate limit, retrying failures with exponential backoff"""
+        for attempt in range(self.retries + 1):
+            self._bucket(host).acquire()
+            try:
+                return fn(*args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout, RetryableError) as e:
+                if attempt == self.retries:
+                    raise
+                delay = getattr(e, "retry_after", None) or self.backoff * 2 ** attempt
+                logger.warning(f"Attempt {attempt + 1} failed ({str(e)}), retrying in {delay:.1f}s")
+                sleep(delay)
+
+    def get(self, url, **kwargs):
+        """GET through the pooled session; 429/5xx responses are retried, others returned as is"""
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.retry(self._get, url, host=urlsplit(url).netloc, **kwargs)
+        with self._bytes_lock:
+            self._bytes += len(response.content)
+        return response
+
+    def _get(self, url, **kwargs):
+        response = self.session.get(url, **kwargs)
+        if response.status_code in RETRY_STATUSES:
+            retry_after = response.headers.get("Retry-After")
+            raise RetryableError(
+                f"HTTP {response.status_code} for {url}",
+                float(retry_after) if retry_after and retry_after.isdigit() else None,
+            )
+        return response
+
+    def run(self, keys, work, manifest=None, progress_interval=10.0):
+        """Run work(key) for every key not already in the manifest.
+
+        work returns a dict recorded in the manifest for that key, or None if
+        the unit should be retried on the next run. Returns a summary dict.
+        """
+        keys = list(keys)
+        pending = [key for key in keys if manifest is None or key not in manifest]
+        summary = {"total": len(keys), "skipped": len(keys) - len(pending), "done": 0, "failed": 0}
+        if summary["skipped"]:
+            logger.info(f"Skipping {summary['skipped']} units already in the manifest")
+
+        started = last_report = monotonic()
+        start_bytes = self._bytes
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = {executor.submit(work, key): key for key in pending}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    info = future.result()
+                except Exception as e:
+                    summary["failed"] += 1
+                    logger.error(f"Failed to fetch {key}: {str(e)}")
+                else:
+                    if info is None:
+                        summary["failed"] += 1
+                    else:
+                        summary["done"] += 1
+                        if manifest is not None:
+                            manifest.mark_done(key, info)
+                now = monotonic()
+                if now - last_report >= progress_interval:
+                    last_report = now
+                    self._report(summary, len(pending), now - started, self._bytes - start_bytes)
+        finally:
+            # On interrupt, drop queued units but keep what already finished
+            executor.shutdown(wait=True, cancel_futures=True)
+            if manifest is not None:
+                manifest.save()
+
+        elapsed = monotonic() - started
+        summary["seconds"] = round(elapsed, 2)
+        summary["bytes"] = self._bytes - start_bytes
+        self._report(summary, len(pending), elapsed, summary["bytes"])
+        return summary
+
+    def _report(self, summary, pending, elapsed, fetched_bytes):
+        finished = summary["done"] + summary["failed"]
+        elapsed = max(elapsed, 1e-9)
+        logger.info(
+            f"{finished}/{pending} units ({summary['failed']} failed), "
+            f"{fetched_bytes / 1024 / 1024:.1f} MB at {fetched_bytes / 1024 / 1024 / elapsed:.2f} MB/s, "
+            f"{finished / elapsed:.1f} units/s"
+        )
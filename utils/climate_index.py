@@ -0,0 +1,333 @@
+"""
+Shared cache of parsed climate index series (ONI, PDO, PNA, ...).
+
+Each upstream file is downloaded once, parsed, and stored as typed arrays
+(`time` as datetime64[s], `value` as float32) in data/cache/climate_index,
+where every kernel reads it. The app refreshes all sources on a schedule
+with conditional GETs. A kernel asking for a series older than REFRESH_AGE
+gets the cached copy right away while a background thread fetches a new one
+(stale-while-revalidate), so a slow upstream never blocks an answer once the
+series has been fetched.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from time import time
+
+import numpy as np
+import pandas as pd
+import requests
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.getenv("CLIMATE_INDEX_CACHE_DIR", "data/cache/climate_index"))
+# Fetch every source from one mirror (e.g. the bench's stub server) at its upstream path
+BASE_URL = os.getenv("CLIMATE_INDEX_BASE_URL")
+REFRESH_AGE = float(os.getenv("CLIMATE_INDEX_REFRESH_HOURS", "24")) * 3600
+FETCH_TIMEOUT = 30
+META_FILE = "meta.json"
+
+URLS = {
+    "ONI": "https://psl.noaa.gov/data/correlation/oni.data",
+    "PDO": "https://www.ncei.noaa.gov/pub/data/cmb/ersst/v5/index/ersst.v5.pdo.dat",
+    "PNA": "https://psl.noaa.gov/data/correlation/pna.data",
+    "PMM-SST": "https://www.aos.wisc.edu/dvimont/MModes/RealTime/PMM.txt",
+    "AMM-SST": "https://www.aos.wisc.edu/dvimont/MModes/RealTime/AMM.txt",
+    "PMM-Wind": "https://www.aos.wisc.edu/dvimont/MModes/RealTime/PMM.txt",
+    "AMM-Wind": "https://www.aos.wisc.edu/dvimont/MModes/RealTime/AMM.txt",
+    "TNA": "https://psl.noaa.gov/data/correlation/tna.data",
+    "AO": "https://psl.noaa.gov/data/correlation/ao.data",
+    "NAO": "https://psl.noaa.gov/data/correlation/nao.data",
+    "IOD": "https://sealevel.jpl.nasa.gov/api/v1/chartable_values/?category=254&per_page=-1&order=x+asc",
+}
+if BASE_URL:
+    URLS = {name: f"{BASE_URL.rstrip('/')}/{url.split('/', 3)[3]}" for name, url in URLS.items()}
+MISSING_VALUES = {
+    "ONI": -99.90,
+    "PDO": 99.99,
+    "PNA": -99.90,
+    "PMM-SST": None,
+    "AMM-SST": None,
+    "PMM-Wind": None,
+    "AMM-Wind": None,
+    "TNA": -99.99,
+    "AO": -999.000,
+    "NAO": -99.90,
+}
+
+
+def fractional_year_to_datetime(year):
+    # Convert fractional year (e.g., 1992.7978142) to datetime.
+    year_int = int(year)
+    fraction = year - year_int
+    start_of_year = datetime(year_int, 1, 1)
+    days_in_year = (datetime(year_int + 1, 1, 1) - start_of_year).days
+    return start_of_year + timedelta(days=fraction * days_in_year)
+
+
+def fractional_years_to_datetime64(years):
+    """Vectorized fractional_year_to_datetime, returning datetime64[s]"""
+    years = np.asarray(years, dtype=np.float64)
+    whole = np.floor(years)
+    start = (whole - 1970).astype(np.int64).astype("datetime64[Y]")
+    seconds_in_year = ((start + 1).astype("datetime64[s]") - start.astype("datetime64[s]")).astype(np.int64)
+    offset = np.round((years - whole) * seconds_in_year).astype(np.int64)
+    return start.astype("datetime64[s]") + offset.astype("timedelta64[s]")
+
+
+def mid_month(years, months):
+    """datetime64[s] of the 15th of each (year, month)"""
+    months = (np.asarray(years, dtype=np.int64) - 1970) * 12 + np.asarray(months, dtype=np.int64) - 1
+    return (months.astype("datetime64[M]").astype("datetime64[D]") + 14).astype("datetime64[s]")
+
+
+def _grid(lines, width):
+    """Whitespace-separated rows as a float64 (rows, width) array, NaN-padding short rows"""
+    tokens = " ".join(lines).split()
+    if len(tokens) == len(lines) * width:
+        return np.array(tokens, dtype=np.float64).reshape(len(lines), width)
+    grid = np.full((len(lines), width), np.nan)
+    for row, line in enumerate(lines):
+        fields = line.split()[:width]
+        grid[row, :len(fields)] = np.array(fields, dtype=np.float64)
+    return grid
+
+
+def _monthly(grid, missing):
+    """Year-per-row grids (Year, Jan, ..., Dec) flattened into a monthly series"""
+    years = grid[:, 0]
+    values = grid[:, 1:13].astype(np.float32).ravel()
+    if missing is not None:
+        values[values == np.float32(missing)] = np.nan
+    return mid_month(np.repeat(years, 12), np.tile(np.arange(1, 13), len(years))), values
+
+
+def _parse_psl(raw_data, missing):
+    # First line holds the first and last year, followed by one row per year
+    lines = raw_data.splitlines()
+    first_year, last_year = (int(x) for x in lines[0].split()[:2])
+    rows = [line for line in lines[1:last_year - first_year + 2] if line.strip()]
+    return _monthly(_grid(rows, 13), missing)
+
+
+def _parse_pdo(raw_data):
+    # Skip the metadata line ("ERSST PDO Index:") and the Year/Jan/.../Dec header
+    rows = [line for line in raw_data.splitlines()[2:] if line.strip()]
+    return _monthly(_grid(rows, 13), MISSING_VALUES["PDO"])
+
+
+def _parse_mmodes(raw_data, column):
+    # Year, Month, SST, Wind after a single header line
+    rows = [line for line in raw_data.splitlines()[1:] if line.strip()]
+    grid = _grid(rows, 4)
+    return mid_month(grid[:, 0], grid[:, 1]), grid[:, column].astype(np.float32)
+
+
+def _parse_iod(raw_data):
+    iod_data = json.loads(raw_data)
+    if 'items' not in iod_data:
+        raise ValueError("Unexpected data structure: 'items' key not found.")
+    items = iod_data['items']
+    times = fractional_years_to_datetime64([float(item['x']) for item in items])
+    values = np.array([float(item['y']) for item in items], dtype=np.float64)
+    # Monthly means of the (roughly weekly) values, centered on the 15th
+    months = times.astype("datetime64[M]").astype(np.int64)
+    first = months.min()
+    slots = months - first
+    counts = np.bincount(slots)
+    sums = np.bincount(slots, weights=values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = (sums / counts).astype(np.float32)
+    month_index = (first + np.arange(len(counts))).astype("datetime64[M]")
+    return (month_index.astype("datetime64[D]") + 14).astype("datetime64[s]"), means
+
+
+def parse(climate_index_name, raw_data):
+    """Parse a downloaded source into (datetime64[s] times, float32 values), sorted by time"""
+    if climate_index_name in ["ONI", "PNA", "TNA", "AO", "NAO"]:
+        times, values = _parse_psl(raw_data, MISSING_VALUES[climate_index_name])
+    elif climate_index_name == "PDO":
+        times, values = _parse_pdo(raw_data)
+    elif climate_index_name == "IOD":
+        times, values = _parse_iod(raw_data)
+    elif climate_index_name in ["PMM-SST", "PMM-Wind", "AMM-SST", "AMM-Wind"]:
+        times, values = _parse_mmodes(raw_data, 2 if "-SST" in climate_index_name else 3)
+    else:
+        raise ValueError(f"Unhandled climate index: {climate_index_name}")
+    if len(times) > 1 and (np.diff(times.astype(np.int64)) < 0).any():
+        order = np.argsort(times, kind="stable")
+        times, values = times[order], values[order]
+    return times, values
+
+
+class ClimateIndexCache:
+    def __init__(self, cache_dir=CACHE_DIR, refresh_age=REFRESH_AGE, session=None):
+        self.cache_dir = Path(cache_dir)
+        self.refresh_age = refresh_age
+        self.session = session or requests.Session()
+        self._series = {}  # name -> (mtime, time, value)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def _locked(self, name, blocking=True):
+        with open(self.cache_dir / f"{name}.lock", "w") as lock:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(lock, flags)
+            except BlockingIOError:
+                yield False  # Someone else is already refreshing it
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _path(self, name):
+        return self.cache_dir / f"{name}.npz"
+
+    def _read_meta(self):
+        try:
+            return json.loads((self.cache_dir / META_FILE).read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, url, **fields):
+        with self._locked("meta"):
+            meta = self._read_meta()
+            meta[url] = dict(meta.get(url, {}), **fields)
+            tmp = self.cache_dir / f"{META_FILE}.tmp"
+            tmp.write_text(json.dumps(meta))
+            os.replace(tmp, self.cache_dir / META_FILE)
+
+    def age(self, name):
+        """Seconds since the series' source was last checked, or None if it was never fetched"""
+        fetched_at = self._read_meta().get(URLS[name], {}).get("fetched_at")
+        return None if fetched_at is None else time() - fetched_at
+
+    def refresh_source(self, url, wait=False):
+        """Fetch one upstream file (conditionally) and re-parse every index it feeds.
+
+        Returns False without fetching if another thread or process is already
+        refreshing it, unless `wait` is set, in which case it waits for that
+        refresh and only fetches if the series still isn't cached.
+        """
+        names = [name for name, source in URLS.items() if source == url]
+        with self._locked(names[0], blocking=wait) as acquired:
+            if not acquired:
+                return False
+            cached = all(self._path(name).exists() for name in names)
+            if wait and cached:
+                return False
+            source = self._read_meta().get(url, {})
+            headers = {}
+            if cached:
+                if source.get("etag"):
+                    headers["If-None-Match"] = source["etag"]
+                if source.get("last_modified"):
+                    headers["If-Modified-Since"] = source["last_modified"]
+            response = self.session.get(url, headers=headers, timeout=FETCH_TIMEOUT)
+            if response.status_code == 304:
+                self._write_meta(url, fetched_at=time())
+                return False
+            response.raise_for_status()
+            for name in names:
+                times, values = parse(name, response.text)
+                tmp = self.cache_dir / f"{name}.tmp.npz"
+                np.savez(tmp, time=times.astype(np.int64), value=values)
+                os.replace(tmp, self._path(name))
+            self._write_meta(
+                url,
+                fetched_at=time(),
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+                bytes=len(response.content),
+            )
+            logger.info(f"Refreshed climate indices {', '.join(names)} from {url}")
+            return True
+
+    def refresh_all(self):
+        """Refresh every source, logging (not raising) failures so stale data keeps being served"""
+        refreshed = []
+        for url in dict.fromkeys(URLS.values()):
+            try:
+                if self.refresh_source(url):
+                    refreshed.append(url)
+            except Exception as e:
+                logger.error(f"Error refreshing climate index source {url}: {str(e)}")
+        return refreshed
+
+    def _refresh_in_background(self, name):
+        url = URLS[name]
+        with self._lock:
+            if url in self._refreshing:
+                return
+            self._refreshing.add(url)
+
+        def run():
+            try:
+                self.refresh_source(url)
+            except Exception as e:
+                logger.warning(f"Background refresh of {name} failed, serving cached data: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(url)
+
+        threading.Thread(target=run, name=f"climate-index-{name}", daemon=True).start()
+
+    def arrays(self, name):
+        """(datetime64[s] times, float32 values) for a climate index"""
+        if name not in URLS:
+            raise ValueError(f"Unknown climate index: {name}")
+        path = self._path(name)
+        if not path.exists():
+            # Nothing cached yet, so this caller has to wait for the download
+            self.refresh_source(URLS[name], wait=True)
+        else:
+            age = self.age(name)
+            if age is None or age > self.refresh_age:
+                self._refresh_in_background(name)
+
+        mtime = path.stat().st_mtime_ns
+        cached = self._series.get(name)
+        if cached is None or cached[0] != mtime:
+            with np.load(path) as data:
+                cached = (mtime, data["time"].astype("datetime64[s]"), data["value"])
+            self._series[name] = cached
+        return cached[1], cached[2]
+
+    def get(self, name):
+        times, values = self.arrays(name)
+        return pd.DataFrame({"time": pd.to_datetime(times), "value": values})
+
+    def get_stats(self):
+        meta = self._read_meta()
+        now = time()
+        return {
+            name: {
+                "cached": self._path(name).exists(),
+                "age_seconds": round(now - meta[url]["fetched_at"], 1) if "fetched_at" in meta.get(url, {}) else None,
+            }
+            for name, url in URLS.items()
+        }
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ClimateIndexCache()
+    return _default_cache
+
+
+def get_climate_index(climate_index_name):
+    """Climate index as a DataFrame with `time` and `value` columns, served from the shared cache"""
+    return get_default_cache().get(climate_index_name)
@@ -63,4 +63,106 @@ def get_custom_instructions(today, host, session_id, static_dir, upload_dir, sta
             plt.legend()
             plt.grid()
             plt.show()
+
+            5. get_sea_level_data(station_id, start, end, frequency="hourly")
+            Returns hourly or daily Fast Delivery sea level data from the UHSLC ERDDAP server as a pandas DataFrame with
+            columns sea_level (mm, Station Zero datum, missing values already replaced with NaN) and time (UTC).
+            Results are cached on the server, so repeated or overlapping requests are fast. Always use it instead of
+            reading the ERDDAP URL directly.
+            Parameters:
+                station_id (str): e.g. "057"
+                start, end (str or datetime): e.g. "2024-01-01", "2024-06-30 23:00"
+                frequency (str): "hourly" (global_hourly_fast) or "daily" (global_daily_fast)
+            Example usage:
+            df = get_sea_level_data("057", "2024-01-01", "2024-06-30", frequency="hourly")
+
+            6. get_station_series(station_id, start=None, end=None, frequency="hourly")
+            Returns the complete packed Fast Delivery record of a station from the local station store as a pandas
+            DataFrame with columns time (UTC) and sea_level (mm, Station Zero datum, NaN where missing). Reading it
+            takes microseconds and needs no download, so prefer it for long records and multi-station comparisons.
+            get_station_array(station_id, start=None, end=None, frequency="hourly") returns the same data as a
+            (datetime64 times, int32 sea level) pair of NumPy arrays without copying; missing values are -32767 there.
+            A KeyError means the station is not in the store; fall back to get_sea_level_data in that case.
+            Example usage:
+            df = get_station_series("057", "1990-01-01", "2020-12-31")
+
+            7. Station metadata and benchmarks (from fd_metadata.geojson and all_benchmarks.json, already indexed):
+            get_station_info(station_id) returns a dict with station_id, name, country, lat, lon, fd_begin, fd_end
+            and the number of benchmarks. get_station_table() returns the same columns for every FD station as a
+            pandas DataFrame. find_nearest_stations(lat, lon, k=5, max_km=None) returns the k closest stations with
+            a distance_km column, nearest first. find_stations_in_bbox(lat_min, lat_max, lon_min, lon_max) returns
+            the stations inside a box (use lon_min > lon_max for a box that crosses the dateline).
+            get_station_benchmarks(station_id) returns a DataFrame of the station's benchmarks (primary first) with
+            benchmark, type, primary, lat, lon, level_m (meters), level_date, description and photo_files.
+            Use these instead of opening and scanning the geojson files. A KeyError means the station is not in
+            fd_metadata.geojson.
+            Example usage:
+            info = get_station_info("057")
+            nearby = find_nearest_stations(info["lat"], info["lon"], k=4).iloc[1:]
+
+            8. Altimetry (monthly SSH from cmems_altimetry_regrid.nc, in cm, already downloaded and cached):
+            get_altimetry_station(station_id) returns a DataFrame with time and ssh_anomaly_cm at the ocean grid
+            cell nearest the station; get_altimetry_point(lat, lon) does the same for any point. The cell used is
+            in df.attrs (cell_lat, cell_lon, distance_km). get_altimetry_climatology(station_id=...) or
+            get_altimetry_climatology(lat, lon) returns the 12-month climatology (month, ssh_climatology_cm).
+            get_altimetry_bbox(lat_min, lat_max, lon_min, lon_max, start=None, end=None) returns the anomaly in a
+            box as an xarray DataArray (time, lat, lon) with longitudes in 0-360 (use lon_min > lon_max for a box
+            that crosses 0°). Use these instead of opening the NetCDF file.
+            Example usage:
+            df = get_altimetry_station("057")
+            box = get_altimetry_bbox(10, 30, 180, 220, start="2015-01-01")
+
+            9. get_tide_predictions(station_id, start=None, end=None)
+            Returns the hourly tide predictions (1983-2030) of a station from the local tide store as a pandas
+            DataFrame with columns time (UTC) and tide_prediction_mm (Station Zero datum). It needs no download.
+            get_tide_prediction_array(station_id, start=None, end=None) returns the same as a (datetime64 times,
+            int32 mm) pair of NumPy arrays without copying. get_high_low_tides(station_id, start=None, end=None)
+            returns the high/low predictions (2023-2029) with columns time, tide_prediction_mm and tide_type
+            ("High Tide"/"Low Tide"). A KeyError means the station is not in the tide store; fall back to the CSV
+            files in that case.
+            Example usage:
+            tides = get_tide_predictions("057", "2024-01-01", "2024-01-31")
+            highs_lows = get_high_low_tides("057", "2025-03-01", "2025-03-07")
+
+            10. predict_tides(station_id, start=None, end=None, interval="1h", times=None)
+            Computes harmonic tide predictions (mm, Station Zero datum) for any period from 1900 to 2100 and at any
+            interval (e.g. "6min", "15min"), from the station's tidal constituents. Pass `times` instead of
+            start/end/interval for arbitrary timestamps (UTC). Returns a DataFrame with time and
+            tide_prediction_mm. Use it for times outside 1983-2030 or finer than hourly; within that range
+            get_tide_predictions returns the published values.
+            Example usage:
+            tides = predict_tides("057", "2050-01-01", "2050-01-07", interval="6min")
+
+            11. get_rapid_data(station_id, start=None, end=None)
+            Returns the last 30 days of near-real-time (RAPID) hourly data of a station as a pandas DataFrame with
+            columns time (UTC), prediction_mm, observation_mm and residual_mm (observation minus prediction), all
+            relative to Station Zero. The app refreshes it every few minutes; df.attrs["updated_at"] says when. A
+            KeyError means the station has no RAPID data buffered; fall back to the RAPID CSV file in that case.
+            Example usage:
+            rapid = get_rapid_data("057", start="2025-01-10")
+
+            12. Datums: get_datums(station_id) returns a station's datum table as a DataFrame with columns datum,
+            value_mm (above Station Zero, STND = 0) and description; df.attrs holds the text fields (STATUS, EPOCH).
+            convert_datum(values, station_id, from_datum, to_datum) applies
+            Converted = Original + (from_datum - to_datum); a float NumPy array is converted in place, anything
+            else is returned as a new float result. count_datum_exceedances(station_ids=None, datums=("MHHW", "HAT"),
+            start=None, end=None) counts the hours and days each station's hourly FD sea level was above each datum
+            (one row per station; all stations if station_ids is None). Use these instead of downloading the
+            datum table CSV.
+            Example usage:
+            df = get_station_series("057", "2020-01-01")
+            convert_datum(df["sea_level"].to_numpy(), "057", "STND", "MHHW")  # now relative to MHHW
+            floods = count_datum_exceedances(["057", "058", "060"], datums=["MHHW", "HAT"], start="2000-01-01")
+
+            13. run_batch_analysis(operation, stations=None, bbox=None, start=None, end=None, datum="MHHW")
+            Runs one analysis over many stations' hourly FD sea level on the server and returns a DataFrame. Use it
+            instead of looping over stations whenever a question covers more than a few stations. operation is:
+            "trend" (linear trend in mm/year with gaps ignored, one row per station), "annual_max" (station_id,
+            year, max_mm, time), "exceedance" (hours and days above `datum`, one row per station) or
+            "monthly_means" (station_id, month, mean_mm, hours_valid). Pick stations with a list of ids and/or
+            bbox=(lat_min, lat_max, lon_min, lon_max); all stations are used by default. df.attrs["missing"] lists
+            stations without data.
+            Example usage:
+            trends = run_batch_analysis("trend", bbox=(-30, 30, 120, 250), start="1993-01-01")
+            floods = run_batch_analysis("exceedance", stations=["057", "058"], datum="HAT")
         """
@@ -0,0 +1,348 @@
+"""
+Parsed tidal datum tables of all FD stations.
+
+Each station's datumTable_{station_id}_mm_GMT.csv is downloaded with a
+conditional GET (only when its ETag changed) into data/cache/datums/raw,
+and all of them are parsed into one typed lookup: a float64 array of
+station x datum elevations in mm above Station Zero (NaN where a station
+doesn't define a datum), the sorted station ids and the datum names. Like
+the station index, each build lives in its own directory and CURRENT names
+the live one.
+
+Kernels use it to convert series between datums in place
+(Converted = Original + (Datum A - Datum B)) and to count hours and days
+above flood thresholds such as MHHW or HAT for many stations at once from
+the station store. The app refreshes the tables every DATUM_REFRESH_HOURS;
+`python -m utils.datum_table` does the same from the command line.
+"""
+import argparse
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+from pathlib import Path
+from time import time
+
+import numpy as np
+import pandas as pd
+
+from utils.bulk_fetch import BulkFetcher
+from utils.station_store import MISSING_VALUE, get_store
+from utils.tide_store import TIDES_BASE_URL
+
+logger = logging.getLogger(__name__)
+
+DATUM_DIR = Path(os.getenv("DATUM_CACHE_DIR", "data/cache/datums"))
+DATUM_URL = "{base}/LST/fd{station_id}/datumTable_{station_id}_mm_GMT.csv"
+REFRESH_INTERVAL = float(os.getenv("DATUM_REFRESH_HOURS", "24")) * 3600
+STATION_ZERO = "STND"
+CURRENT_FILE = "CURRENT"
+STATE_FILE = "state.json"
+FLOOD_DATUMS = ("MHHW", "HAT")
+
+
+def parse_datum_csv(content):
+    """Numeric fields (mm), text fields and descriptions of a datum table (Name, Value, Description)"""
+    frame = pd.read_csv(BytesIO(content), skipinitialspace=True, dtype=str, keep_default_na=False)
+    names = frame.iloc[:, 0].str.strip().str.upper()
+    text = frame.iloc[:, 1].str.strip()
+    numbers = pd.to_numeric(text, errors="coerce")
+    numeric = numbers.notna().to_numpy()
+    descriptions = frame.iloc[:, 2].str.strip() if frame.shape[1] > 2 else pd.Series("", index=frame.index)
+    return (
+        dict(zip(names[numeric], numbers[numeric].astype(np.float64))),
+        dict(zip(names[~numeric], text[~numeric])),
+        dict(zip(names, descriptions)),
+    )
+
+
+def build_lookup(tables):
+    """Station ids (sorted int), datum names and a station x datum float64 array from {station_id: {datum: mm}}"""
+    station_ids = np.array(sorted(int(station_id) for station_id in tables), np.int64)
+    names = sorted({name for values in tables.values() for name in values} | {STATION_ZERO})
+    columns = {name: column for column, name in enumerate(names)}
+    values = np.full((len(station_ids), len(names)), np.nan)
+    for station_id, datums in tables.items():
+        row = int(np.searchsorted(station_ids, int(station_id)))
+        for name, value in datums.items():
+            values[row, columns[name]] = value
+    values[:, columns[STATION_ZERO]] = 0.0
+    return station_ids, names, values
+
+
+class DatumTable:
+    def __init__(self, cache_dir=DATUM_DIR, base_url=TIDES_BASE_URL, check_interval=5):
+        self.dir = Path(cache_dir)
+        self.raw_dir = self.dir / "raw"
+        self.base_url = base_url
+        self.check_interval = check_interval
+        self.last_result = None
+        self._tables = None
+        self._build = None
+        self._checked = 0
+
+    @contextmanager
+    def _locked(self, blocking=True):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with open(self.dir / "refresh.lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_json(self, path, default):
+        try:
+            return json.loads(Path(path).read_text())
+        except (OSError, ValueError):
+            return default
+
+    def _write_json(self, path, data):
+        tmp = path.with_name(f".{path.name}.tmp")
+        tmp.write_text(json.dumps(data, sort_keys=True))
+        os.replace(tmp, path)
+
+    def _current(self):
+        try:
+            return (self.dir / CURRENT_FILE).read_text().strip()
+        except OSError:
+            return None
+
+    def refresh(self, station_ids=None, fetcher=None):
+        """Download the datum tables that changed and rebuild the lookup if any did"""
+        started = time()
+        with self._locked(blocking=False) as acquired:
+            if not acquired:
+                return {"status": "busy"}  # Another worker is refreshing
+            fetcher = fetcher or BulkFetcher()
+            if not station_ids:
+                from utils.station_index import get_station_table
+
+                station_ids = get_station_table()["station_id"].tolist()
+            self.raw_dir.mkdir(parents=True, exist_ok=True)
+            state = self._read_json(self.dir / STATE_FILE, {})
+            updated = []
+            lock = threading.Lock()
+
+            def fetch(station_id):
+                entry = state.get(station_id, {})
+                raw_path = self.raw_dir / f"{station_id}.csv"
+                headers = {"If-None-Match": entry["etag"]} if entry.get("etag") and raw_path.exists() else {}
+                response = fetcher.get(DATUM_URL.format(base=self.base_url, station_id=station_id), headers=headers)
+                if response.status_code == 304:
+                    return entry
+                if response.status_code == 404:
+                    return {"missing": True}
+                if response.status_code != 200:
+                    logger.error(f"Error fetching the datum table of station {station_id}: HTTP {response.status_code}")
+                    return None
+                parse_datum_csv(response.content)  # Don't keep a file that can't be parsed
+                tmp = self.raw_dir / f".{station_id}.csv.tmp"
+                tmp.write_bytes(response.content)
+                os.replace(tmp, raw_path)
+                with lock:
+                    updated.append(station_id)
+                    state[station_id] = {"etag": response.headers.get("ETag"), "refreshed_at": int(time())}
+                return state[station_id]
+
+            summary = fetcher.run(station_ids, fetch)
+            self._write_json(self.dir / STATE_FILE, state)
+            if updated or self._current() is None:
+                self.build()
+            result = {"updated": len(updated), "failed": summary["failed"], "seconds": round(time() - started, 3),
+                      "checked_at": time()}
+        self.last_result = result
+        return result
+
+    def build(self):
+        """Parse every downloaded datum table into a new build directory and make it current"""
+        tables, text, descriptions = {}, {}, {}
+        for path in sorted(self.raw_dir.glob("*.csv")):
+            try:
+                numeric, fields, described = parse_datum_csv(path.read_bytes())
+            except Exception as e:
+                logger.error(f"Error parsing {path}: {str(e)}")
+                continue
+            tables[path.stem] = numeric
+            text[path.stem] = fields
+            for name, description in described.items():
+                descriptions.setdefault(name, description)
+        station_ids, names, values = build_lookup(tables)
+
+        name = f"build-{time():.6f}"
+        build_dir = self.dir / name
+        build_dir.mkdir(parents=True)
+        np.save(build_dir / "station_ids.npy", station_ids)
+        np.save(build_dir / "values.npy", values)
+        (build_dir / "meta.json").write_text(json.dumps({"datums": names, "descriptions": descriptions, "text": text}))
+        tmp = self.dir / f"{CURRENT_FILE}.tmp"
+        tmp.write_text(name)
+        os.replace(tmp, self.dir / CURRENT_FILE)
+        for old in sorted(path for path in self.dir.glob("build-*") if path.is_dir())[:-2]:
+            shutil.rmtree(old, ignore_errors=True)
+        logger.info(f"Datum lookup rebuilt: {len(station_ids)} stations, {len(names)} datums")
+        return name
+
+    def _load(self):
+        now = time()
+        if self._tables is not None and now - self._checked < self.check_interval:
+            return self._tables
+        self._checked = now
+        name = self._current()
+        if name is None:
+            raise FileNotFoundError(f"No datum tables in {self.dir}; run python -m utils.datum_table")
+        if name != self._build:
+            meta = json.loads((self.dir / name / "meta.json").read_text())
+            self._tables = {
+                "station_ids": np.load(self.dir / name / "station_ids.npy"),
+                "values": np.load(self.dir / name / "values.npy"),
+                "columns": {datum: column for column, datum in enumerate(meta["datums"])},
+                "descriptions": meta["descriptions"],
+                "text": meta["text"],
+            }
+            self._build = name
+        return self._tables
+
+    def _rows(self, station_ids):
+        ids = self._load()["station_ids"]
+        wanted = np.array([int(station_id) for station_id in station_ids], np.int64)
+        rows = np.minimum(np.searchsorted(ids, wanted), max(len(ids) - 1, 0))
+        found = ids[rows] == wanted if len(ids) else np.zeros(len(wanted), bool)
+        return rows, found
+
+    def _column(self, datum):
+        columns = self._load()["columns"]
+        datum = datum.strip().upper()
+        if datum not in columns:
+            raise KeyError(f"Unknown datum {datum}; available: {', '.join(columns)}")
+        return columns[datum]
+
+    def values(self, station_ids, datum):
+        """Elevation (mm above Station Zero) of a datum at many stations, NaN where it isn't defined"""
+        rows, found = self._rows(station_ids)
+        values = self._load()["values"][rows, self._column(datum)]
+        return np.where(found, values, np.nan)
+
+    def station(self, station_id):
+        """{datum: mm above Station Zero} of one station"""
+        rows, found = self._rows([station_id])
+        if not found[0]:
+            raise KeyError(f"Station {station_id} has no datum table")
+        tables = self._load()
+        row = tables["values"][rows[0]]
+        return {datum: float(row[column]) for datum, column in tables["columns"].items() if np.isfinite(row[column])}
+
+    def offset(self, station_id, from_datum, to_datum):
+        """Datum A - Datum B, the amount to add to convert values from datum A to datum B"""
+        a, b = (self.values([station_id], datum)[0] for datum in (from_datum, to_datum))
+        if not (np.isfinite(a) and np.isfinite(b)):
+            raise KeyError(f"Station {station_id} doesn't define both {from_datum} and {to_datum}")
+        return a - b
+
+    def get_stats(self):
+        try:
+            tables = self._load()
+            stations, datums = tables["values"].shape
+        except FileNotFoundError:
+            stations = datums = 0
+        return {"last_refresh": self.last_result, "stations": stations, "datums": datums}
+
+
+_default_table = None
+
+
+def get_default_table():
+    global _default_table
+    if _default_table is None:
+        _default_table = DatumTable()
+    return _default_table
+
+
+def get_datums(station_id):
+    """A station's datum table as a DataFrame with `datum`, `value_mm` (above Station Zero) and `description`"""
+    table = get_default_table()
+    station_id = f"{int(station_id):03d}"
+    values = table.station(station_id)
+    descriptions = table._load()["descriptions"]
+    frame = pd.DataFrame({
+        "datum": list(values),
+        "value_mm": list(values.values()),
+        "description": [descriptions.get(datum, "") for datum in values],
+    })
+    frame.attrs.update(table._load()["text"].get(station_id, {}))
+    return frame
+
+
+def convert_datum(values, station_id, from_datum, to_datum):
+    """Convert mm from one datum to another (Converted = Original + (Datum A - Datum B)).
+
+    A writable float NumPy array is converted in place and returned; anything else (int arrays, lists,
+    Series, scalars) is returned as a new float result. Missing values must be NaN.
+    """
+    offset = get_default_table().offset(f"{int(station_id):03d}", from_datum, to_datum)
+    if isinstance(values, np.ndarray) and values.dtype.kind == "f" and values.flags.writeable:
+        values += offset
+        return values
+    if isinstance(values, pd.Series):
+        return values.astype(np.float64) + offset
+    return np.asarray(values, np.float64) + offset
+
+
+def hours_and_days_above(first_time, values, valid, threshold):
+    """Hours and distinct UTC days above a threshold in an hourly series starting at epoch second first_time"""
+    above = np.flatnonzero(valid & (values > threshold))
+    days = (first_time // 3600 + above) // 24
+    return len(above), (np.count_nonzero(np.diff(days)) + 1 if len(days) else 0)
+
+
+def count_datum_exceedances(station_ids=None, datums=FLOOD_DATUMS, start=None, end=None):
+    """Hours and days each station's hourly FD sea level was above each datum (e.g. MHHW, HAT) in [start, end].
+
+    Returns a DataFrame with one row per station: station_id, hours_valid and, for each datum,
+    `{datum}_mm` (threshold above Station Zero), `hours_above_{datum}` and `days_above_{datum}`.
+    """
+    table = get_default_table()
+    store = get_store("hourly")
+    station_ids = [f"{int(station_id):03d}" for station_id in (station_ids or store.stations())]
+    datums = [datum.strip().upper() for datum in ([datums] if isinstance(datums, str) else datums)]
+    thresholds = np.stack([table.values(station_ids, datum) for datum in datums], axis=1)
+    hours_valid = np.zeros(len(station_ids), np.int64)
+    hours_above = np.full((len(station_ids), len(datums)), -1, np.int64)
+    days_above = np.full((len(station_ids), len(datums)), -1, np.int64)
+    for row, station_id in enumerate(station_ids):
+        try:
+            first_time, values = store.read(station_id, start, end)
+        except KeyError:
+            continue
+        valid = values != MISSING_VALUE
+        hours_valid[row] = np.count_nonzero(valid)
+        for column, threshold in enumerate(thresholds[row]):
+            if np.isfinite(threshold):
+                hours_above[row, column], days_above[row, column] = hours_and_days_above(
+                    first_time, values, valid, threshold)
+
+    frame = pd.DataFrame({"station_id": station_ids, "hours_valid": hours_valid})
+    for column, datum in enumerate(datums):
+        frame[f"{datum}_mm"] = thresholds[:, column]
+        # -1 marks a station without data or without this datum
+        frame[f"hours_above_{datum}"] = pd.Series(hours_above[:, column]).replace(-1, pd.NA).astype("Int64")
+        frame[f"days_above_{datum}"] = pd.Series(days_above[:, column]).replace(-1, pd.NA).astype("Int64")
+    return frame
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Download the FD datum tables and rebuild the datum lookup")
+    parser.add_argument("--stations", nargs="*", help="Station ids, e.g. 001 057 (default: all FD stations)")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent downloads")
+    parser.add_argument("--rate", type=float, default=4.0, help="Requests per second per host")
+    args = parser.parse_args()
+    print(get_default_table().refresh(args.stations, BulkFetcher(max_workers=args.workers, rate_per_host=args.rate)))
@@ -1,10 +1,19 @@
+import argparse
+import logging
 import pandas as pd
 import pickle
 import os
 from datetime import datetime, timedelta
 
 from data_endpoints import get_tide_data
-from download_and_pack_sealevel_data import get_available_station_numbers
+from utils.bulk_fetch import BulkFetcher, Manifest
+from utils.download_and_pack_sealevel_data import get_available_station_numbers
+
+logger = logging.getLogger(__name__)
+
+PARTS_DIR = 'tide_data/parts'
+start_date = "202401"
+end_date = "202612"
 
 def generate_date_range(start_date, end_date):
     current_date = datetime.strptime(start_date, "%Y%m")
@@ -14,42 +23,55 @@ def generate_date_range(start_date, end_date):
         current_date += timedelta(days=32)
         current_date = current_date.replace(day=1)
 
-def save_tide_data(station_ids, start_date, end_date):
-    os.makedirs('tide_data', exist_ok=True)
-    
+def _part_path(station_id, date):
+    return os.path.join(PARTS_DIR, f"{station_id}_{date}.pkl")
+
+def save_tide_data(station_ids, start_date, end_date, fetcher=None, restart=False):
+    os.makedirs(PARTS_DIR, exist_ok=True)
+    fetcher = fetcher or BulkFetcher()
+    manifest_path = f'tide_data/manifest_{start_date}_{end_date}.json'
+    if restart and os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    manifest = Manifest(manifest_path)
+    dates = list(generate_date_range(start_date, end_date))
+
+    # Each station-month is one unit; finished months are kept on disk so a rerun only fetches the rest
+    def work(unit):
+        station_id, date = unit.split(":")
+        tide_data, month_notes = fetcher.retry(get_tide_data, station_id, date, host="tides")
+        with open(_part_path(station_id, date), 'wb') as f:
+            pickle.dump((tide_data, month_notes), f, protocol=pickle.HIGHEST_PROTOCOL)
+        return {"rows": len(tide_data)}
+
+    units = [f"{station_id}:{date}" for station_id in station_ids for date in dates]
+    fetcher.run(units, work, manifest=manifest)
+
     all_station_data = {}
-    
     for station_id in station_ids:
-        station_with_error = None
+        if any(f"{station_id}:{date}" not in manifest for date in dates):
+            logger.error(f"Skipping station {station_id}: not all months could be fetched")
+            continue
         all_tide_data = []
         notes = None
-        
-        for date in generate_date_range(start_date, end_date):
-            try:
-                tide_data, month_notes = get_tide_data(station_id, date)
-                all_tide_data.append(tide_data)
-                
-                if notes is None:
-                    notes = month_notes
-            except Exception as e:
-                print(f"Error getting tide data for station {station_id} on {date}: {e}")
-                station_with_error = station_id
-                continue
-        if station_with_error:
-            continue
+        for date in dates:
+            with open(_part_path(station_id, date), 'rb') as f:
+                tide_data, month_notes = pickle.load(f)
+            all_tide_data.append(tide_data)
+            if notes is None:
+                notes = month_notes
         combined_tide_data = pd.concat(all_tide_data)
-        
+
         # Convert index to list, handling both RangeIndex and DatetimeIndex
         if isinstance(combined_tide_data.index, pd.DatetimeIndex):
             index = combined_tide_data.index.strftime('%Y-%m-%d %H:%M:%S').tolist()
         else:
             index = combined_tide_data.index.tolist()
-        
+
         tide_data_dict = {
             'index': index,
             'data': combined_tide_data.to_dict(orient='list')
         }
-        
+
         all_station_data[station_id] = {
             'metadata': {
                 'station_id': station_id,
@@ -59,24 +81,16 @@ def save_tide_data(station_ids, start_date, end_date):
             },
             'tide_data': tide_data_dict
         }
-        
-        print(f"Processed data for station {station_id}")
-    
+
+        logger.info(f"Processed data for station {station_id}")
+
     # Save all station data to a single file
     file_path = f'tide_data/all_stations_{start_date}_{end_date}.pkl'
-    
+
     with open(file_path, 'wb') as f:
         pickle.dump(all_station_data, f, protocol=pickle.HIGHEST_PROTOCOL)
-    
-    print(f"Saved data for all stations to {file_path}")
-
-# Example usage
-station_ids = get_available_station_numbers("hourly")
-# station_ids = ['117','118', '119']  # Add all your station IDs here
-start_date = "202401"
-end_date = "202612"
 
-save_tide_data(station_ids, start_date, end_date)
+    logger.info(f"Saved data for all stations to {file_path}")
 
 def load_tide_data(station_id):
     file_path = f'tide_data/all_stations_{start_date}_{end_date}.pkl'
@@ -115,4 +129,16 @@ def plot_tide_data(station_id):
     plt.show()
 
 
-# plot_tide_data("119")
\ No newline at end of file
+# plot_tide_data("119")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Download monthly tide predictions for all stations")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent requests")
+    parser.add_argument("--rate", type=float, default=4.0, help="Requests per second")
+    parser.add_argument("--restart", action="store_true", help="Ignore the manifest of a previous run")
+    args = parser.parse_args()
+    fetcher = BulkFetcher(max_workers=args.workers, rate_per_host=args.rate)
+    station_ids = get_available_station_numbers("hourly", fetcher=fetcher)
+    # station_ids = ['117','118', '119']  # Add all your station IDs here
+    save_tide_data(station_ids, start_date, end_date, fetcher=fetcher, restart=args.restart)
\ No newline at end of file
@@ -1,231 +1,175 @@
-from datetime import datetime
-import io
-import requests
-import pandas as pd
-import json
-import pickle
+import argparse
+import logging
+import threading
+from time import time
+
+import numpy as np
+
 from bs4 import BeautifulSoup
-from collections import defaultdict
+
+from utils.bulk_fetch import BulkFetcher, Manifest
+from utils.station_store import StationStore, line_offsets, parse_fd_csv
+
+logger = logging.getLogger(__name__)
 
 # Base URL where the CSV files are hosted
 base_url = "https://uhslc.soest.hawaii.edu/data/csv/fast/"
-output_json_path = "_sea_level_data_single_date_all_v2.json"
-output_pickle_path = "_sea_level_data_single_date_all_v2.pkl"
+# FD values up to a couple of months old can still be revised, so a delta refresh re-reads this window
+REFRESH_REWIND = 90 * 86400
+
 
-# Function to fetch and process a CSV file from the URL
-def fetch_and_process_station_data(station_number, frequency):
+# Function to fetch a station's CSV and parse it into (epoch seconds, sea level) arrays
+def fetch_and_process_station_data(fetcher, station_number, frequency):
     url = f"{base_url+frequency}/{station_number}.csv"
-    response = requests.get(url)
-    
+    response = fetcher.get(url)
+
     # Check if the file is accessible
     if response.status_code != 200:
-        print(f"Error fetching data for station {station_number}")
-        return None
-    
-    # Load CSV data into a pandas DataFrame
-    csv_data = pd.read_csv(io.StringIO(response.text), header=None)
-    
-    # Rename the columns
-    if frequency == "hourly":
-        csv_data.columns = ['Year', 'Month', 'Day', 'Hour', 'Sea_Level']
-    elif frequency == "daily":
-        csv_data.columns = ['Year', 'Month', 'Day', 'Sea_Level']
-    
-    
-    # Create a nested dictionary structure: Year -> Month -> Day -> list of (Hour, Sea_Level)
-    station_data = defaultdict(list)
-    for i, row in csv_data.iterrows():
-        if frequency == "hourly":
-            year, month, day, hour, sea_level = row
-        elif frequency == "daily":
-            year, month, day, sea_level = row
-        if i == 0:
-            if frequency == "hourly":
-                start_date = datetime(year, month, day, hour).strftime("%Y%m%d%H")
-            elif frequency == "daily":
-                start_date = datetime(year, month, day).strftime("%Y%m%d")
-            # start_date = str(year)+str(month)+str(day)+str(hour)
-        station_data["sea_level_data"].append(sea_level)
-        station_data["start_date"] = start_date
-        # station_data["station_id"] = station_number[1:]  # remove the h or d
-
-    # Create a nested dictionary structure: Year -> Month -> Day -> list of (Hour, Sea_Level)
-    # station_data = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
-    # for _, row in csv_data.iterrows():
-    #     year, month, day, hour, sea_level = row
-    #     station_data[year][month][day].append([hour, sea_level])
-    
-    return station_data
-
-# Function to merge the data into the overall structure
-def merge_station_data(all_data, station_number, station_data, frequency):
-    all_data[frequency][station_number] = station_data
+        logger.error(f"Error fetching data for station {station_number}: HTTP {response.status_code}")
+        return None, response
+
+    return parse_fd_csv(response.content, frequency), response
+
+
+def source_fields(response, times, offsets, offset_base=0):
+    """Index fields that let the next refresh fetch only what changed"""
+    if len(times) == 0:
+        return {}
+    rewind_row = int(np.searchsorted(times, times[-1] - REFRESH_REWIND))
+    content_range = response.headers.get("Content-Range", "")
+    total = content_range.rsplit("/", 1)[-1] if content_range else None
+    return {
+        "last_time": int(times[-1]),
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "content_length": int(total) if total and total.isdigit() else offset_base + len(response.content),
+        "rewind_offset": offset_base + int(offsets[rewind_row]),
+        "refreshed_at": int(time()),
+    }
+
 
 # Function to scrape available station file names from the webpage
-def get_available_station_numbers(frequency="hourly"):
-    response = requests.get(base_url+frequency+"/")
+def get_available_station_numbers(frequency="hourly", fetcher=None):
+    response = (fetcher or BulkFetcher()).get(base_url+frequency+"/")
     soup = BeautifulSoup(response.content, 'html.parser')
-    
+
     # Find all href elements that match the pattern hXXX.csv (where XXX is a three-digit station number)
     station_files = []
-    total_size = 0
     for link in soup.find_all('a'):
-        # info_text = link.next_sibling.strip()
-        # if info_text:
-        #     size_text = info_text.split()[-1]
-        #     if size_text.isdigit():
-        #         total_size += int(size_text)
-        # if total_size/1024/1024 > 512:
-        #     print(f"Station {href.replace('.csv', '')} should be carried over to a new file")
         href = link.get('href')
         startswith = href.startswith('h') if frequency == "hourly" else href.startswith('d')
         if href and startswith and href.endswith('.csv'):
             station_files.append(href.replace('.csv', ''))  # Extract station number (e.g., h001)
-    print(f"Total size of all files: {total_size/1024/1024} MB")
     return station_files
 
-# Main function to download all stations and save to JSON and Pickle
-def download_and_save_all_stations(frequency="hourly"):
-    all_data = {frequency: {}}
+
+# Main function to download all stations into the packed station store
+def download_and_save_all_stations(frequency="hourly", station_numbers=None, fetcher=None, restart=False):
+    store = StationStore(frequency=frequency)
+    fetcher = fetcher or BulkFetcher()
+    manifest_path = store.dir / "manifest.json"
+    if restart:
+        manifest_path.unlink(missing_ok=True)
+    manifest = Manifest(manifest_path)
 
     # Fetch all available station numbers from the base url
-    station_numbers = get_available_station_numbers(frequency=frequency)
-    # station_numbers = ["h001","h002","h003","h004","h057"] # For prototyping, getting only
-    #  individual stations
-    # station_numbers = ["h001","h002","h003"]
-
-    for station_number in station_numbers:
-        print(f"Processing station {station_number}...")
-        station_data = fetch_and_process_station_data(station_number, frequency=frequency)
-        
-        if station_data:
-            # Merge the station data into the overall structure
-            merge_station_data(all_data, station_number[1:], station_data, frequency)
-    
-    # Save to JSON
-    with open(frequency+output_json_path, 'w') as json_file:
-        json.dump(all_data, json_file, separators=(',', ':'))
-    
-    # Save to Pickle
-    with open(frequency+output_pickle_path, 'wb') as pickle_file:
-        pickle.dump(all_data, pickle_file, protocol=pickle.DEFAULT_PROTOCOL)
-    
-    print(f"Data saved to {output_json_path} and {output_pickle_path}")
-
-def download_and_save_all_stations_chunked(chunk_size=5):
-    all_data = {}
-        # Fetch all available station numbers from the base url
-    station_numbers = get_available_station_numbers()
-    station_numbers = ["h001","h002","h003","h004","h057"] # For prototyping, getting only
-    #  individual stations
-    # station_numbers = ["h057"]
-
-    for station_number in station_numbers:
-        print(f"Processing station {station_number}...")
-        station_data = fetch_and_process_station_data(station_number)
-        
-        if station_data:
-            # Merge the station data into the overall structure
-            merge_station_data(all_data, station_number, station_data)
-
-    # Function to calculate the size of a JSON string
-    def get_json_size(data):
-        return len(json.dumps(data, separators=(',', ':')).encode('utf-8'))
-
-    # Initialize variables for file splitting
-    max_file_size = chunk_size * 1024 * 1024 # chunk size in bytes
-    current_file_data = {}
-    file_counter = 1
-
-    for station_number, station_data in all_data.items():
-        # Check if adding this station would exceed the file size limit
-        if get_json_size(current_file_data) + get_json_size({station_number: station_data}) > max_file_size:
-            # Save current file and start a new one
-            output_json_path = f"sea_level_data_combined_{file_counter}.json"
-            with open(output_json_path, 'w') as json_file:
-                json.dump(current_file_data, json_file, separators=(',', ':'))
-            print(f"Data saved to {output_json_path}")
-            
-            # Reset for next file
-            current_file_data = {}
-            file_counter += 1
-
-        # Add station data to current file
-        current_file_data[station_number] = station_data
-
-    # Save any remaining data
-    if current_file_data:
-        output_json_path = f"sea_level_data_combined_{file_counter}.json"
-        with open(output_json_path, 'w') as json_file:
-            json.dump(current_file_data, json_file, separators=(',', ':'))
-        print(f"Data saved to {output_json_path}")
-
-def load_and_process_data():
-    """
-    Helper function to load and display the data for testing
+    station_numbers = station_numbers or get_available_station_numbers(frequency=frequency, fetcher=fetcher)
+
+    def work(station_number):
+        station_data, response = fetch_and_process_station_data(fetcher, station_number, frequency)
+        if station_data is None:
+            # A missing file won't appear on a retry; anything else is tried again next run
+            return {"status": response.status_code} if response.status_code == 404 else None
+        times, values = station_data
+        fields = source_fields(response, times, line_offsets(response.content))
+        length = store.ingest(station_number[1:], times, values, **fields)  # remove the h or d
+        return {"length": length, "bytes": len(response.content)}
+
+    summary = fetcher.run(station_numbers, work, manifest=manifest)
+    logger.info(f"Packed stations into {store.dir}: {summary}")
+    return summary
+
+
+def refresh_station(fetcher, store, station_number, frequency):
+    """Bring one packed station up to date, downloading only the tail of its CSV when possible.
+
+    Returns "unchanged" when the source still has the same ETag/Last-Modified,
+    "appended" when only the rewind window and new rows were fetched, and
+    "full" when the whole file had to be downloaded again.
     """
-    from datetime import datetime
-
-    with open('hourly_sea_level_data_combined.json', 'r') as f:
-        sea_level_data = json.load(f)
-
-    station_id = "h057"
-    station_data = sea_level_data.get(station_id, {})
-
-    # Prepare data for plotting
-    dates = []
-    all_records = []
-
-    # for station, years in station_data.items():
-    for year, months in station_data.items():
-        for month, days in months.items():
-            for day, hours in days.items():
-                for hour, sea_level in hours:
-                    timestamp = datetime(int(year), int(month), int(day), int(hour))
-                    all_records.append({
-                        'station': station_id,
-                        'timestamp': timestamp,
-                        'sea_level': sea_level
-                    })
-    df = pd.DataFrame(all_records)
-    
-    df.set_index('timestamp', inplace=True)
-
-    return df
-
-def plot_sea_level_data(df):
-    import numpy as np
-    import matplotlib.pyplot as plt
-
-    # Group by station and plot
-    # for station in df['station'].unique():
-    #     station_data = df[df['station'] == station]
-    #     plt.figure(figsize=(12, 6))
-    #     plt.plot(station_data.index, station_data['sea_level'])
-    #     plt.title(f'Sea Level Data for Station {station}')
-    #     plt.xlabel('Date')
-    #     plt.ylabel('Sea Level')
-    #     plt.grid(True)
-    #     plt.tight_layout()
-    #     plt.savefig(f'sea_level_plot_{station}.png')
-    #     plt.close()
-
-    plt.figure(figsize=(12, 6))
-    plt.plot(df.index, df['sea_level'])
-    plt.title(f'Sea Level Data for Station')
-    plt.xlabel('Date')
-    plt.ylabel('Sea Level')
-    plt.grid(True)
-    plt.tight_layout()
-    plt.savefig(f'sea_level_plot_.png')
-    plt.close()
-
-
-# Download and save data for all available stations
-# download_and_save_all_stations(frequency="hourly")
-download_and_save_all_stations(frequency="hourly")
-# download_and_save_all_stations_chunked(chunk_size=4)
-# print
-# df = load_and_process_data()
-# plot_sea_level_data(df)
-# get_available_station_numbers()
\ No newline at end of file
+    station_id = station_number[1:]
+    url = f"{base_url+frequency}/{station_number}.csv"
+    entry = store.index.get(station_id, {})
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    elif entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    if "rewind_offset" in entry:
+        headers["Range"] = f"bytes={entry['rewind_offset']}-"
+
+    response = fetcher.get(url, headers=headers)
+    if response.status_code == 304:
+        store.update_entry(station_id, refreshed_at=int(time()))
+        return "unchanged"
+    total = response.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+    if response.status_code == 206 and total.isdigit() and int(total) >= entry.get("content_length", 0):
+        times, values = parse_fd_csv(response.content, frequency)
+        fields = source_fields(response, times, line_offsets(response.content), entry["rewind_offset"])
+        store.append(station_id, times, values, **fields)
+        return "appended"
+
+    # No usable partial response (new station, or the file shrank); a 200 already is the whole file
+    if response.status_code != 200:
+        response = fetcher.get(url)
+    if response.status_code != 200:
+        logger.error(f"Error fetching data for station {station_number}: HTTP {response.status_code}")
+        return None
+    times, values = parse_fd_csv(response.content, frequency)
+    store.ingest(station_id, times, values, **source_fields(response, times, line_offsets(response.content)))
+    return "full"
+
+
+def refresh_all_stations(frequency="hourly", station_numbers=None, fetcher=None):
+    """Incrementally update an existing store instead of rebuilding it"""
+    store = StationStore(frequency=frequency)
+    fetcher = fetcher or BulkFetcher()
+    station_numbers = station_numbers or get_available_station_numbers(frequency=frequency, fetcher=fetcher)
+    modes = {}
+    modes_lock = threading.Lock()
+
+    def work(station_number):
+        mode = refresh_station(fetcher, store, station_number, frequency)
+        if mode is None:
+            return None
+        with modes_lock:
+            modes[mode] = modes.get(mode, 0) + 1
+        return {"mode": mode}
+
+    summary = fetcher.run(station_numbers, work)
+    summary.update(modes)
+    logger.info(f"Refreshed stations in {store.dir}: {summary}")
+    return summary
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Download UHSLC FD sea level CSVs into the packed station store")
+    parser.add_argument("--frequency", choices=["hourly", "daily"], default="hourly")
+    parser.add_argument("--stations", nargs="*", help="Station files to fetch, e.g. h001 h057 (default: all)")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent downloads")
+    parser.add_argument("--rate", type=float, default=4.0, help="Requests per second per host")
+    parser.add_argument("--restart", action="store_true", help="Ignore the manifest of a previous run")
+    parser.add_argument("--update", action="store_true",
+                        help="Only fetch stations that changed and append their new data")
+    args = parser.parse_args()
+    fetcher = BulkFetcher(max_workers=args.workers, rate_per_host=args.rate)
+    if args.update:
+        refresh_all_stations(frequency=args.frequency, station_numbers=args.stations, fetcher=fetcher)
+    else:
+        download_and_save_all_stations(
+            frequency=args.frequency,
+            station_numbers=args.stations,
+            fetcher=fetcher,
+            restart=args.restart,
+        )
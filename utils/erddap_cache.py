@@ -0,0 +1,241 @@
+"""
+Shared read-through cache for UHSLC ERDDAP Fast Delivery sea level queries.
+
+Imported both by the app and inside the interpreter kernels (through
+`get_sea_level_data` in custom_tool), so every session shares one on-disk
+cache under data/cache/erddap. Each (dataset, station) pair is one .npz file
+holding the cached samples and the time ranges they cover. A request only
+downloads the parts of its range that are not covered yet, and the new rows
+are merged into the file.
+
+Samples that were older than the FD lag (about two months) when they were
+fetched rarely change and are kept for STABLE_TTL. Newer samples are
+refreshed after RECENT_TTL. When the cache grows past its byte budget, the least recently
+used station files are deleted.
+"""
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from io import StringIO
+from pathlib import Path
+from time import time
+
+import numpy as np
+import pandas as pd
+import requests
+
+ERDDAP_BASE_URL = os.getenv("ERDDAP_BASE_URL", "https://uhslc.soest.hawaii.edu/erddap/tabledap")
+CACHE_DIR = Path(os.getenv("ERDDAP_CACHE_DIR", "data/cache/erddap"))
+CACHE_MAX_BYTES = int(os.getenv("ERDDAP_CACHE_MAX_MB", "1024")) * 1024 * 1024
+
+DATASETS = {"hourly": "global_hourly_fast", "daily": "global_daily_fast"}
+MISSING_VALUE = -32767
+FD_LAG = 62 * 86400  # FD data is 1-2 months behind, newer values may still arrive
+RECENT_TTL = 6 * 3600
+STABLE_TTL = 30 * 86400
+STATS_FILE = "stats.json"
+
+
+def _to_epoch(value):
+    """Seconds since 1970 for a date string, datetime or Timestamp (UTC assumed)"""
+    stamp = pd.Timestamp(value)
+    if stamp.tzinfo is None:
+        stamp = stamp.tz_localize("UTC")
+    return int(stamp.timestamp())
+
+
+def _iso(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _merge_ranges(ranges):
+    """Merge adjacent or overlapping [start, end, fetched_at] ranges from the same fetch"""
+    merged = []
+    for start, end, fetched_at in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1 and fetched_at == merged[-1][2]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end, fetched_at])
+    return merged
+
+
+class ErddapCache:
+    def __init__(self, cache_dir=CACHE_DIR, base_url=ERDDAP_BASE_URL, max_bytes=CACHE_MAX_BYTES,
+                 session=None, timeout=60):
+        self.cache_dir = Path(cache_dir)
+        self.base_url = base_url.rstrip("/")
+        self.max_bytes = max_bytes
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def _locked(self, name):
+        # Kernels in different processes share the cache, so serialize per file
+        with open(self.cache_dir / f"{name}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self, path):
+        if not path.exists():
+            return np.empty(0, np.int64), np.empty(0, np.int32), []
+        with np.load(path) as data:
+            return data["time"], data["sea_level"], data["ranges"].tolist()
+
+    def _save(self, path, times, values, ranges):
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(tmp, time=times, sea_level=values, ranges=np.array(ranges, dtype=np.int64).reshape(-1, 3))
+        os.replace(tmp, path)
+
+    def _fresh(self, ranges, now):
+        """Parts of the cached ranges that are still within their TTL.
+
+        Samples more than FD_LAG older than the fetch were already final and
+        keep for STABLE_TTL; newer ones were provisional and keep for RECENT_TTL.
+        """
+        fresh = []
+        for start, end, fetched_at in ranges:
+            boundary = fetched_at - FD_LAG
+            if start < boundary and now - fetched_at < STABLE_TTL:
+                fresh.append([start, min(end, boundary - 1), fetched_at])
+            if end >= boundary and now - fetched_at < RECENT_TTL:
+                fresh.append([max(start, boundary), end, fetched_at])
+        return fresh
+
+    def _missing(self, start, end, ranges):
+        """Sub-ranges of [start, end] not covered by `ranges`"""
+        missing, cursor = [], start
+        for range_start, range_end, _ in ranges:
+            if range_end < cursor or range_start > end:
+                continue
+            if range_start > cursor:
+                missing.append((cursor, range_start - 1))
+            cursor = max(cursor, range_end + 1)
+            if cursor > end:
+                break
+        if cursor <= end:
+            missing.append((cursor, end))
+        return missing
+
+    def _fetch(self, dataset, station_id, start, end):
+        url = (
+            f"{self.base_url}/{dataset}.csvp?sea_level%2Ctime"
+            f"&time%3E={_iso(start)}&time%3C={_iso(end)}&uhslc_id={int(station_id)}"
+        )
+        response = self.session.get(url, timeout=self.timeout)
+        if response.status_code == 404 and "no matching results" in response.text.lower():
+            return np.empty(0, np.int64), np.empty(0, np.int32), 0
+        response.raise_for_status()
+        frame = pd.read_csv(StringIO(response.text))
+        frame.columns = ["sea_level", "time"]
+        times = (
+            pd.to_datetime(frame["time"], utc=True).dt.tz_localize(None)
+            .to_numpy("datetime64[s]").astype(np.int64)
+        )
+        values = frame["sea_level"].fillna(MISSING_VALUE).to_numpy(np.int32)
+        return times, values, len(response.content)
+
+    def get(self, frequency, station_id, start, end):
+        """Return (time seconds int64, sea level int32 with MISSING_VALUE) for [start, end]"""
+        dataset = DATASETS[frequency]
+        start, end = _to_epoch(start), _to_epoch(end)
+        if start > end:
+            raise ValueError(f"start ({start}) is after end ({end})")
+        name = f"{dataset}_{int(station_id):03d}"
+        path = self.cache_dir / f"{name}.npz"
+        now = int(time())
+        fetched_bytes = 0
+
+        with self._locked(name):
+            times, values, ranges = self._load(path)
+            ranges = _merge_ranges(self._fresh(ranges, now))
+            missing = self._missing(start, end, ranges)
+            for gap_start, gap_end in missing:
+                new_times, new_values, size = self._fetch(dataset, station_id, gap_start, gap_end)
+                fetched_bytes += size
+                keep = (times < gap_start) | (times > gap_end)
+                times = np.concatenate([times[keep], new_times])
+                values = np.concatenate([values[keep], new_values])
+                ranges.append([gap_start, gap_end, now])
+            if missing:
+                order = np.argsort(times, kind="stable")
+                times, values = times[order], values[order]
+                self._save(path, times, values, _merge_ranges(ranges))
+            elif path.exists():
+                os.utime(path)  # LRU bookkeeping uses mtime
+
+        missing_span = sum(gap_end - gap_start + 1 for gap_start, gap_end in missing)
+        self._record(hit=not missing, partial=0 < missing_span < end - start + 1, fetched_bytes=fetched_bytes)
+        if missing:
+            self._enforce_budget()
+        lo = np.searchsorted(times, start, side="left")
+        hi = np.searchsorted(times, end, side="right")
+        return times[lo:hi], values[lo:hi]
+
+    def _record(self, hit, partial, fetched_bytes):
+        with self._locked("stats"):
+            path = self.cache_dir / STATS_FILE
+            try:
+                stats = json.loads(path.read_text())
+            except (OSError, ValueError):
+                stats = {"hits": 0, "partial_hits": 0, "misses": 0, "fetched_bytes": 0}
+            if hit:
+                stats["hits"] += 1
+            elif partial:
+                stats["partial_hits"] += 1
+            else:
+                stats["misses"] += 1
+            stats["fetched_bytes"] += fetched_bytes
+            path.write_text(json.dumps(stats))
+
+    def _enforce_budget(self):
+        """Delete least recently used station files until the cache fits its budget"""
+        files = [(p.stat().st_mtime, p.stat().st_size, p) for p in self.cache_dir.glob("*.npz")]
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            with self._locked(path.stem):
+                path.unlink(missing_ok=True)
+            total -= size
+
+    def get_stats(self):
+        try:
+            stats = json.loads((self.cache_dir / STATS_FILE).read_text())
+        except (OSError, ValueError):
+            stats = {"hits": 0, "partial_hits": 0, "misses": 0, "fetched_bytes": 0}
+        files = list(self.cache_dir.glob("*.npz"))
+        stats["cached_series"] = len(files)
+        stats["cached_bytes"] = sum(p.stat().st_size for p in files)
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ErddapCache()
+    return _default_cache
+
+
+def get_sea_level_data(station_id, start, end, frequency="hourly"):
+    """Hourly or daily FD sea level (mm, Station Zero) for a station as a DataFrame.
+
+    Columns are `sea_level` (float, NaN where missing) and `time` (UTC),
+    matching what reading the ERDDAP csvp URL directly would give.
+    """
+    times, values = get_default_cache().get(frequency, station_id, start, end)
+    sea_level = values.astype(np.float64)
+    sea_level[values == MISSING_VALUE] = np.nan
+    return pd.DataFrame({
+        "sea_level": sea_level,
+        "time": pd.to_datetime(times, unit="s", utc=True),
+    })
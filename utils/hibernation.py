@@ -0,0 +1,142 @@
+import logging
+from pathlib import Path
+from time import time
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = ".hibernate"
+MANIFEST = "manifest.json"
+
+# Runs inside the session's kernel. Arrays go to .npy (memory-mapped on
+# resume), dataframes to parquet, xarray objects to netCDF and anything else
+# that pickles to a pickle. Modules, functions, classes and private names are
+# skipped; so is anything that would take the snapshot over max_bytes.
+_KERNEL_TOOL = r'''
+def _sea_snapshot_size(value):
+    import sys
+    np, pd, xr = (sys.modules.get(m) for m in ("numpy", "pandas", "xarray"))
+    if np is not None and isinstance(value, np.ndarray):
+        return value.nbytes
+    if pd is not None and isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=False).sum()) if isinstance(value, pd.DataFrame) else value.nbytes
+    if xr is not None and isinstance(value, (xr.Dataset, xr.DataArray)):
+        return value.nbytes
+    return 0
+
+def _sea_snapshot_save(value, base):
+    import os, pickle, sys
+    np, pd, xr = (sys.modules.get(m) for m in ("numpy", "pandas", "xarray"))
+    if np is not None and isinstance(value, np.ndarray) and value.dtype != object:
+        np.save(base + ".npy", value, allow_pickle=False)
+        return "npy", base + ".npy"
+    if pd is not None and isinstance(value, pd.DataFrame):
+        try:
+            value.to_parquet(base + ".parquet")
+            return "parquet", base + ".parquet"
+        except Exception:
+            pass
+    if xr is not None and isinstance(value, (xr.Dataset, xr.DataArray)):
+        try:
+            value.to_netcdf(base + ".nc")
+            return ("netcdf" if isinstance(value, xr.Dataset) else "netcdf-array"), base + ".nc"
+        except Exception:
+            pass
+    with open(base + ".pkl", "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return "pickle", base + ".pkl"
+
+def _sea_hibernate(path, max_bytes):
+    import json, os, shutil, types
+    skip_types = (types.ModuleType, types.FunctionType, types.BuiltinFunctionType, type)
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    saved, skipped, total = [], [], 0
+    for name, value in list(globals().items()):
+        if name.startswith("_") or name in ("In", "Out", "exit", "quit", "get_ipython") or isinstance(value, skip_types):
+            continue
+        if total + _sea_snapshot_size(value) > max_bytes:
+            skipped.append(name)
+            continue
+        try:
+            kind, file = _sea_snapshot_save(value, os.path.join(tmp, name))
+        except Exception:
+            skipped.append(name)
+            continue
+        size = os.path.getsize(file)
+        if total + size > max_bytes:
+            os.remove(file)
+            skipped.append(name)
+            continue
+        total += size
+        saved.append({"name": name, "kind": kind, "file": os.path.basename(file)})
+    with open(os.path.join(tmp, "manifest.json"), "w") as f:
+        json.dump({"variables": saved, "skipped": skipped, "bytes": total}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    print(json.dumps({"saved": len(saved), "skipped": skipped, "bytes": total}))
+
+def _sea_resume(path):
+    import json, os, pickle
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+    restored = []
+    for item in manifest["variables"]:
+        file = os.path.join(path, item["file"])
+        try:
+            if item["kind"] == "npy":
+                import numpy as np
+                # Copy-on-write mapping: pages load on first touch and stay writable
+                value = np.load(file, mmap_mode="c")
+            elif item["kind"] == "parquet":
+                import pandas as pd
+                value = pd.read_parquet(file)
+            elif item["kind"] == "netcdf":
+                import xarray as xr
+                value = xr.load_dataset(file)
+            elif item["kind"] == "netcdf-array":
+                import xarray as xr
+                value = xr.load_dataarray(file)
+            else:
+                with open(file, "rb") as f:
+                    value = pickle.load(f)
+        except Exception:
+            continue
+        globals()[item["name"]] = value
+        restored.append(item["name"])
+    print(json.dumps({"restored": restored}))
+'''
+
+
+def snapshot_path(static_dir, session_id):
+    return (Path(static_dir) / session_id / SNAPSHOT_DIR).resolve()
+
+
+def snapshot_age(path):
+    """Seconds since the snapshot at `path` was written, or None if there is none"""
+    try:
+        return time() - (Path(path) / MANIFEST).stat().st_mtime
+    except OSError:
+        return None
+
+
+def _run(interpreter, code):
+    output = interpreter.computer.run("python", code)
+    return "".join(
+        str(chunk.get("content", "")) for chunk in output or [] if isinstance(chunk, dict)
+    ).strip()
+
+
+def hibernate(interpreter, path, max_bytes):
+    """Serialize the kernel's user namespace to an on-disk snapshot at `path`"""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    result = _run(interpreter, f"{_KERNEL_TOOL}\n_sea_hibernate({str(path)!r}, {int(max_bytes)})")
+    logger.info(f"Hibernated kernel to {path}: {result}")
+    return result
+
+
+def resume(interpreter, path):
+    """Load a snapshot written by hibernate() into the interpreter's kernel"""
+    result = _run(interpreter, f"{_KERNEL_TOOL}\n_sea_resume({str(path)!r})")
+    logger.info(f"Resumed kernel from {path}: {result}")
+    return result
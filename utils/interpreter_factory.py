@@ -0,0 +1,34 @@
+import os
+
+from interpreter.core.core import OpenInterpreter
+
+from utils.custom_functions import custom_tool
+from utils.system_prompt import sys_prompt
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-2024-11-20")
+# OpenAI-compatible endpoint to use instead of OpenAI (e.g. the benchmark's stub LLM)
+LLM_API_BASE = os.getenv("LLM_API_BASE")
+
+
+def create_interpreter() -> OpenInterpreter:
+    """Create a fully initialized interpreter with its kernel started"""
+    interpreter = OpenInterpreter()
+    interpreter.system_message += sys_prompt
+    interpreter.llm.model = LLM_MODEL
+    if LLM_API_BASE:
+        interpreter.llm.api_base = LLM_API_BASE
+    interpreter.llm.temperature = 0.2
+    # Setting to maximim for gpt-4o as per documentation
+    # https://platform.openai.com/docs/models#gpt-4o
+    interpreter.llm.context_window = 128000
+    interpreter.llm.max_tokens = 16383
+    interpreter.max_output = 16383
+    
+    if not LLM_API_BASE:
+        # Budget is priced against OpenAI's model list, which other endpoints aren't in
+        interpreter.llm.max_budget = 0.03
+    interpreter.computer.import_computer_api = False
+    interpreter.computer.run("python", custom_tool)
+    interpreter.llm.supports_functions = True
+    interpreter.auto_run = True
+    return interpreter
@@ -0,0 +1,108 @@
+import logging
+import queue
+import threading
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+
+class InterpreterPool:
+    """Keeps a number of fully initialized interpreters ready to hand out.
+
+    `factory` is a zero-argument callable returning a ready interpreter
+    (system prompt applied, kernel started, custom tools loaded). Refilling
+    happens on a background thread so callers never wait for a kernel to
+    start unless the pool is empty.
+    """
+
+    def __init__(self, factory, size=2):
+        self.factory = factory
+        self.size = max(0, int(size))
+        self._ready = queue.Queue()
+        self._refill_needed = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "refills": 0,
+            "refill_errors": 0,
+            "refill_time_total": 0.0,
+            "refill_time_last": 0.0,
+        }
+
+    def start(self):
+        """Start the background refill thread"""
+        if self.size == 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._refill_loop, name="interpreter-pool", daemon=True
+        )
+        self._thread.start()
+        self._refill_needed.set()
+
+    def stop(self):
+        """Stop refilling and shut down all idle interpreters"""
+        self._stopped.set()
+        self._refill_needed.set()
+        while True:
+            try:
+                interpreter = self._ready.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                interpreter.reset()
+            except Exception as e:
+                logger.error(f"Error shutting down pooled interpreter: {str(e)}")
+
+    def acquire(self):
+        """Return a ready interpreter, creating one inline if the pool is empty"""
+        try:
+            interpreter = self._ready.get_nowait()
+            with self._lock:
+                self.stats["hits"] += 1
+        except queue.Empty:
+            with self._lock:
+                self.stats["misses"] += 1
+            logger.info("Interpreter pool empty, creating interpreter inline")
+            interpreter = self.factory()
+        self._refill_needed.set()
+        return interpreter
+
+    def _refill_loop(self):
+        while not self._stopped.is_set():
+            self._refill_needed.wait()
+            self._refill_needed.clear()
+            while not self._stopped.is_set() and self._ready.qsize() < self.size:
+                started = perf_counter()
+                try:
+                    interpreter = self.factory()
+                except Exception as e:
+                    logger.error(f"Error pre-warming interpreter: {str(e)}")
+                    with self._lock:
+                        self.stats["refill_errors"] += 1
+                    # Back off instead of spinning on a broken factory
+                    self._stopped.wait(30)
+                    break
+                elapsed = perf_counter() - started
+                with self._lock:
+                    self.stats["refills"] += 1
+                    self.stats["refill_time_total"] += elapsed
+                    self.stats["refill_time_last"] = elapsed
+                if self._stopped.is_set():
+                    interpreter.reset()
+                    break
+                self._ready.put(interpreter)
+                logger.info(f"Pre-warmed interpreter in {elapsed:.2f}s "
+                            f"({self._ready.qsize()}/{self.size} ready)")
+
+    def get_stats(self):
+        """Return a snapshot of the pool metrics"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["size"] = self.size
+        stats["ready"] = self._ready.qsize()
+        refills = stats["refills"]
+        stats["refill_time_avg"] = stats["refill_time_total"] / refills if refills else 0.0
+        return stats
@@ -0,0 +1,203 @@
+import asyncio
+import gzip
+import json
+import logging
+import uuid
+import zlib
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+HISTORY_PREFIX = "history:"
+HISTORY_USAGE_PREFIX = "history_usage:"
+HISTORY_OUTPUTS_PREFIX = "history_outputs:"
+# Older deployments stored the whole conversation as one JSON string under this key
+LEGACY_MESSAGES_PREFIX = "messages:"
+
+# Message types whose payloads can be large (code and its console output)
+OUTPUT_TYPES = ("console", "code")
+# Of those, only console output is dropped when a session goes over its budget
+EVICTABLE_TYPES = ("console",)
+OFFLOAD_DIR = ".history"
+COMPRESSED_MARKER = b"Z"
+EVICTED_CONTENT = "[Output removed to keep this session within its storage budget]"
+
+
+def history_keys(session_id):
+    """All Redis keys holding a session's history"""
+    return [
+        f"{HISTORY_PREFIX}{session_id}",
+        f"{HISTORY_USAGE_PREFIX}{session_id}",
+        f"{HISTORY_OUTPUTS_PREFIX}{session_id}",
+        f"{LEGACY_MESSAGES_PREFIX}{session_id}",
+    ]
+
+
+class MessageStore:
+    """Append-only chat history, one Redis list entry per message.
+
+    Each turn only appends the messages it produced, so persisting a turn
+    costs O(turn) rather than O(conversation), and readers can fetch any
+    index range of the history.
+
+    Large `code`/`console` payloads are zlib-compressed above
+    `compress_threshold` bytes and written to a gzip file under
+    `{static_dir}/{session_id}/.history` above `offload_threshold`, leaving
+    a reference in the list. When a session's stored bytes exceed
+    `session_budget`, the oldest console outputs are replaced with a short
+    placeholder until it fits again.
+    """
+
+    def __init__(self, redis, static_dir, compress_threshold=1024,
+                 offload_threshold=64 * 1024, session_budget=None):
+        self.redis = redis
+        self.static_dir = Path(static_dir)
+        self.compress_threshold = compress_threshold
+        self.offload_threshold = offload_threshold
+        self.session_budget = session_budget
+
+    async def append(self, session_id, messages):
+        """Append messages to a session's history and return the new length"""
+        if not messages:
+            return await self.length(session_id)
+        encoded = await asyncio.to_thread(self._encode_all, session_id, messages)
+        key = f"{HISTORY_PREFIX}{session_id}"
+        length = await self.redis.rpush(key, *(entry for entry, _, _ in encoded))
+        first = length - len(encoded)
+
+        redis_bytes = sum(len(entry) for entry, _, _ in encoded)
+        disk_bytes = sum(disk_size for _, disk_size, _ in encoded)
+        outputs = [
+            f"{first + i}|{len(entry)}|{disk_size}|{path or ''}"
+            for i, (entry, disk_size, path) in enumerate(encoded)
+            if messages[i].get("type") in EVICTABLE_TYPES
+        ]
+        async with self.redis.pipeline(transaction=True) as pipe:
+            usage_key = f"{HISTORY_USAGE_PREFIX}{session_id}"
+            pipe.hincrby(usage_key, "redis_bytes", redis_bytes)
+            pipe.hincrby(usage_key, "disk_bytes", disk_bytes)
+            if outputs:
+                pipe.rpush(f"{HISTORY_OUTPUTS_PREFIX}{session_id}", *outputs)
+            await pipe.execute()
+
+        if self.session_budget:
+            await self._enforce_budget(session_id)
+        return length
+
+    async def length(self, session_id):
+        await self._migrate_legacy(session_id)
+        return await self.redis.llen(f"{HISTORY_PREFIX}{session_id}")
+
+    async def get_range(self, session_id, since=0, limit=None):
+        """Return messages [since, since + limit) of a session's history"""
+        await self._migrate_legacy(session_id)
+        end = -1 if limit is None else since + limit - 1
+        if limit is not None and limit <= 0:
+            return []
+        entries = await self.redis.lrange(f"{HISTORY_PREFIX}{session_id}", since, end)
+        return await asyncio.to_thread(lambda: [self._decode(session_id, entry) for entry in entries])
+
+    async def usage(self, session_id):
+        """Storage used by a session's history"""
+        await self._migrate_legacy(session_id)
+        key = f"{HISTORY_PREFIX}{session_id}"
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(f"{HISTORY_USAGE_PREFIX}{session_id}")
+            pipe.llen(key)
+            pipe.llen(f"{HISTORY_OUTPUTS_PREFIX}{session_id}")
+            pipe.memory_usage(key)
+            usage, messages, outputs, memory = await pipe.execute()
+        usage = {k.decode("utf-8"): int(v) for k, v in usage.items()}
+        return {
+            "session_id": session_id,
+            "messages": messages,
+            "evictable_outputs": outputs,
+            "redis_bytes": usage.get("redis_bytes", 0),
+            "redis_memory_bytes": memory or 0,
+            "disk_bytes": usage.get("disk_bytes", 0),
+            "evicted_outputs": usage.get("evicted", 0),
+            "budget_bytes": self.session_budget,
+        }
+
+    async def clear(self, session_id):
+        await self.redis.delete(*history_keys(session_id))
+
+    async def _enforce_budget(self, session_id):
+        """Evict the oldest large outputs until the session fits its budget"""
+        key = f"{HISTORY_PREFIX}{session_id}"
+        usage_key = f"{HISTORY_USAGE_PREFIX}{session_id}"
+        outputs_key = f"{HISTORY_OUTPUTS_PREFIX}{session_id}"
+        while True:
+            redis_bytes, disk_bytes = await self.redis.hmget(usage_key, "redis_bytes", "disk_bytes")
+            if int(redis_bytes or 0) + int(disk_bytes or 0) <= self.session_budget:
+                return
+            record = await self.redis.lpop(outputs_key)
+            if record is None:
+                return
+            index, entry_size, disk_size, path = record.decode("utf-8").split("|")
+            entry = await self.redis.lindex(key, int(index))
+            if entry is None:
+                continue
+            message = await asyncio.to_thread(self._decode, session_id, entry, False)
+            message["content"] = EVICTED_CONTENT
+            stub = json.dumps(message).encode("utf-8")
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.lset(key, int(index), stub)
+                pipe.hincrby(usage_key, "redis_bytes", len(stub) - int(entry_size))
+                pipe.hincrby(usage_key, "disk_bytes", -int(disk_size))
+                pipe.hincrby(usage_key, "evicted", 1)
+                await pipe.execute()
+            if path:
+                await asyncio.to_thread(self._offload_path(session_id, path).unlink, missing_ok=True)
+
+    def _offload_path(self, session_id, name):
+        return self.static_dir / session_id / OFFLOAD_DIR / name
+
+    def _encode_all(self, session_id, messages):
+        return [self._encode(session_id, message) for message in messages]
+
+    def _encode(self, session_id, message):
+        """Return (entry bytes, bytes written to disk, offload file name or None)"""
+        content = message.get("content")
+        if message.get("type") not in OUTPUT_TYPES or not isinstance(content, str):
+            return json.dumps(message).encode("utf-8"), 0, None
+
+        size = len(content.encode("utf-8"))
+        if size > self.offload_threshold:
+            name = f"{uuid.uuid4().hex}.txt.gz"
+            path = self._offload_path(session_id, name)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with gzip.open(path, "wt", encoding="utf-8") as f:
+                f.write(content)
+            reference = dict(message, content=None, offloaded=name, content_bytes=size)
+            return json.dumps(reference).encode("utf-8"), path.stat().st_size, name
+
+        serialized = json.dumps(message).encode("utf-8")
+        if size > self.compress_threshold:
+            return COMPRESSED_MARKER + zlib.compress(serialized), 0, None
+        return serialized, 0, None
+
+    def _decode(self, session_id, entry, load_offloaded=True):
+        if entry[:1] == COMPRESSED_MARKER:
+            return json.loads(zlib.decompress(entry[1:]))
+        message = json.loads(entry)
+        name = message.pop("offloaded", None)
+        if name is not None:
+            message.pop("content_bytes", None)
+            if load_offloaded:
+                try:
+                    with gzip.open(self._offload_path(session_id, name), "rt", encoding="utf-8") as f:
+                        message["content"] = f.read()
+                except OSError:
+                    message["content"] = EVICTED_CONTENT
+        return message
+
+    async def _migrate_legacy(self, session_id):
+        """Convert a whole-conversation JSON blob into list entries, once"""
+        legacy_key = f"{LEGACY_MESSAGES_PREFIX}{session_id}"
+        stored = await self.redis.getdel(legacy_key)
+        if not stored:
+            return
+        messages = json.loads(stored)
+        await self.append(session_id, messages)
+        logger.info(f"Migrated history of session {session_id} to {HISTORY_PREFIX}{session_id}")
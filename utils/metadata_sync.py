@@ -0,0 +1,207 @@
+"""
+Keeps data/metadata/fd_metadata.geojson in sync with the UHSLC metadata API.
+
+fd_metadata.geojson is the subset of meta.geojson whose stations are listed
+by metaapi/select2 (the Fast Delivery stations). Both sources are fetched
+concurrently with conditional GETs, and the last body of each is kept under
+data/cache/metadata_sync, so a source that answers 304 is read from
+disk. When the filtered features differ from the file on disk, the new file
+is written to a temporary path and swapped in with os.replace, the station
+index is rebuilt, and fd_metadata.version is bumped with the ids that were
+added, removed or changed. Kernels read metadata through the station index,
+which notices the new file on their next lookup.
+
+The app runs a sync at startup and every METADATA_SYNC_MINUTES; run
+`python -m utils.fetch_and_process` to sync once from the command line.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+from pathlib import Path
+from time import time
+
+import httpx
+
+from utils.station_index import get_default_index as get_station_index
+from utils.station_index import METADATA_PATH
+
+logger = logging.getLogger(__name__)
+
+METADATA_BASE_URL = os.getenv("METADATA_BASE_URL", "https://uhslc.soest.hawaii.edu")
+SELECT2_URL = f"{METADATA_BASE_URL}/metaapi/select2"
+META_GEOJSON_URL = f"{METADATA_BASE_URL}/data/meta.geojson"
+CACHE_DIR = Path(os.getenv("METADATA_SYNC_CACHE_DIR", "data/cache/metadata_sync"))
+SYNC_INTERVAL = int(os.getenv("METADATA_SYNC_MINUTES", "60")) * 60
+FETCH_TIMEOUT = 60
+STATE_FILE = "state.json"
+SOURCES = {"select2": SELECT2_URL, "meta": META_GEOJSON_URL}
+
+
+def _write_atomic(path, data):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _uhslc_id(value):
+    """Integer station id, or None for an empty or non-numeric one"""
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def filter_features(select2, geojson):
+    """Features of meta.geojson whose uhslc_id is listed by select2, keyed by integer id.
+
+    Unparsable ids are skipped and logged; for duplicate uhslc_ids the first feature is kept.
+    """
+    ids = set()
+    for item in select2["results"]:
+        uhslc_id = _uhslc_id(item.get("id"))
+        if uhslc_id is None:
+            logger.warning(f"Skipping select2 entry with unparsable id {item.get('id')!r}")
+        else:
+            ids.add(uhslc_id)
+    features = {}
+    for feature in geojson["features"]:
+        raw_id = feature.get("properties", {}).get("uhslc_id")
+        uhslc_id = _uhslc_id(raw_id)
+        if uhslc_id is None:
+            logger.warning(f"Skipping meta.geojson feature with unparsable uhslc_id {raw_id!r}")
+        elif uhslc_id in ids:
+            if uhslc_id in features:
+                logger.warning(f"Duplicate uhslc_id {uhslc_id} in meta.geojson, keeping the first feature")
+            else:
+                features[uhslc_id] = feature
+    return features
+
+
+def diff_features(old, new):
+    """Ids added, removed and changed between two {uhslc_id: feature} dicts"""
+    added = sorted(new.keys() - old.keys())
+    removed = sorted(old.keys() - new.keys())
+    changed = sorted(
+        uhslc_id for uhslc_id in new.keys() & old.keys()
+        if json.dumps(new[uhslc_id], sort_keys=True) != json.dumps(old[uhslc_id], sort_keys=True)
+    )
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+class MetadataSync:
+    def __init__(self, output_path=METADATA_PATH, cache_dir=CACHE_DIR, sources=SOURCES, rebuild_index=True):
+        self.output_path = Path(output_path)
+        self.version_path = self.output_path.with_suffix(".version")
+        self.cache_dir = Path(cache_dir)
+        self.sources = dict(sources)
+        self.rebuild_index = rebuild_index
+        self.last_result = None
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _read_json(self, path, default):
+        try:
+            return json.loads(Path(path).read_text())
+        except (OSError, ValueError):
+            return default
+
+    async def _fetch(self, client, name, url, state):
+        """Body of a source, from the network if it changed or from the cache on 304"""
+        cached = self.cache_dir / f"{name}.json"
+        headers = {}
+        if cached.exists():
+            if state.get("etag"):
+                headers["If-None-Match"] = state["etag"]
+            if state.get("last_modified"):
+                headers["If-Modified-Since"] = state["last_modified"]
+        response = await client.get(url, headers=headers)
+        if response.status_code == 304:
+            return False, cached.read_bytes(), state
+        response.raise_for_status()
+        _write_atomic(cached, response.content)
+        return True, response.content, {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "bytes": len(response.content),
+        }
+
+    async def sync(self, client=None):
+        """Fetch both sources and swap in a new fd_metadata.geojson if the FD stations changed"""
+        started = time()
+        with open(self.cache_dir / "sync.lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return {"status": "busy"}  # Another worker is syncing
+            try:
+                return await self._sync(client, started)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    async def _sync(self, client, started):
+        state = self._read_json(self.cache_dir / STATE_FILE, {})
+        owns_client = client is None
+        if owns_client:
+            client = httpx.AsyncClient(timeout=FETCH_TIMEOUT, follow_redirects=True)
+        try:
+            results = await asyncio.gather(*(
+                self._fetch(client, name, url, state.get(name, {})) for name, url in self.sources.items()
+            ))
+        finally:
+            if owns_client:
+                await client.aclose()
+        fetched = {name: result for name, result in zip(self.sources, results)}
+        for name, (_, _, source_state) in fetched.items():
+            state[name] = source_state
+        _write_atomic(self.cache_dir / STATE_FILE, json.dumps(state).encode())
+
+        if not any(modified for modified, _, _ in fetched.values()) and self.output_path.exists():
+            result = {"status": "unchanged"}
+        else:
+            features = filter_features(json.loads(fetched["select2"][1]), json.loads(fetched["meta"][1]))
+            current = self._read_json(self.output_path, {"features": []})
+            on_disk = {_uhslc_id(f["properties"].get("uhslc_id")): f for f in current["features"]}
+            on_disk.pop(None, None)
+            diff = diff_features(on_disk, features)
+            if self.output_path.exists() and not any(diff.values()):
+                result = {"status": "unchanged"}
+            else:
+                self._swap(features, diff)
+                result = {"status": "updated", **{key: len(ids) for key, ids in diff.items()}}
+        result.update(seconds=round(time() - started, 3), checked_at=time())
+        self.last_result = result
+        return result
+
+    def _swap(self, features, diff):
+        output = {"type": "FeatureCollection", "features": [features[uhslc_id] for uhslc_id in sorted(features)]}
+        _write_atomic(self.output_path, json.dumps(output).encode())
+        if self.rebuild_index:
+            try:
+                get_station_index().build()
+            except Exception as e:
+                logger.error(f"Error rebuilding the station index: {str(e)}")
+        version = self._read_json(self.version_path, {}).get("version", 0) + 1
+        _write_atomic(self.version_path, json.dumps({"version": version, "updated_at": time(), **diff}).encode())
+        logger.info(
+            f"fd_metadata.geojson updated to version {version}: {len(diff['added'])} added, "
+            f"{len(diff['removed'])} removed, {len(diff['changed'])} changed"
+        )
+
+    def version(self):
+        return self._read_json(self.version_path, {"version": 0})
+
+    def get_stats(self):
+        return {"last_sync": self.last_result, "version": self.version().get("version", 0)}
+
+
+_default_sync = None
+
+
+def get_default_sync():
+    global _default_sync
+    if _default_sync is None:
+        _default_sync = MetadataSync()
+    return _default_sync
@@ -0,0 +1,292 @@
+"""
+Process-local metrics in the Prometheus text exposition format, plus per-turn
+span timing for /chat.
+
+Each metric is a plain object holding its samples per label set; `render()`
+serializes the registry for the /metrics endpoint. A `ChatTurn` is created for
+every chat turn; it watches the stream chunks to time the first token, token
+rate and code execution, and on `finish()` records them in the histograms and
+writes one structured JSON log line.
+"""
+import json
+import logging
+import sys
+import threading
+from collections import Counter as _Tally
+from time import perf_counter, time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        with self.lock:
+            return self.header() + [
+                f"{self.name}{_label_text(self.labels, key)} {value}" for key, value in self.values.items()
+            ]
+
+
+class Gauge(_Metric):
+    """A gauge whose value is read from a callback when rendered"""
+    kind = "gauge"
+
+    def __init__(self, name, help, read):
+        super().__init__(name, help)
+        self.read = read
+
+    def render(self):
+        try:
+            value = self.read()
+        except Exception as e:
+            logger.error(f"Error reading gauge {self.name}: {str(e)}")
+            return []
+        return self.header() + [f"{self.name} {value}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            for key, series in self.series.items():
+                for bound, count in zip(self.buckets, series["counts"]):
+                    labels = _label_text(self.labels + ("le",), key + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _label_text(self.labels + ("le",), key + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {series['count']}")
+                lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_label_text(self.labels, key)} {series['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+CHAT_TURNS = registry.register(Counter(
+    "sea_chat_turns_total", "Chat turns by outcome", labels=("status",)))
+CHAT_TURN_SECONDS = registry.register(Histogram(
+    "sea_chat_turn_seconds", "Wall time of a chat turn, request to last chunk"))
+CHAT_TTFT_SECONDS = registry.register(Histogram(
+    "sea_chat_ttft_seconds", "Time from the start of a turn to the first streamed model token"))
+CHAT_TOKENS_PER_SECOND = registry.register(Histogram(
+    "sea_chat_tokens_per_second", "Streamed model tokens per second after the first token", buckets=RATE_BUCKETS))
+CODE_EXEC_SECONDS = registry.register(Histogram(
+    "sea_code_exec_seconds", "Wall time of one code block in the kernel, including its network fetches"))
+STREAM_BYTES = registry.register(Histogram(
+    "sea_chat_stream_bytes", "Bytes streamed to the client per turn", buckets=BYTE_BUCKETS))
+STREAM_ENCODE_SECONDS = registry.register(Histogram(
+    "sea_chat_stream_encode_seconds", "Time spent JSON-encoding stream chunks per turn"))
+HISTORY_WRITE_SECONDS = registry.register(Histogram(
+    "sea_history_write_seconds", "Time to append a turn's messages to the Redis history"))
+INTERPRETER_ACQUIRE_SECONDS = registry.register(Histogram(
+    "sea_interpreter_acquire_seconds", "Time to get a session's interpreter", labels=("source",)))
+SESSION_RESUME_SECONDS = registry.register(Histogram(
+    "sea_session_resume_seconds", "Time to restore history and kernel variables of a resumed session"))
+
+
+class SamplingProfiler:
+    """Samples one thread's stack every `interval` seconds into collapsed-stack counts"""
+
+    def __init__(self, thread_id, interval=0.01, max_depth=64):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = _Tally()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sea-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Samples in the collapsed format flamegraph tools read"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+    def top(self, limit=20):
+        """Leaf frames with the most samples"""
+        leaves = _Tally()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(self.samples.values()) or 1
+        return [
+            {"frame": frame, "samples": count, "fraction": round(count / total, 4)}
+            for frame, count in leaves.most_common(limit)
+        ]
+
+
+class ChatTurn:
+    """Span timings for one chat turn, fed from the stream as it is produced"""
+
+    def __init__(self, session_id, profile=False):
+        self.session_id = session_id
+        self.profile = profile
+        self.profiler = None
+        self.started = perf_counter()
+        self.first_token = None
+        self.last_token = None
+        self.tokens = 0
+        self.code_blocks = 0
+        self.code_exec = 0.0
+        self._exec_started = None
+        self.bytes_streamed = 0
+        self.encode_seconds = 0.0
+        self.history_write = None
+        self.spans = {}
+
+    def span(self, name, seconds):
+        """Record a named setup step (interpreter acquisition, resume, ...)"""
+        self.spans[name] = round(seconds, 6)
+
+    def bind_thread(self):
+        """Called on the thread that runs the turn; starts the profiler if enabled"""
+        if self.profile:
+            self.profiler = SamplingProfiler(threading.get_ident()).start()
+
+    def observe(self, chunk):
+        if not isinstance(chunk, dict):
+            return
+        now = perf_counter()
+        if chunk.get("role") == "assistant" and chunk.get("content") and chunk.get("type") in ("message", "code"):
+            if self.first_token is None:
+                self.first_token = now
+            self.last_token = now
+            self.tokens += 1  # One streamed delta per token
+        elif chunk.get("role") == "computer" and chunk.get("type") == "console":
+            if chunk.get("start") and self._exec_started is None:
+                self._exec_started = now
+            elif chunk.get("end") and self._exec_started is not None:
+                elapsed = now - self._exec_started
+                CODE_EXEC_SECONDS.observe(elapsed)
+                self.code_exec += elapsed
+                self.code_blocks += 1
+                self._exec_started = None
+
+    def encoded(self, data, seconds):
+        self.bytes_streamed += len(data)
+        self.encode_seconds += seconds
+
+    def finish(self, status):
+        if self.profiler is not None:
+            self.profiler.stop()
+        total = perf_counter() - self.started
+        ttft = self.first_token - self.started if self.first_token is not None else None
+        generation = (self.last_token - self.first_token) if self.first_token is not None else 0.0
+        # Code execution happens between tokens; don't count it against the model's rate
+        tokens_per_second = self.tokens / (generation - self.code_exec) if generation - self.code_exec > 0 else None
+
+        CHAT_TURNS.inc(status=status)
+        CHAT_TURN_SECONDS.observe(total)
+        if ttft is not None:
+            CHAT_TTFT_SECONDS.observe(ttft)
+        if tokens_per_second is not None:
+            CHAT_TOKENS_PER_SECOND.observe(tokens_per_second)
+        STREAM_BYTES.observe(self.bytes_streamed)
+        STREAM_ENCODE_SECONDS.observe(self.encode_seconds)
+        if self.history_write is not None:
+            HISTORY_WRITE_SECONDS.observe(self.history_write)
+
+        record = {
+            "event": "chat_turn",
+            "session_id": self.session_id,
+            "status": status,
+            "timestamp": time(),
+            "total_seconds": round(total, 6),
+            "ttft_seconds": round(ttft, 6) if ttft is not None else None,
+            "tokens": self.tokens,
+            "tokens_per_second": round(tokens_per_second, 2) if tokens_per_second is not None else None,
+            "code_blocks": self.code_blocks,
+            "code_exec_seconds": round(self.code_exec, 6),
+            "bytes_streamed": self.bytes_streamed,
+            "encode_seconds": round(self.encode_seconds, 6),
+            "history_write_seconds": round(self.history_write, 6) if self.history_write is not None else None,
+            "spans": self.spans,
+        }
+        logger.info(json.dumps(record))
+        return record
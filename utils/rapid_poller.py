@@ -0,0 +1,288 @@
+"""
+Shared ring buffer of RAPID (near-real-time) observations and predictions.
+
+The app polls stations/RAPID/{station_id}_mm_StationZero_GMT.csv for every
+FD station on a schedule with conditional GETs, so a file is only
+downloaded again when it changed. The last RAPID_DAYS of each station are
+kept in a fixed-size ring buffer of hourly records (time, prediction,
+observation and the precomputed residual = observation - prediction):
+
+    data/cache/rapid/ring.npy   (1000 station slots x RAPID_DAYS * 24 hours)
+    data/cache/rapid/slots.npy  (per slot: sequence counter, newest hour, updated_at)
+
+A station's slot is its uhslc_id and a record's position is its hour
+modulo the capacity, so a refresh overwrites only the hours it brings and
+nothing is ever shifted. Both files are memory-mapped by the app and by
+every kernel. The writer bumps a slot's sequence counter to an odd value
+while it writes and to an even one when it is done; readers copy the row
+and retry if the counter moved, so a read is a copy of ~17 KB and never
+sees a half-written refresh.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+from io import BytesIO
+from pathlib import Path
+from time import sleep, time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from utils.station_store import _to_epoch
+
+logger = logging.getLogger(__name__)
+
+RAPID_BASE_URL = os.getenv("RAPID_BASE_URL", "https://uhslc.soest.hawaii.edu/stations/RAPID")
+RAPID_URL = "{base}/{station_id}_mm_StationZero_GMT.csv"
+CACHE_DIR = Path(os.getenv("RAPID_CACHE_DIR", "data/cache/rapid"))
+RAPID_DAYS = int(os.getenv("RAPID_DAYS", "30"))
+POLL_INTERVAL = int(os.getenv("RAPID_POLL_MINUTES", "10")) * 60
+POLL_CONCURRENCY = int(os.getenv("RAPID_POLL_CONCURRENCY", "16"))
+FETCH_TIMEOUT = 30
+STATE_FILE = "state.json"
+SLOTS = 1000  # uhslc_ids are three digits
+RECORD_DTYPE = np.dtype([
+    ("time", "<i8"), ("prediction", "<f4"), ("observation", "<f4"), ("residual", "<f4"),
+])
+SLOT_DTYPE = np.dtype([("seq", "<i8"), ("newest", "<i8"), ("updated_at", "<f8")])
+
+
+def parse_rapid_csv(content):
+    """Parse a RAPID CSV (Time, Prediction, Observation) into epoch seconds and float32 mm (NaN where missing)"""
+    frame = pd.read_csv(BytesIO(content), skipinitialspace=True)
+    times = pd.to_datetime(frame.iloc[:, 0]).to_numpy("datetime64[s]").astype(np.int64)
+    prediction = pd.to_numeric(frame.iloc[:, 1], errors="coerce").to_numpy(np.float32)
+    observation = pd.to_numeric(frame.iloc[:, 2], errors="coerce").to_numpy(np.float32)
+    return times, prediction, observation
+
+
+class RapidRing:
+    """RAPID_DAYS of hourly RAPID records per station, memory-mapped from CACHE_DIR"""
+
+    def __init__(self, cache_dir=CACHE_DIR, days=RAPID_DAYS):
+        self.dir = Path(cache_dir)
+        self.capacity = days * 24
+        self._maps = None
+        self._inode = None
+
+    @property
+    def ring_path(self):
+        return self.dir / "ring.npy"
+
+    @property
+    def slots_path(self):
+        return self.dir / "slots.npy"
+
+    def create(self):
+        """Create the ring files, or replace them and forget the ETags if RAPID_DAYS changed.
+
+        Only the poller calls this.
+        """
+        try:
+            ring = np.load(self.ring_path, mmap_mode="r")
+            if ring.shape == (SLOTS, self.capacity) and ring.dtype == RECORD_DTYPE and self.slots_path.exists():
+                return
+        except (OSError, ValueError):
+            pass
+        self.dir.mkdir(parents=True, exist_ok=True)
+        # Slots first, so a reader that sees the new ring also finds its empty counters
+        for path, dtype, shape in ((self.slots_path, SLOT_DTYPE, (SLOTS,)),
+                                   (self.ring_path, RECORD_DTYPE, (SLOTS, self.capacity))):
+            tmp = path.with_name(f".{path.name}.tmp")
+            np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=shape).flush()
+            os.replace(tmp, path)
+        # The stored ETags describe data the new ring doesn't hold, so every station has to be fetched again
+        (self.dir / STATE_FILE).unlink(missing_ok=True)
+        logger.info(f"Created the RAPID ring buffer in {self.dir} ({self.capacity} hours per station)")
+
+    def _load(self, writable=False):
+        inode = self.ring_path.stat().st_ino
+        if self._maps is None or inode != self._inode or (writable and not self._maps[0].flags.writeable):
+            mode = "r+" if writable else "r"
+            ring = np.load(self.ring_path, mmap_mode=mode)
+            self._maps = (ring, np.load(self.slots_path, mmap_mode=mode))
+            self._inode = inode
+        return self._maps
+
+    def write(self, station_id, times, prediction, observation):
+        """Store a station's records, keeping the last `capacity` hours"""
+        ring, slots = self._load(writable=True)
+        slot, capacity = int(station_id), ring.shape[1]
+        hours = np.asarray(times, np.int64) // 3600
+        if len(hours) == 0:
+            return 0
+        newest = max(int(hours.max()), int(slots["newest"][slot]))
+        keep = hours > newest - capacity
+        records = np.empty(int(keep.sum()), RECORD_DTYPE)
+        records["time"] = hours[keep] * 3600
+        records["prediction"] = np.asarray(prediction, np.float32)[keep]
+        records["observation"] = np.asarray(observation, np.float32)[keep]
+        records["residual"] = records["observation"] - records["prediction"]
+
+        slots["seq"][slot] += 1
+        ring[slot, hours[keep] % capacity] = records
+        slots["newest"][slot] = newest
+        slots["updated_at"][slot] = time()
+        slots["seq"][slot] += 1
+        return len(records)
+
+    def read(self, station_id, start=None, end=None):
+        """Copy of a station's records in [start, end], oldest first, and when they were last refreshed"""
+        ring, slots = self._load()
+        slot, capacity = int(station_id), ring.shape[1]
+        for _ in range(1000):
+            seq = int(slots["seq"][slot])
+            if seq % 2 == 0:
+                row = ring[slot].copy()
+                newest, updated_at = int(slots["newest"][slot]), float(slots["updated_at"][slot])
+                if int(slots["seq"][slot]) == seq:
+                    break
+            sleep(0)
+        else:
+            raise TimeoutError(f"RAPID data of station {station_id} is being rewritten, try again")
+        if newest == 0:
+            raise KeyError(f"Station {station_id} has no RAPID data in the ring buffer")
+
+        # The oldest hour sits right after the newest one; slots not written in this window hold older times
+        row = np.roll(row, -((newest + 1) % capacity))
+        row = row[row["time"] > (newest - capacity) * 3600]
+        times = row["time"]
+        first = 0 if start is None else int(np.searchsorted(times, _to_epoch(start)))
+        last = len(times) if end is None else int(np.searchsorted(times, _to_epoch(end), "right"))
+        return row[first:last], updated_at
+
+    def stations(self):
+        """Ids of the stations that have data"""
+        _, slots = self._load()
+        return [f"{slot:03d}" for slot in np.flatnonzero(slots["newest"])]
+
+
+class RapidPoller:
+    def __init__(self, ring=None, base_url=RAPID_BASE_URL, concurrency=POLL_CONCURRENCY):
+        self.ring = ring or RapidRing()
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.last_result = None
+
+    def _read_state(self):
+        try:
+            return json.loads((self.ring.dir / STATE_FILE).read_text())
+        except (OSError, ValueError):
+            return {}
+
+    async def _poll_station(self, client, semaphore, station_id, state):
+        headers = {}
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
+        async with semaphore:
+            try:
+                response = await client.get(RAPID_URL.format(base=self.base_url, station_id=station_id), headers=headers)
+            except httpx.HTTPError as e:
+                logger.error(f"Error fetching RAPID data for station {station_id}: {str(e)}")
+                return "failed", state
+        if response.status_code == 304:
+            return "unchanged", state
+        if response.status_code != 200:
+            return ("missing" if response.status_code == 404 else "failed"), state
+        try:
+            times, prediction, observation = await asyncio.to_thread(parse_rapid_csv, response.content)
+            self.ring.write(station_id, times, prediction, observation)
+        except Exception as e:
+            logger.error(f"Error parsing RAPID data for station {station_id}: {str(e)}")
+            return "failed", state
+        return "updated", {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+
+    async def poll(self, station_ids=None, client=None):
+        """Refresh every station whose RAPID file changed since the last poll"""
+        started = time()
+        self.ring.dir.mkdir(parents=True, exist_ok=True)
+        with open(self.ring.dir / "poll.lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return {"status": "busy"}  # Another worker is polling
+            try:
+                return await self._poll(station_ids, client, started)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    async def _poll(self, station_ids, client, started):
+        if station_ids is None:
+            from utils.station_index import get_station_table
+
+            station_ids = (await asyncio.to_thread(get_station_table))["station_id"].tolist()
+        self.ring.create()
+        state = self._read_state()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        owns_client = client is None
+        if owns_client:
+            client = httpx.AsyncClient(timeout=FETCH_TIMEOUT, follow_redirects=True)
+        try:
+            results = await asyncio.gather(*(
+                self._poll_station(client, semaphore, station_id, state.get(station_id, {}))
+                for station_id in station_ids
+            ))
+        finally:
+            if owns_client:
+                await client.aclose()
+
+        counts = {"updated": 0, "unchanged": 0, "missing": 0, "failed": 0}
+        for station_id, (status, station_state) in zip(station_ids, results):
+            counts[status] += 1
+            state[station_id] = station_state
+        tmp = self.ring.dir / f".{STATE_FILE}.tmp"
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, self.ring.dir / STATE_FILE)
+        result = {"status": "done", **counts, "seconds": round(time() - started, 3), "checked_at": time()}
+        self.last_result = result
+        return result
+
+    def get_stats(self):
+        try:
+            stations = len(self.ring.stations())
+        except OSError:
+            stations = 0
+        return {"last_poll": self.last_result, "stations": stations, "hours_per_station": self.ring.capacity}
+
+
+_default_ring = None
+_default_poller = None
+
+
+def get_default_ring():
+    global _default_ring
+    if _default_ring is None:
+        _default_ring = RapidRing()
+    return _default_ring
+
+
+def get_default_poller():
+    global _default_poller
+    if _default_poller is None:
+        _default_poller = RapidPoller(get_default_ring())
+    return _default_poller
+
+
+def get_rapid_data(station_id, start=None, end=None):
+    """Recent RAPID data as a DataFrame with `time` (UTC), `prediction_mm`, `observation_mm` and `residual_mm`"""
+    station_id = f"{int(station_id):03d}"
+    try:
+        records, updated_at = get_default_ring().read(station_id, start, end)
+    except FileNotFoundError:
+        raise KeyError(f"Station {station_id} has no RAPID data in the ring buffer")
+    frame = pd.DataFrame({
+        "time": pd.to_datetime(records["time"], unit="s", utc=True),
+        "prediction_mm": records["prediction"],
+        "observation_mm": records["observation"],
+        "residual_mm": records["residual"],
+    })
+    frame.attrs["updated_at"] = pd.Timestamp(updated_at, unit="s", tz="UTC").isoformat()
+    return frame
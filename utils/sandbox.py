@@ -0,0 +1,341 @@
+import logging
+import multiprocessing
+import os
+import resource
+import threading
+from pathlib import Path
+from time import time
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+
+class SandboxError(Exception):
+    """Raised when a sandbox worker dies or returns an error"""
+    pass
+
+
+class SandboxCapacityError(SandboxError):
+    """Raised when the host is too busy to admit another sandbox worker"""
+    pass
+
+
+def _join_cgroup(cgroup_root, name, memory_bytes):
+    """Move the current process into its own cgroup v2 group with a memory ceiling"""
+    group = Path(cgroup_root) / name
+    group.mkdir(exist_ok=True)
+    (group / "memory.max").write_text(str(memory_bytes))
+    (group / "cgroup.procs").write_text(str(os.getpid()))
+
+
+def _apply_limits(name, cpu_seconds, memory_bytes, cgroup_root):
+    # Limits are inherited by the Jupyter kernel the interpreter spawns
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 5))
+    if memory_bytes:
+        if cgroup_root:
+            try:
+                _join_cgroup(cgroup_root, name, memory_bytes)
+                return
+            except OSError as e:
+                logger.warning(f"Could not use cgroup {cgroup_root}, falling back to rlimit: {str(e)}")
+        # RLIMIT_AS caps address space rather than RSS, but Linux ignores RLIMIT_RSS
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+
+
+def _sandbox_main(conn, name, cpu_seconds, memory_bytes, cgroup_root):
+    """Entry point of a sandbox worker process"""
+    try:
+        _apply_limits(name, cpu_seconds, memory_bytes, cgroup_root)
+        from utils.interpreter_factory import create_interpreter
+        interpreter = create_interpreter()
+    except Exception as e:
+        conn.send(("error", str(e), None))
+        return
+    conn.send(("done", None))
+
+    while True:
+        try:
+            command, *args = conn.recv()
+        except EOFError:
+            interpreter.reset()
+            return
+        try:
+            if command == "chat":
+                message, custom_instructions = args
+                interpreter.custom_instructions = custom_instructions
+                for chunk in interpreter.chat(message, stream=True):
+                    conn.send(("chunk", chunk))
+                conn.send(("done", interpreter.messages))
+            elif command == "run":
+                language, code = args
+                conn.send(("done", interpreter.computer.run(language, code)))
+            elif command == "set_messages":
+                interpreter.messages = args[0]
+                conn.send(("done", None))
+            elif command == "stop":
+                interpreter.reset()
+                conn.send(("done", None))
+                return
+        except Exception as e:
+            conn.send(("error", str(e), interpreter.messages))
+
+
+class _SandboxComputer:
+    """Stand-in for interpreter.computer that runs code in the worker's kernel"""
+
+    def __init__(self, sandbox):
+        self._sandbox = sandbox
+
+    def run(self, language, code):
+        return self._sandbox._call("run", language, code)
+
+
+class SandboxedInterpreter:
+    """Interpreter proxy backed by a separate worker process.
+
+    Exposes the parts of OpenInterpreter the app uses (`chat`, `messages`,
+    `custom_instructions`, `computer.run` and `reset`), so it can be handed
+    out by the interpreter pool in place of an in-process interpreter.
+    """
+
+    def __init__(self, name, cpu_seconds=None, memory_bytes=None, cgroup_root=None):
+        self.name = name
+        self.session_id = None
+        self.custom_instructions = ""
+        self.messages = []
+        self.computer = _SandboxComputer(self)
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.started = time()
+        self._lock = threading.Lock()
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_sandbox_main,
+            args=(child_conn, name, cpu_seconds, memory_bytes, cgroup_root),
+            name=name,
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        try:
+            self._receive()
+        except SandboxError:
+            self.kill()
+            raise
+
+    @property
+    def alive(self):
+        return self.process.is_alive()
+
+    def _receive(self):
+        try:
+            reply = self._conn.recv()
+        except (EOFError, OSError):
+            self.process.join(1)
+            raise SandboxError(f"Sandbox worker {self.name} exited with code {self.process.exitcode}")
+        if reply[0] == "error":
+            if reply[2] is not None:
+                self.messages = reply[2]
+            raise SandboxError(reply[1])
+        return reply
+
+    def _call(self, command, *args):
+        with self._lock:
+            self._conn.send((command, *args))
+            return self._receive()[1]
+
+    def chat(self, message, stream=True):
+        """Run one chat turn in the worker, yielding its streamed chunks"""
+        with self._lock:
+            self._conn.send(("chat", message, self.custom_instructions))
+            finished = False
+            try:
+                while True:
+                    kind, payload = self._receive()
+                    if kind == "done":
+                        self.messages = payload
+                        finished = True
+                        return
+                    yield payload
+            finally:
+                # The turn keeps running if the client went away; drain it so the
+                # next command doesn't read stale chunks
+                while not finished:
+                    try:
+                        kind, payload = self._receive()
+                    except SandboxError:
+                        break
+                    if kind == "done":
+                        self.messages = payload
+                        finished = True
+
+    def set_messages(self, messages):
+        self._call("set_messages", messages)
+        self.messages = messages
+
+    def reset(self):
+        """Stop the worker and its kernel"""
+        if self.alive:
+            try:
+                self._call("stop")
+            except (SandboxError, OSError):
+                pass
+            self.process.join(5)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(5)
+        self._conn.close()
+
+    def usage(self):
+        """CPU time and RSS of the worker and every process it spawned"""
+        report = {
+            "name": self.name,
+            "session_id": self.session_id,
+            "pid": self.process.pid,
+            "alive": self.alive,
+            "started": self.started,
+            "rss_bytes": 0,
+            "cpu_seconds": 0.0,
+            "processes": 0,
+            "memory_limit_bytes": self.memory_bytes,
+            "cpu_limit_seconds": self.cpu_seconds,
+        }
+        try:
+            root = psutil.Process(self.process.pid)
+            for process in [root] + root.children(recursive=True):
+                try:
+                    cpu = process.cpu_times()
+                    report["rss_bytes"] += process.memory_info().rss
+                    report["cpu_seconds"] += cpu.user + cpu.system
+                    report["processes"] += 1
+                except psutil.NoSuchProcess:
+                    continue
+        except psutil.NoSuchProcess:
+            report["alive"] = False
+        return report
+
+
+class SandboxManager:
+    """Spawns sandbox workers, applies admission control and enforces ceilings.
+
+    rlimits (or a cgroup when `cgroup_root` is a writable cgroup v2 directory)
+    are set inside each worker. Because rlimits apply per process, a watchdog
+    thread additionally sums usage over each worker's whole process tree and
+    kills workers that exceed their session's ceilings.
+    """
+
+    def __init__(self, cpu_seconds, memory_bytes, max_workers, min_free_bytes,
+                 max_cpu_percent, cgroup_root=None, check_interval=5):
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.max_workers = max_workers
+        self.min_free_bytes = min_free_bytes
+        self.max_cpu_percent = max_cpu_percent
+        self.cgroup_root = cgroup_root
+        self.check_interval = check_interval
+        self.workers = {}
+        self.stats = {"spawned": 0, "rejected": 0, "killed": 0}
+        self._lock = threading.Lock()
+        self._counter = 0
+        self._stopped = threading.Event()
+        self._watchdog = None
+        # Prime psutil's CPU sampling so the first admission check has a baseline
+        psutil.cpu_percent(interval=None)
+
+    def admit(self):
+        """Raise SandboxCapacityError if the host can't take another worker"""
+        reason = None
+        with self._lock:
+            live = sum(1 for worker in self.workers.values() if worker.alive)
+        if live >= self.max_workers:
+            reason = f"{live} sandbox workers running (max {self.max_workers})"
+        elif psutil.virtual_memory().available < self.min_free_bytes:
+            reason = "host memory is low"
+        elif psutil.cpu_percent(interval=None) > self.max_cpu_percent:
+            reason = "host CPU is saturated"
+        if reason:
+            with self._lock:
+                self.stats["rejected"] += 1
+            raise SandboxCapacityError(f"Sandbox capacity exhausted: {reason}")
+
+    def spawn(self):
+        """Start a new sandbox worker after admission control"""
+        self.admit()
+        with self._lock:
+            self._counter += 1
+            name = f"sea-sandbox-{os.getpid()}-{self._counter}"
+        worker = SandboxedInterpreter(
+            name,
+            cpu_seconds=self.cpu_seconds,
+            memory_bytes=self.memory_bytes,
+            cgroup_root=self.cgroup_root,
+        )
+        with self._lock:
+            self.workers[name] = worker
+            self.stats["spawned"] += 1
+        return worker
+
+    def start(self):
+        if self._watchdog is None:
+            self._watchdog = threading.Thread(target=self._watch, name="sandbox-watchdog", daemon=True)
+            self._watchdog.start()
+
+    def stop(self):
+        self._stopped.set()
+        with self._lock:
+            workers = list(self.workers.values())
+            self.workers.clear()
+        for worker in workers:
+            worker.kill()
+
+    def _watch(self):
+        while not self._stopped.wait(self.check_interval):
+            with self._lock:
+                workers = list(self.workers.items())
+            for name, worker in workers:
+                if not worker.alive:
+                    with self._lock:
+                        self.workers.pop(name, None)
+                    continue
+                usage = worker.usage()
+                over_memory = self.memory_bytes and usage["rss_bytes"] > self.memory_bytes
+                over_cpu = self.cpu_seconds and usage["cpu_seconds"] > self.cpu_seconds
+                if over_memory or over_cpu:
+                    logger.warning(
+                        f"Killing sandbox {name} (session {worker.session_id}): "
+                        f"rss={usage['rss_bytes']} cpu={usage['cpu_seconds']:.1f}s"
+                    )
+                    worker.kill()
+                    with self._lock:
+                        self.workers.pop(name, None)
+                        self.stats["killed"] += 1
+
+    def report(self):
+        """Per-worker resource usage plus host and admission figures"""
+        with self._lock:
+            workers = list(self.workers.values())
+            stats = dict(self.stats)
+        memory = psutil.virtual_memory()
+        return {
+            "host": {
+                "memory_available_bytes": memory.available,
+                "memory_total_bytes": memory.total,
+                "cpu_percent": psutil.cpu_percent(interval=None),
+            },
+            "limits": {
+                "cpu_seconds": self.cpu_seconds,
+                "memory_bytes": self.memory_bytes,
+                "max_workers": self.max_workers,
+                "min_free_bytes": self.min_free_bytes,
+                "max_cpu_percent": self.max_cpu_percent,
+                "cgroup_root": self.cgroup_root,
+            },
+            "stats": stats,
+            "workers": [worker.usage() for worker in workers],
+        }
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from pathlib import Path
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+CGROUP_MEMORY_MAX = Path("/sys/fs/cgroup/memory.max")
+CGROUP_MEMORY_CURRENT = Path("/sys/fs/cgroup/memory.current")
+CGROUP_MEMORY_STAT = Path("/sys/fs/cgroup/memory.stat")
+
+
+class SessionCapacityError(Exception):
+    """Raised when no room can be made for a new session"""
+    pass
+
+
+def _inactive_file_bytes():
+    """Page cache the kernel can reclaim without pressure (memory.stat inactive_file)"""
+    try:
+        for line in CGROUP_MEMORY_STAT.read_text().splitlines():
+            key, _, value = line.partition(" ")
+            if key == "inactive_file":
+                return int(value)
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def memory_usage_fraction():
+    """Fraction of available memory in use, honouring the container's cgroup limit.
+
+    memory.current counts the page cache of every memory-mapped store, so the
+    inactive file cache is left out, as kubelet does for its working set.
+    """
+    try:
+        limit = CGROUP_MEMORY_MAX.read_text().strip()
+        if limit != "max":
+            working_set = int(CGROUP_MEMORY_CURRENT.read_text()) - _inactive_file_bytes()
+            return max(working_set, 0) / int(limit)
+    except (OSError, ValueError):
+        pass
+    return psutil.virtual_memory().percent / 100
+
+
+class SessionCapacity:
+    """Tracks whether another live session fits under the session and memory caps"""
+
+    def __init__(self, max_sessions, memory_high_watermark, max_memory_evictions=2, settle_seconds=0.5):
+        self.max_sessions = max_sessions
+        self.memory_high_watermark = memory_high_watermark
+        self.max_memory_evictions = max_memory_evictions
+        self.settle_seconds = settle_seconds
+        self.stats = {"evicted": 0, "rejected": 0}
+
+    def over_memory(self):
+        return memory_usage_fraction() >= self.memory_high_watermark
+
+    async def make_room(self, sessions, busy, last_used, evict):
+        """Evict least-recently-used idle sessions until another one fits.
+
+        The session cap is exact, so as many sessions are evicted as it takes.
+        Memory freed by an eviction takes a while to show up in the cgroup, so
+        over the watermark one session is evicted per pass, `settle_seconds`
+        before checking again, and at most `max_memory_evictions` per call.
+        """
+        memory_evictions = 0
+        while True:
+            over_sessions = len(sessions) >= self.max_sessions
+            if not over_sessions and (memory_evictions >= self.max_memory_evictions or not self.over_memory()):
+                return
+            idle = [sid for sid in sessions if sid not in busy]
+            if not idle:
+                self.stats["rejected"] += 1
+                raise SessionCapacityError(f"{len(sessions)} sessions busy, none can be evicted")
+            await evict(min(idle, key=last_used))
+            if not over_sessions:
+                memory_evictions += 1
+                if memory_evictions < self.max_memory_evictions:
+                    await asyncio.sleep(self.settle_seconds)
+
+    def get_stats(self, live_sessions, busy_sessions):
+        stats = dict(self.stats)
+        stats.update({
+            "live_sessions": live_sessions,
+            "busy_sessions": busy_sessions,
+            "max_sessions": self.max_sessions,
+            "memory_usage": memory_usage_fraction(),
+            "memory_high_watermark": self.memory_high_watermark,
+        })
+        return stats
@@ -0,0 +1,91 @@
+import asyncio
+import heapq
+import logging
+from time import time
+
+logger = logging.getLogger(__name__)
+
+
+class SessionReaper:
+    """Expires sessions `idle_timeout` seconds after their last activity.
+
+    Deadlines live in a min-heap, so the reaper sleeps exactly until the next
+    session is due instead of polling. Touching a session pushes a fresh
+    deadline and leaves the old heap entry behind; stale entries are skipped
+    when popped and the heap is compacted when they pile up.
+    """
+
+    def __init__(self, idle_timeout, on_expire):
+        self.idle_timeout = idle_timeout
+        self.on_expire = on_expire
+        self._heap = []
+        self._deadlines = {}
+        self._wakeup = asyncio.Event()
+        self.stats = {
+            "reclaimed": 0,
+            "errors": 0,
+            "latency_total": 0.0,
+            "latency_max": 0.0,
+            "latency_last": 0.0,
+        }
+
+    def touch(self, session_id, now=None):
+        """Record activity, pushing the session's expiry out by idle_timeout"""
+        self.schedule(session_id, (now or time()) + self.idle_timeout)
+
+    def schedule(self, session_id, deadline):
+        """Expire a session at an explicit time"""
+        self._deadlines[session_id] = deadline
+        heapq.heappush(self._heap, (deadline, session_id))
+        if self._heap[0][1] == session_id:
+            self._wakeup.set()
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(d, s) for s, d in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def forget(self, session_id):
+        """Stop tracking a session (e.g. after it was cleared explicitly)"""
+        self._deadlines.pop(session_id, None)
+
+    def deadline(self, session_id):
+        return self._deadlines.get(session_id)
+
+    async def run(self):
+        """Reap sessions as their deadlines pass; runs until cancelled"""
+        while True:
+            now = time()
+            while self._heap and self._heap[0][0] <= now:
+                deadline, session_id = heapq.heappop(self._heap)
+                if self._deadlines.get(session_id) != deadline:
+                    continue  # Touched again since this entry was pushed
+                del self._deadlines[session_id]
+                try:
+                    await self.on_expire(session_id)
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    logger.error(f"Error reaping session {session_id}: {str(e)}")
+                    continue
+                latency = time() - deadline
+                self.stats["reclaimed"] += 1
+                self.stats["latency_total"] += latency
+                self.stats["latency_last"] = latency
+                self.stats["latency_max"] = max(self.stats["latency_max"], latency)
+                logger.info(f"Reaped idle session {session_id} {latency:.2f}s after its deadline")
+                now = time()
+
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["tracked_sessions"] = len(self._deadlines)
+        stats["heap_size"] = len(self._heap)
+        reclaimed = stats["reclaimed"]
+        stats["latency_avg"] = stats["latency_total"] / reclaimed if reclaimed else 0.0
+        upcoming = min(self._deadlines.values(), default=None)
+        stats["next_expiry_in"] = max(0.0, upcoming - time()) if upcoming is not None else None
+        return stats
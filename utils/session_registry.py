@@ -0,0 +1,131 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import socket
+from time import time
+
+logger = logging.getLogger(__name__)
+
+SESSION_OWNER_PREFIX = "session_owner:"
+WORKER_PREFIX = "worker:"
+FORWARD_MAX_AGE = 30  # Seconds a forwarded request's signature stays valid
+
+# Deletes the owner key only if it still points at the given worker
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _forward_signature(secret, worker_id, client_address, timestamp):
+    message = f"{worker_id}\n{client_address}\n{timestamp}".encode("utf-8")
+    return hmac.new(secret.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+
+class SessionRegistry:
+    """Redis-backed map of session id -> worker that holds its interpreter.
+
+    Every worker advertises the URL it can be reached at under
+    `worker:{worker_id}` with a short TTL that is refreshed by a heartbeat.
+    A session is owned by the first worker that claims it and stays there
+    for as long as that worker keeps heartbeating; if the owner disappears
+    the next worker to see the session takes it over.
+
+    Workers that share `secret` sign the client address of the requests
+    they forward, so the receiving worker can rate limit by the original
+    client without trusting headers a client could set itself.
+    """
+
+    def __init__(self, redis, worker_url, worker_id=None, heartbeat_interval=10, worker_ttl=30, secret=None):
+        self.redis = redis
+        self.worker_url = worker_url.rstrip("/")
+        self.worker_id = worker_id or default_worker_id()
+        self.secret = secret
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_ttl = worker_ttl
+        self._release = redis.register_script(_RELEASE_SCRIPT)
+
+    async def register_worker(self):
+        await self.redis.set(f"{WORKER_PREFIX}{self.worker_id}", self.worker_url, ex=self.worker_ttl)
+
+    async def unregister_worker(self):
+        await self.redis.delete(f"{WORKER_PREFIX}{self.worker_id}")
+
+    async def heartbeat_forever(self):
+        """Keep this worker's registration alive"""
+        while True:
+            try:
+                await self.register_worker()
+            except Exception as e:
+                logger.error(f"Error in worker heartbeat: {str(e)}")
+            await asyncio.sleep(self.heartbeat_interval)
+
+    def sign_forward(self, client_address):
+        """(timestamp, signature) vouching for the client address of a request this worker forwards.
+
+        None without a shared secret.
+        """
+        if not self.secret:
+            return None
+        timestamp = str(int(time()))
+        return timestamp, _forward_signature(self.secret, self.worker_id, client_address, timestamp)
+
+    def verify_forward(self, worker_id, client_address, timestamp, signature):
+        """Whether worker_id signed this client address with the shared secret in the last FORWARD_MAX_AGE seconds"""
+        if not (self.secret and worker_id and client_address and timestamp and signature):
+            return False
+        try:
+            if abs(time() - int(timestamp)) > FORWARD_MAX_AGE:
+                return False
+        except ValueError:
+            return False
+        expected = _forward_signature(self.secret, worker_id, client_address, timestamp)
+        return hmac.compare_digest(expected, signature)
+
+    async def worker_url_for(self, worker_id):
+        """URL of a live worker, or None if it stopped heartbeating"""
+        url = await self.redis.get(f"{WORKER_PREFIX}{worker_id}")
+        return url.decode("utf-8") if url else None
+
+    async def owner(self, session_id):
+        """Return (worker_id, url) of the live owner of a session, or (None, None)"""
+        owner = await self.redis.get(f"{SESSION_OWNER_PREFIX}{session_id}")
+        if not owner:
+            return None, None
+        owner = owner.decode("utf-8")
+        if owner == self.worker_id:
+            return owner, self.worker_url
+        url = await self.worker_url_for(owner)
+        return (owner, url) if url else (None, None)
+
+    async def claim(self, session_id, take_over=False):
+        """Make this worker the owner of a session.
+
+        Returns the worker id that owns the session afterwards. Without
+        `take_over`, an existing owner is only replaced if it is no longer
+        alive.
+        """
+        key = f"{SESSION_OWNER_PREFIX}{session_id}"
+        if take_over:
+            await self.redis.set(key, self.worker_id)
+            return self.worker_id
+        if await self.redis.set(key, self.worker_id, nx=True):
+            return self.worker_id
+        owner, _ = await self.owner(session_id)
+        if owner is None:
+            logger.info(f"Taking over session {session_id} from a dead worker")
+            await self.redis.set(key, self.worker_id)
+            return self.worker_id
+        return owner
+
+    async def release(self, session_id):
+        """Give up ownership of a session held by this worker"""
+        await self._release(keys=[f"{SESSION_OWNER_PREFIX}{session_id}"], args=[self.worker_id])
@@ -0,0 +1,384 @@
+"""
+Precomputed station metadata index built from fd_metadata.geojson and
+all_benchmarks.json.
+
+The geojson files are parsed once into fixed-width NumPy record arrays
+(one row per station sorted by uhslc_id, one row per benchmark sorted by
+station) and saved as .npy files under data/cache/station_index. Kernels
+memory-map them, so every session shares the same pages and a lookup by
+station id is a binary search instead of a scan of the geojson.
+
+A lat/lon grid over the stations (cell_start/cell_order, in the CSR layout)
+answers nearest-station and bounding-box queries by only looking at the
+cells that can contain a match. Each build lives in its own directory and
+CURRENT names the live one, so a rebuild never changes files a kernel has
+mapped. The index is rebuilt when either source file changes.
+"""
+import fcntl
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from time import time
+
+import numpy as np
+import pandas as pd
+
+METADATA_PATH = Path(os.getenv("FD_METADATA_PATH", "data/metadata/fd_metadata.geojson"))
+BENCHMARKS_PATH = Path(os.getenv("BENCHMARKS_PATH", "data/benchmarks/all_benchmarks.json"))
+INDEX_DIR = Path(os.getenv("STATION_INDEX_DIR", "data/cache/station_index"))
+GRID_DEGREES = 5
+EARTH_RADIUS_KM = 6371.0
+CURRENT_FILE = "CURRENT"
+TABLES = ("stations", "benchmarks", "cell_start", "cell_order")
+
+
+def _text(value):
+    return "" if value is None else str(value)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _date(value):
+    try:
+        return np.datetime64(str(value)[:10], "D")
+    except ValueError:
+        return np.datetime64("NaT", "D")
+
+
+def _span(span):
+    """(begin, end) of an fd_span, which may be a dict or a [begin, end] pair"""
+    if isinstance(span, dict):
+        begin = next((span[key] for key in ("begin", "oldest", "start") if key in span), None)
+        end = next((span[key] for key in ("end", "latest", "stop") if key in span), None)
+        return _date(begin), _date(end)
+    if isinstance(span, (list, tuple)) and len(span) == 2:
+        return _date(span[0]), _date(span[1])
+    return _date(None), _date(None)
+
+
+def _record_array(rows, fields):
+    """Record array with numeric fields as given and str fields as the narrowest fixed-width unicode"""
+    dtype = []
+    for name, kind in fields:
+        if kind is str:
+            kind = f"U{max([len(row[name]) for row in rows] + [1])}"
+        dtype.append((name, kind))
+    return np.array([tuple(row[name] for name, _ in fields) for row in rows], dtype=dtype)
+
+
+def build_station_table(geojson):
+    rows = []
+    for feature in geojson["features"]:
+        properties = feature.get("properties", {})
+        coordinates = (feature.get("geometry") or {}).get("coordinates") or [np.nan, np.nan]
+        fd_begin, fd_end = _span(properties.get("fd_span"))
+        rows.append({
+            "uhslc_id": int(properties["uhslc_id"]),
+            "name": _text(properties.get("name")),
+            "country": _text(properties.get("country")),
+            "lat": _number(coordinates[1]),
+            "lon": _number(coordinates[0]),
+            "fd_begin": fd_begin,
+            "fd_end": fd_end,
+        })
+    rows.sort(key=lambda row: row["uhslc_id"])
+    return _record_array(rows, [
+        ("uhslc_id", "<i4"), ("name", str), ("country", str), ("lat", "<f8"), ("lon", "<f8"),
+        ("fd_begin", "<M8[D]"), ("fd_end", "<M8[D]"),
+    ])
+
+
+def build_benchmark_table(geojson):
+    rows = []
+    for feature in geojson["features"]:
+        properties = feature.get("properties", {})
+        rows.append({
+            "uhslc_id": int(properties["uhslc_id"]),
+            "benchmark": _text(properties.get("benchmark")),
+            "type": _text(properties.get("type")),
+            "primary": bool(properties.get("primary")),
+            "lat": _number(properties.get("lat")),
+            "lon": _number(properties.get("lon")),
+            "level_m": _number(properties.get("level")),
+            "level_date": _date(properties.get("level_date")),
+            "description": _text(properties.get("description")),
+            "photo_files": ";".join(photo.get("file", "") for photo in properties.get("photo_files") or []),
+        })
+    rows.sort(key=lambda row: (row["uhslc_id"], not row["primary"], row["benchmark"]))
+    return _record_array(rows, [
+        ("uhslc_id", "<i4"), ("benchmark", str), ("type", str), ("primary", "?"), ("lat", "<f8"),
+        ("lon", "<f8"), ("level_m", "<f8"), ("level_date", "<M8[D]"), ("description", str), ("photo_files", str),
+    ])
+
+
+def _grid_shape(degrees=GRID_DEGREES):
+    return int(np.ceil(180 / degrees)), int(np.ceil(360 / degrees))
+
+
+def _cell_coordinates(lat, lon, degrees=GRID_DEGREES):
+    rows, columns = _grid_shape(degrees)
+    row = np.clip(((np.asarray(lat) + 90) // degrees).astype(np.int64), 0, rows - 1)
+    column = (((np.asarray(lon) + 180) % 360) // degrees).astype(np.int64) % columns
+    return row, column
+
+
+def build_grid(lat, lon, degrees=GRID_DEGREES):
+    """CSR grid: stations of cell c are cell_order[cell_start[c]:cell_start[c + 1]]"""
+    rows, columns = _grid_shape(degrees)
+    located = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+    row, column = _cell_coordinates(lat[located], lon[located], degrees)
+    cells = row * columns + column
+    order = np.argsort(cells, kind="stable")
+    cell_start = np.zeros(rows * columns + 1, np.int32)
+    np.cumsum(np.bincount(cells, minlength=rows * columns), out=cell_start[1:])
+    return cell_start, located[order].astype(np.int32)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class StationIndex:
+    def __init__(self, index_dir=INDEX_DIR, metadata_path=METADATA_PATH, benchmarks_path=BENCHMARKS_PATH,
+                 check_interval=5):
+        self.dir = Path(index_dir)
+        self.metadata_path = Path(metadata_path)
+        self.benchmarks_path = Path(benchmarks_path)
+        self.check_interval = check_interval
+        self._tables = None
+        self._build = None
+        self._checked = 0
+
+    @contextmanager
+    def _locked(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with open(self.dir / "build.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _source_stamp(self):
+        stamp = {}
+        for key, path in (("metadata", self.metadata_path), ("benchmarks", self.benchmarks_path)):
+            try:
+                stat = path.stat()
+                stamp[key] = [stat.st_mtime_ns, stat.st_size]
+            except OSError:
+                stamp[key] = None
+        return stamp
+
+    def _current(self):
+        try:
+            name = (self.dir / CURRENT_FILE).read_text().strip()
+            return name, json.loads((self.dir / name / "meta.json").read_text())
+        except (OSError, ValueError):
+            return None, None
+
+    def build(self, force=False):
+        """Parse the source files into a new build directory and make it current"""
+        with self._locked():
+            stamp = self._source_stamp()
+            name, meta = self._current()
+            if not force and meta is not None and meta["sources"] == stamp:
+                return name  # Another process rebuilt it while we waited for the lock
+            if stamp["metadata"] is None:
+                raise FileNotFoundError(f"Station metadata not found at {self.metadata_path}")
+            stations = build_station_table(json.loads(self.metadata_path.read_text()))
+            if stamp["benchmarks"] is not None:
+                benchmarks = build_benchmark_table(json.loads(self.benchmarks_path.read_text()))
+            else:
+                benchmarks = build_benchmark_table({"features": []})
+            cell_start, cell_order = build_grid(stations["lat"], stations["lon"])
+
+            name = f"build-{time():.6f}"
+            build_dir = self.dir / name
+            build_dir.mkdir()
+            for table, array in zip(TABLES, (stations, benchmarks, cell_start, cell_order)):
+                np.save(build_dir / f"{table}.npy", array)
+            (build_dir / "meta.json").write_text(json.dumps({
+                "sources": stamp, "grid_degrees": GRID_DEGREES,
+                "stations": len(stations), "benchmarks": len(benchmarks),
+            }))
+            tmp = self.dir / f"{CURRENT_FILE}.tmp"
+            tmp.write_text(name)
+            os.replace(tmp, self.dir / CURRENT_FILE)
+
+            # Keep the previous build around for kernels that still have it mapped
+            builds = sorted(path for path in self.dir.glob("build-*") if path.is_dir())
+            for old in builds[:-2]:
+                shutil.rmtree(old, ignore_errors=True)
+            return name
+
+    def _load(self):
+        now = time()
+        if self._tables is not None and now - self._checked < self.check_interval:
+            return self._tables
+        self._checked = now
+        name, meta = self._current()
+        if meta is None or meta["sources"] != self._source_stamp():
+            self.build()
+            name, meta = self._current()
+        if name != self._build:
+            self._tables = {
+                table: np.load(self.dir / name / f"{table}.npy", mmap_mode="r") for table in TABLES
+            }
+            self._tables["grid_degrees"] = meta["grid_degrees"]
+            self._build = name
+        return self._tables
+
+    @property
+    def stations(self):
+        """Read-only record array of all stations, sorted by uhslc_id"""
+        return self._load()["stations"]
+
+    @property
+    def benchmarks(self):
+        return self._load()["benchmarks"]
+
+    def position(self, station_id):
+        """Row of a station in `stations`"""
+        ids = self.stations["uhslc_id"]
+        uhslc_id = int(station_id)
+        row = int(np.searchsorted(ids, uhslc_id))
+        if row == len(ids) or ids[row] != uhslc_id:
+            raise KeyError(f"Station {station_id} is not in fd_metadata.geojson")
+        return row
+
+    def station(self, station_id):
+        return self.stations[self.position(station_id)]
+
+    def station_benchmarks(self, station_id):
+        ids = self.benchmarks["uhslc_id"]
+        uhslc_id = int(station_id)
+        return self.benchmarks[np.searchsorted(ids, uhslc_id, "left"):np.searchsorted(ids, uhslc_id, "right")]
+
+    def _candidates(self, lat_min, lat_max, lon_min, lon_max):
+        """Rows of stations in the grid cells overlapping a box; lon_min > lon_max wraps the dateline"""
+        tables = self._load()
+        degrees = tables["grid_degrees"]
+        rows, columns = _grid_shape(degrees)
+        first_row, first_column = _cell_coordinates(max(lat_min, -90), lon_min, degrees)
+        last_row, last_column = _cell_coordinates(min(lat_max, 90), lon_max, degrees)
+        wraps = (lon_min + 180) % 360 > (lon_max + 180) % 360
+        if lon_max - lon_min >= 360 or (wraps and first_column == last_column):
+            column_ids = np.arange(columns)
+        else:
+            column_ids = np.arange(first_column, first_column + (last_column - first_column) % columns + 1) % columns
+        cells = (np.arange(first_row, last_row + 1)[:, None] * columns + column_ids[None, :]).ravel()
+        cell_start, cell_order = tables["cell_start"], tables["cell_order"]
+        return np.concatenate([cell_order[cell_start[c]:cell_start[c + 1]] for c in cells] or [np.empty(0, np.int32)])
+
+    def in_bbox(self, lat_min, lat_max, lon_min, lon_max):
+        """Rows of stations inside a lat/lon box. Pass lon_min > lon_max for boxes across the dateline."""
+        rows = self._candidates(lat_min, lat_max, lon_min, lon_max)
+        lat = self.stations["lat"][rows]
+        lon = (self.stations["lon"][rows] + 180) % 360 - 180
+        west, east = (lon_min + 180) % 360 - 180, (lon_max + 180) % 360 - 180
+        if lon_max - lon_min >= 360:
+            inside_lon = np.ones(len(rows), bool)
+        elif west <= east:
+            inside_lon = (lon >= west) & (lon <= east)
+        else:
+            inside_lon = (lon >= west) | (lon <= east)
+        return np.sort(rows[(lat >= lat_min) & (lat <= lat_max) & inside_lon])
+
+    def nearest(self, lat, lon, k=5, max_km=None):
+        """(rows, distances in km) of the k stations closest to a point, nearest first"""
+        stations = self.stations
+        radius = np.radians(self._load()["grid_degrees"])
+        while True:
+            # Box around the search circle (wider in longitude away from the equator)
+            degrees = np.degrees(radius)
+            cos_lat = np.cos(np.radians(lat))
+            if radius >= np.pi / 2 or abs(lat) + degrees >= 90 or np.sin(radius) >= cos_lat:
+                rows = self._candidates(-90, 90, -180, 180)
+            else:
+                half_width = np.degrees(np.arcsin(np.sin(radius) / cos_lat))
+                rows = self._candidates(lat - degrees, lat + degrees, lon - half_width, lon + half_width)
+            distances = haversine_km(lat, lon, stations["lat"][rows], stations["lon"][rows])
+            inside = distances <= radius * EARTH_RADIUS_KM
+            limit = max_km is not None and radius * EARTH_RADIUS_KM >= max_km
+            if inside.sum() >= k or limit or radius >= np.pi:
+                order = np.argsort(distances, kind="stable")[:k]
+                rows, distances = rows[order], distances[order]
+                if max_km is not None:
+                    keep = distances <= max_km
+                    rows, distances = rows[keep], distances[keep]
+                return rows, distances
+            radius = min(radius * 2, np.pi)
+
+    def get_stats(self):
+        name, meta = self._current()
+        return {"build": name, **(meta or {})}
+
+
+_default_index = None
+
+
+def get_default_index():
+    global _default_index
+    if _default_index is None:
+        _default_index = StationIndex()
+    return _default_index
+
+
+def _station_frame(stations, rows):
+    selected = stations[rows]
+    return pd.DataFrame({
+        "station_id": [f"{uhslc_id:03d}" for uhslc_id in selected["uhslc_id"]],
+        "name": selected["name"],
+        "country": selected["country"],
+        "lat": selected["lat"],
+        "lon": selected["lon"],
+        "fd_begin": selected["fd_begin"],
+        "fd_end": selected["fd_end"],
+    })
+
+
+def get_station_table():
+    """All FD stations as a DataFrame (station_id, name, country, lat, lon, fd_begin, fd_end)"""
+    index = get_default_index()
+    return _station_frame(index.stations, slice(None))
+
+
+def get_station_info(station_id):
+    """Name, country, location, FD span and benchmark count of one station as a dict"""
+    index = get_default_index()
+    info = _station_frame(index.stations, [index.position(station_id)]).iloc[0].to_dict()
+    info["benchmarks"] = len(index.station_benchmarks(station_id))
+    return info
+
+
+def get_station_benchmarks(station_id):
+    """A station's benchmarks as a DataFrame, primary benchmark first; levels are in meters"""
+    benchmarks = get_default_index().station_benchmarks(station_id)
+    frame = pd.DataFrame({name: benchmarks[name] for name in benchmarks.dtype.names})
+    frame["photo_files"] = [files.split(";") if files else [] for files in frame["photo_files"]]
+    frame.insert(0, "station_id", [f"{uhslc_id:03d}" for uhslc_id in frame.pop("uhslc_id")])
+    return frame
+
+
+def find_nearest_stations(lat, lon, k=5, max_km=None):
+    """The k stations closest to (lat, lon), with their great-circle distance_km, nearest first"""
+    index = get_default_index()
+    rows, distances = index.nearest(lat, lon, k, max_km)
+    frame = _station_frame(index.stations, rows)
+    frame["distance_km"] = distances
+    return frame
+
+
+def find_stations_in_bbox(lat_min, lat_max, lon_min, lon_max):
+    """Stations inside a lat/lon box; use lon_min > lon_max for boxes across the dateline"""
+    index = get_default_index()
+    return _station_frame(index.stations, index.in_bbox(lat_min, lat_max, lon_min, lon_max))
@@ -0,0 +1,230 @@
+"""
+Packed columnar store for UHSLC Fast Delivery sea level records.
+
+Each station is one raw little-endian int32 file (mm, MISSING_VALUE where
+there is no observation) sampled at a fixed cadence from a start time, so
+any time slice is a plain offset into the file. Files are memory-mapped on
+read and slices are returned without copying. An index.json per frequency
+records each station's start, cadence and length:
+
+    data/stations/hourly/index.json
+    data/stations/hourly/057.i4
+
+Written by `python -m utils.download_and_pack_sealevel_data` and read in
+the kernels through `get_station_series`.
+"""
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from io import BytesIO, StringIO
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+STORE_DIR = Path(os.getenv("STATION_STORE_DIR", "data/stations"))
+CADENCES = {"hourly": 3600, "daily": 86400}
+DTYPE = np.dtype("<i4")
+MISSING_VALUE = -32767
+INDEX_FILE = "index.json"
+
+
+def _to_epoch(value):
+    stamp = pd.Timestamp(value)
+    if stamp.tzinfo is not None:
+        stamp = stamp.tz_convert("UTC").tz_localize(None)
+    return int(stamp.to_datetime64().astype("datetime64[s]").astype(np.int64))
+
+
+def parse_fd_csv(text, frequency):
+    """Parse a FD CSV (year, month, day[, hour], sea level) into epoch seconds and int32 values"""
+    columns = ["year", "month", "day", "hour", "sea_level"] if frequency == "hourly" else \
+        ["year", "month", "day", "sea_level"]
+    frame = pd.read_csv(
+        StringIO(text) if isinstance(text, str) else BytesIO(text) if isinstance(text, bytes) else text,
+        header=None, names=columns, dtype=np.int64, skipinitialspace=True,
+    )
+    # Year/month/day arithmetic on datetime64 instead of per-row datetime construction
+    months = (frame["year"].to_numpy() - 1970) * 12 + frame["month"].to_numpy() - 1
+    days = months.astype("datetime64[M]").astype("datetime64[D]") + (frame["day"].to_numpy() - 1)
+    times = days.astype("datetime64[s]").astype(np.int64)
+    if frequency == "hourly":
+        times = times + frame["hour"].to_numpy() * 3600
+    return times, frame["sea_level"].to_numpy().astype(DTYPE)
+
+
+def line_offsets(content):
+    """Byte offset of each non-blank line in `content`, matching the rows parse_fd_csv returns"""
+    raw = np.frombuffer(content, np.uint8)
+    starts = np.concatenate([[0], np.flatnonzero(raw == ord("\n")) + 1])
+    starts = starts[starts < len(raw)]
+    return starts[(raw[starts] != ord("\n")) & (raw[starts] != ord("\r"))]
+
+
+def pack(times, values, cadence):
+    """Lay samples out on a regular grid, filling gaps with MISSING_VALUE. Returns (start, array)."""
+    if len(times) == 0:
+        return 0, np.empty(0, DTYPE)
+    start = int(times.min())
+    positions = (times - start) // cadence
+    packed = np.full(int(positions.max()) + 1, MISSING_VALUE, DTYPE)
+    packed[positions] = values
+    return start, packed
+
+
+class StationStore:
+    """One frequency's worth of packed station files plus their index"""
+
+    def __init__(self, root=STORE_DIR, frequency="hourly"):
+        self.frequency = frequency
+        self.cadence = CADENCES[frequency]
+        self.dir = Path(root) / frequency
+        self._index = None
+        self._index_mtime = None
+        self._maps = {}
+
+    @contextmanager
+    def _locked(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with open(self.dir / f"{INDEX_FILE}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _path(self, station_id):
+        return self.dir / f"{station_id}.i4"
+
+    @property
+    def index(self):
+        """Station index, reloaded when the file changes on disk"""
+        path = self.dir / INDEX_FILE
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            return {}
+        if mtime != self._index_mtime:
+            self._index = json.loads(path.read_text())
+            self._index_mtime = mtime
+            self._maps.clear()  # Data files may have been replaced
+        return self._index
+
+    def _write_index(self, index):
+        path = self.dir / INDEX_FILE
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(index, sort_keys=True))
+        os.replace(tmp, path)
+
+    def update_entry(self, station_id, **fields):
+        """Merge fields into a station's index entry"""
+        with self._locked():
+            index = dict(self.index)
+            index[station_id] = dict(index.get(station_id, {}), **fields)
+            self._write_index(index)
+
+    def write_station(self, station_id, start, values, **fields):
+        """Replace a station's record with `values` starting at epoch second `start`"""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(station_id)
+        tmp = path.with_suffix(".tmp")
+        np.ascontiguousarray(values, DTYPE).tofile(tmp)
+        os.replace(tmp, path)
+        self.update_entry(station_id, start=int(start), cadence=self.cadence, length=len(values), **fields)
+
+    def ingest(self, station_id, times, values, **fields):
+        """Pack irregular (time, value) samples and store them as the station's record"""
+        start, packed = pack(np.asarray(times, np.int64), np.asarray(values), self.cadence)
+        self.write_station(station_id, start, packed, **fields)
+        return len(packed)
+
+    def append(self, station_id, times, values, **fields):
+        """Overwrite a station's record from the first of `times` onward, extending it as needed.
+
+        Samples before that point are kept, so only the tail of a record has
+        to be downloaded when it changes. The record is written to a new file
+        that replaces the old one, so kernels that have the old file mapped
+        keep reading it intact.
+        """
+        entry = self.info(station_id)
+        tail_start, packed = pack(np.asarray(times, np.int64), np.asarray(values), self.cadence)
+        if len(packed) == 0:
+            self.update_entry(station_id, **fields)
+            return entry["length"]
+        if tail_start < entry["start"]:
+            raise ValueError(f"Tail of station {station_id} starts before its record")
+        position, remainder = divmod(tail_start - entry["start"], self.cadence)
+        if remainder:
+            raise ValueError(f"Tail of station {station_id} is not aligned to its {self.frequency} cadence")
+        position = min(position, entry["length"])
+        # Gap between the current end and the tail is filled with MISSING_VALUE by pack's grid
+        if position < (tail_start - entry["start"]) // self.cadence:
+            gap = np.full((tail_start - entry["start"]) // self.cadence - position, MISSING_VALUE, DTYPE)
+            packed = np.concatenate([gap, packed])
+        path = self._path(station_id)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            np.fromfile(path, DTYPE, count=position).tofile(f)
+            np.ascontiguousarray(packed, DTYPE).tofile(f)
+        os.replace(tmp, path)
+        length = position + len(packed)
+        self.update_entry(station_id, length=length, **fields)
+        return length
+
+    def stations(self):
+        return sorted(self.index)
+
+    def info(self, station_id):
+        entry = self.index.get(station_id)
+        if entry is None:
+            raise KeyError(f"Station {station_id} is not in the {self.frequency} store")
+        return entry
+
+    def _memmap(self, station_id):
+        entry = self.info(station_id)
+        memmap = self._maps.get(station_id)
+        if memmap is None or len(memmap) != entry["length"]:
+            if entry["length"] == 0:
+                memmap = np.empty(0, DTYPE)
+            else:
+                memmap = np.memmap(self._path(station_id), dtype=DTYPE, mode="r", shape=(entry["length"],))
+            self._maps[station_id] = memmap
+        return memmap
+
+    def read(self, station_id, start=None, end=None):
+        """Return (first sample epoch seconds, read-only int32 view) for [start, end]"""
+        entry = self.info(station_id)
+        data = self._memmap(station_id)
+        first = 0 if start is None else max(0, -(-(_to_epoch(start) - entry["start"]) // self.cadence))
+        last = len(data) if end is None else min(len(data), (_to_epoch(end) - entry["start"]) // self.cadence + 1)
+        last = max(first, last)
+        return entry["start"] + first * self.cadence, data[first:last]
+
+    def times(self, first_time, count):
+        """datetime64[s] timestamps for `count` samples starting at `first_time`"""
+        return (np.int64(first_time) + np.arange(count, dtype=np.int64) * self.cadence).astype("datetime64[s]")
+
+
+_stores = {}
+
+
+def get_store(frequency="hourly"):
+    store = _stores.get(frequency)
+    if store is None:
+        store = _stores[frequency] = StationStore(frequency=frequency)
+    return store
+
+
+def get_station_array(station_id, start=None, end=None, frequency="hourly"):
+    """(datetime64 times, int32 sea level in mm with -32767 for missing) for a station, zero copy"""
+    first_time, values = get_store(frequency).read(f"{int(station_id):03d}", start, end)
+    return get_store(frequency).times(first_time, len(values)), values
+
+
+def get_station_series(station_id, start=None, end=None, frequency="hourly"):
+    """Packed FD sea level for a station as a DataFrame with `time` (UTC) and `sea_level` (mm, NaN if missing)"""
+    times, values = get_station_array(station_id, start, end, frequency)
+    sea_level = values.astype(np.float64)
+    sea_level[values == MISSING_VALUE] = np.nan
+    return pd.DataFrame({"time": pd.to_datetime(times, utc=True), "sea_level": sea_level})
@@ -0,0 +1,48 @@
+import asyncio
+import threading
+
+_DONE = object()
+
+
+async def iterate_in_executor(executor, make_iterator):
+    """Consume a blocking iterator on `executor` and yield its items asynchronously.
+
+    `make_iterator` is called on the worker thread, so any setup work it does
+    (e.g. starting a chat turn) also stays off the event loop. Items are
+    handed back through an asyncio.Queue; if the consumer stops early the
+    worker closes the iterator at the next item.
+    """
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    cancelled = threading.Event()
+
+    def produce():
+        iterator = None
+        try:
+            iterator = make_iterator()
+            for item in iterator:
+                if cancelled.is_set():
+                    break
+                loop.call_soon_threadsafe(items.put_nowait, (item, None))
+        except BaseException as e:
+            loop.call_soon_threadsafe(items.put_nowait, (_DONE, e))
+            return
+        finally:
+            close = getattr(iterator, "close", None)
+            if cancelled.is_set() and close is not None:
+                close()
+        loop.call_soon_threadsafe(items.put_nowait, (_DONE, None))
+
+    future = loop.run_in_executor(executor, produce)
+    try:
+        while True:
+            item, error = await items.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                break
+            yield item
+    finally:
+        cancelled.set()
+        # Let the worker finish its current item before the caller moves on
+        await asyncio.shield(future)
@@ -0,0 +1,274 @@
+"""
+Harmonic tide predictions for any time, from per-station constituent tables.
+
+A station's constituents are solved once with utide (by default from its
+published hourly predictions in the tide store, or from its FD observations)
+and cached in data/cache/tide_harmonics/{station_id}.npz. Nodal and
+astronomical corrections change slowly, so the table stores one complex
+coefficient per constituent per calendar month from 1900 to 2100, taken
+from utide's own reconstruction, and a prediction is
+
+    h(t) = mean + Re(sum_k d[month(t), k] * exp(i * omega_k * t))
+
+with t in hours since 1970. Evenly spaced times (the usual case) reuse one
+block of phasors exp(i * omega * j * step) for every block of the series,
+so the whole prediction is a single complex matrix product with no trig
+per sample. Arbitrary times are evaluated month by month from their offset
+into the month, which is small enough for fast float32 trig.
+
+`validate_station` compares predictions with the published hourly CSVs.
+"""
+import argparse
+import logging
+import os
+from pathlib import Path
+from time import perf_counter, time
+
+import numpy as np
+import pandas as pd
+
+from utils.station_store import MISSING_VALUE, _to_epoch
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.getenv("TIDE_HARMONICS_DIR", "data/cache/tide_harmonics"))
+FIT_YEARS = 19  # A full nodal cycle (18.6 years)
+FIRST_MONTH = np.datetime64("1900-01", "M")
+LAST_MONTH = np.datetime64("2100-12", "M")
+BLOCK = 1024
+
+
+def _months():
+    return np.arange(FIRST_MONTH, LAST_MONTH + 1)
+
+
+def _hours(epoch_seconds):
+    return np.asarray(epoch_seconds, np.float64) / 3600.0
+
+
+def solve_constituents(times, heights, lat, constit="auto"):
+    """Solve tidal constituents with utide and return the station table as a dict of arrays.
+
+    times are epoch seconds, heights are mm (NaN where missing).
+    """
+    import utide
+
+    times = np.asarray(times, np.int64)
+    heights = np.asarray(heights, np.float64)
+    keep = np.isfinite(heights)
+    stamps = times[keep].astype("datetime64[s]")
+    coef = utide.solve(
+        stamps, heights[keep], lat=lat, method="ols", conf_int="none", trend=False,
+        constit=constit, verbose=False,
+    )
+    names = [str(name) for name in coef["name"]]
+    omega = 2 * np.pi * np.asarray(coef["aux"]["frq"], np.float64)  # cycles/hour -> rad/hour
+    mean = float(coef["mean"])
+
+    # Each constituent's contribution at every month start and a quarter period later gives its
+    # complex amplitude for that month, with utide's nodal and astronomical corrections included.
+    anchors = _months().astype("datetime64[s]")
+    anchor_hours = _hours(anchors.astype(np.int64))
+    coefficients = np.empty((len(anchors), len(names)), np.complex128)
+    for k, name in enumerate(names):
+        quarter = np.timedelta64(int(round(np.pi / 2 / omega[k] * 3600)), "s")
+        quarter_hours = quarter.astype(np.int64) / 3600.0
+        both = np.concatenate([anchors, anchors + quarter])
+        h = utide.reconstruct(both, coef, constit=[name], verbose=False, min_SNR=0, min_PE=0)["h"] - mean
+        at_anchor, at_quarter = h[:len(anchors)], h[len(anchors):]
+        # Re(c e^{i w tau}) = a cos(w tau) - b sin(w tau) for c = a + ib, matched at tau = 0 and tau = quarter
+        turn = omega[k] * quarter_hours
+        c = at_anchor + 1j * (at_anchor * np.cos(turn) - at_quarter) / np.sin(turn)
+        coefficients[:, k] = c * np.exp(-1j * omega[k] * anchor_hours)
+    return {
+        "names": np.array(names),
+        "omega": omega,
+        "amplitude": np.asarray(coef["A"], np.float64),
+        "phase": np.asarray(coef["g"], np.float64),
+        "mean": np.float64(mean),
+        "coefficients": coefficients,
+    }
+
+
+def evaluate(table, epoch_seconds):
+    """Predicted heights (mm) at epoch seconds, using a table from solve_constituents"""
+    times = np.asarray(epoch_seconds, np.int64).ravel()
+    out = np.empty(len(times), np.float64)
+    if len(times) == 0:
+        return out
+    order = None
+    if len(times) > 1 and (np.diff(times) < 0).any():
+        order = np.argsort(times, kind="stable")
+        times = times[order]
+    months = times.astype("datetime64[s]").astype("datetime64[M]")
+    if months[0] < FIRST_MONTH or months[-1] > LAST_MONTH:
+        raise ValueError(f"Predictions are only available from {FIRST_MONTH} to {LAST_MONTH}")
+    month_index = (months - FIRST_MONTH).astype(np.int64)
+    omega, coefficients = table["omega"], table["coefficients"]
+
+    steps = np.diff(times)
+    if len(times) > 2 and (steps == steps[0]).all():
+        values = _evaluate_even(times[0], int(steps[0]), len(times), month_index, omega, coefficients)
+    else:
+        values = _evaluate_any(times, months, month_index, omega, coefficients)
+    values += table["mean"]
+    if order is None:
+        return values
+    out[order] = values
+    return out
+
+
+def _evaluate_even(start, step, count, month_index, omega, coefficients):
+    """Evenly spaced times: blocks of BLOCK samples share one table of step phasors"""
+    # Blocks never span two months, so each block has one coefficient vector
+    bounds = np.flatnonzero(np.diff(month_index)) + 1
+    segment_starts = np.concatenate([[0], bounds])
+    segment_ends = np.concatenate([bounds, [count]])
+    block_starts = np.concatenate([np.arange(first, last, BLOCK) for first, last in zip(segment_starts, segment_ends)])
+    block_ends = np.minimum(
+        block_starts + BLOCK, np.repeat(segment_ends, -(-(segment_ends - segment_starts) // BLOCK)))
+
+    steps = np.exp(1j * np.outer(np.arange(BLOCK) * (step / 3600.0), omega))  # (BLOCK, K)
+    block_hours = (start + block_starts.astype(np.float64) * step) / 3600.0
+    weights = coefficients[month_index[block_starts]] * np.exp(1j * np.outer(block_hours, omega))  # (blocks, K)
+    blocks = (steps @ weights.T).real  # (BLOCK, blocks)
+
+    lengths = block_ends - block_starts
+    return blocks.T[np.arange(BLOCK)[None, :] < lengths[:, None]]
+
+
+def _evaluate_any(times, months, month_index, omega, coefficients, chunk=65536):
+    """Arbitrary times: per month, float32 trig of the offset from the month start and one matrix product"""
+    # Offsets are under 745 hours, so float32 phases stay within ~1e-4 rad (a small fraction of a mm)
+    bounds = np.flatnonzero(np.diff(month_index)) + 1
+    segment_starts = np.concatenate([[0], bounds])
+    segment_ends = np.concatenate([bounds, [len(times)]])
+    anchors = months[segment_starts].astype("datetime64[s]").astype(np.int64)
+    weights = coefficients[month_index[segment_starts]] * np.exp(1j * np.outer(_hours(anchors), omega))
+    omega32 = omega.astype(np.float32)
+
+    values = np.empty(len(times), np.float64)
+    for first, last, anchor, weight in zip(segment_starts, segment_ends, anchors, weights):
+        real, imag = weight.real.astype(np.float32), weight.imag.astype(np.float32)
+        for part_start in range(first, last, chunk):
+            part = slice(part_start, min(part_start + chunk, last))
+            phase = np.outer(((times[part] - anchor) / 3600.0).astype(np.float32), omega32)
+            values[part] = np.cos(phase) @ real - np.sin(phase) @ imag
+    return values
+
+
+class HarmonicsCache:
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.dir = Path(cache_dir)
+        self._tables = {}
+
+    def _path(self, station_id):
+        return self.dir / f"{station_id}.npz"
+
+    def build(self, station_id, source="predictions", years=FIT_YEARS):
+        """Solve a station's constituents from its hourly predictions or observations and cache them"""
+        from utils.station_index import get_station_info
+
+        started = perf_counter()
+        if source == "predictions":
+            from utils.tide_store import get_tide_prediction_array
+            times, values = get_tide_prediction_array(station_id)
+        elif source == "observations":
+            from utils.station_store import get_station_array
+            times, values = get_station_array(station_id)
+        else:
+            raise ValueError(f"Unknown source: {source}")
+        times = times.astype("datetime64[s]").astype(np.int64)
+        if years:
+            # The most recent full window, so long-record stations don't need more than a nodal cycle
+            keep = times >= times[-1] - int(years * 365.25 * 86400)
+            times, values = times[keep], values[keep]
+        heights = np.where(values == MISSING_VALUE, np.nan, values.astype(np.float64))
+        table = solve_constituents(times, heights, lat=get_station_info(station_id)["lat"])
+
+        self.dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.dir / f"{station_id}.tmp.npz"
+        np.savez(tmp, source=source, fit_start=times[0], fit_end=times[-1], built_at=time(), **table)
+        os.replace(tmp, self._path(station_id))
+        self._tables.pop(station_id, None)
+        logger.info(f"Solved {len(table['names'])} constituents for station {station_id} from its {source} "
+                    f"in {perf_counter() - started:.1f}s")
+        return table
+
+    def table(self, station_id):
+        station_id = f"{int(station_id):03d}"
+        path = self._path(station_id)
+        if not path.exists():
+            self.build(station_id)
+        mtime = path.stat().st_mtime_ns
+        cached = self._tables.get(station_id)
+        if cached is None or cached[0] != mtime:
+            with np.load(path) as data:
+                cached = (mtime, {name: data[name] for name in data.files})
+            self._tables[station_id] = cached
+        return cached[1]
+
+    def predict(self, station_id, epoch_seconds):
+        return evaluate(self.table(station_id), epoch_seconds)
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = HarmonicsCache()
+    return _default_cache
+
+
+def predict_tides(station_id, start=None, end=None, interval="1h", times=None):
+    """Harmonic tide predictions (mm, Station Zero) for any period from 1900 to 2100 at any interval.
+
+    Pass start/end/interval for an evenly spaced series, or `times` for arbitrary timestamps (UTC).
+    Returns a DataFrame with `time` and `tide_prediction_mm`.
+    """
+    if times is None:
+        step = int(pd.Timedelta(interval).total_seconds())
+        first, last = _to_epoch(start), _to_epoch(end)
+        seconds = np.arange(first, last + 1, step, dtype=np.int64)
+    else:
+        seconds = pd.to_datetime(times, utc=True).tz_localize(None).to_numpy("datetime64[s]").astype(np.int64)
+    heights = get_default_cache().predict(station_id, seconds)
+    return pd.DataFrame({"time": pd.to_datetime(seconds, unit="s", utc=True), "tide_prediction_mm": heights})
+
+
+def validate_station(station_id, start=None, end=None):
+    """Compare harmonic predictions with the published hourly CSV values in the tide store"""
+    from utils.tide_store import get_tide_prediction_array
+
+    times, published = get_tide_prediction_array(station_id, start, end)
+    seconds = times.astype("datetime64[s]").astype(np.int64)
+    valid = published != MISSING_VALUE
+    started = perf_counter()
+    predicted = get_default_cache().predict(station_id, seconds)
+    elapsed = perf_counter() - started
+    errors = predicted[valid] - published[valid]
+    return {
+        "station_id": f"{int(station_id):03d}",
+        "points": int(valid.sum()),
+        "rmse_mm": float(np.sqrt(np.mean(errors ** 2))),
+        "max_abs_mm": float(np.abs(errors).max()),
+        "bias_mm": float(errors.mean()),
+        "points_per_second": round(len(seconds) / max(elapsed, 1e-9)),
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Solve and cache tidal constituents, and check them against the published predictions")
+    parser.add_argument("stations", nargs="+", help="Station ids, e.g. 001 057")
+    parser.add_argument("--source", choices=["predictions", "observations"], default="predictions")
+    parser.add_argument("--years", type=float, default=FIT_YEARS, help="Years of data to fit (0 for all)")
+    parser.add_argument("--validate", action="store_true", help="Report errors against the published hourly predictions")
+    args = parser.parse_args()
+    cache = get_default_cache()
+    for station in args.stations:
+        cache.build(f"{int(station):03d}", source=args.source, years=args.years)
+        if args.validate:
+            print(validate_station(station))
@@ -0,0 +1,227 @@
+"""
+Packed store of UHSLC tide predictions.
+
+Hourly predictions (the 1983-2030 TidePrediction_hourly CSVs) are kept in a
+StationStore of their own, one raw int32 array (mm above Station Zero) per
+station on a fixed hourly grid:
+
+    data/tides/hourly/index.json
+    data/tides/hourly/057.i4
+
+High/low predictions (the 2023-2029 HighLow CSVs) are irregular, so each
+station is a .npy record array of events (`time` epoch seconds, `height`
+mm, `high` bool) sorted by time:
+
+    data/tides/highlow/index.json
+    data/tides/highlow/057.npy
+
+Both are memory-mapped on read, so kernels slice any station and period
+without downloading or parsing "DD-Mon-YYYY HH" strings. Filled by
+`python -m utils.tide_store`, which only re-downloads files whose ETag
+changed.
+"""
+import argparse
+import fcntl
+import json
+import logging
+import os
+from contextlib import contextmanager
+from io import BytesIO
+from pathlib import Path
+from time import time
+
+import numpy as np
+import pandas as pd
+
+from utils.bulk_fetch import BulkFetcher
+from utils.station_store import MISSING_VALUE, StationStore, _to_epoch
+
+logger = logging.getLogger(__name__)
+
+TIDE_STORE_DIR = Path(os.getenv("TIDE_STORE_DIR", "data/tides"))
+TIDES_BASE_URL = os.getenv("TIDES_BASE_URL", "https://uhslc.soest.hawaii.edu/stations/TIDES_DATUMS/fd")
+HOURLY_URL = "{base}/TidePrediction_GMT_StationZero/{station_id}_TidePrediction_hourly_mm_StationZero_1983_2030.csv"
+HIGHLOW_URL = "{base}/LST/fd{station_id}/{station_id}_TidePrediction_HighLow_StationZeroDatum_GMT_mm_2023_2029.csv"
+EVENT_DTYPE = np.dtype([("time", "<i8"), ("height", "<i4"), ("high", "?")])
+INDEX_FILE = "index.json"
+
+
+def parse_hourly_csv(content):
+    """Parse an hourly prediction CSV (Time_GMT "01-Jan-1983 01", TidePrediction_mm) into epoch seconds and int32"""
+    frame = pd.read_csv(BytesIO(content), skipinitialspace=True)
+    stamps = frame.iloc[:, 0].to_numpy(str)
+    values = frame.iloc[:, 1].to_numpy(np.float64)
+    values = np.where(np.isfinite(values), np.round(values), MISSING_VALUE).astype(np.int32)
+    if len(stamps) == 0:
+        return np.empty(0, np.int64), values
+    # The files are a gapless hourly series, so two timestamps are enough to place every row
+    first, last = (_to_epoch(pd.to_datetime(stamp, format="%d-%b-%Y %H")) for stamp in (stamps[0], stamps[-1]))
+    if last - first == (len(stamps) - 1) * 3600:
+        return first + np.arange(len(stamps), dtype=np.int64) * 3600, values
+    times = pd.to_datetime(stamps, format="%d-%b-%Y %H").to_numpy("datetime64[s]").astype(np.int64)
+    return times, values
+
+
+def parse_highlow_csv(content):
+    """Parse a high/low CSV (Date_Time_GMT, Tide_Prediction_mm, Tide_Type) into an EVENT_DTYPE array"""
+    frame = pd.read_csv(BytesIO(content), skipinitialspace=True)
+    events = np.empty(len(frame), EVENT_DTYPE)
+    events["time"] = pd.to_datetime(frame.iloc[:, 0], format="%d-%b-%Y %H:%M").to_numpy("datetime64[s]").astype(np.int64)
+    events["height"] = np.round(frame.iloc[:, 1].to_numpy(np.float64)).astype(np.int32)
+    events["high"] = frame.iloc[:, 2].astype(str).str.strip().str.startswith("High").to_numpy()
+    return np.sort(events, order="time")
+
+
+class HighLowStore:
+    """High/low tide events, one memory-mapped record array per station"""
+
+    def __init__(self, root=TIDE_STORE_DIR):
+        self.dir = Path(root) / "highlow"
+        self._index = None
+        self._index_mtime = None
+        self._maps = {}
+
+    @contextmanager
+    def _locked(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with open(self.dir / f"{INDEX_FILE}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @property
+    def index(self):
+        path = self.dir / INDEX_FILE
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            return {}
+        if mtime != self._index_mtime:
+            self._index = json.loads(path.read_text())
+            self._index_mtime = mtime
+            self._maps.clear()
+        return self._index
+
+    def update_entry(self, station_id, **fields):
+        with self._locked():
+            index = dict(self.index)
+            index[station_id] = dict(index.get(station_id, {}), **fields)
+            path = self.dir / INDEX_FILE
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(index, sort_keys=True))
+            os.replace(tmp, path)
+
+    def write_station(self, station_id, events, **fields):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        path = self.dir / f"{station_id}.npy"
+        tmp = self.dir / f"{station_id}.tmp.npy"
+        np.save(tmp, np.ascontiguousarray(events, EVENT_DTYPE))
+        os.replace(tmp, path)
+        self.update_entry(station_id, length=len(events), **fields)
+
+    def read(self, station_id, start=None, end=None):
+        """Read-only view of a station's events in [start, end]"""
+        if station_id not in self.index:
+            raise KeyError(f"Station {station_id} has no high/low predictions in the tide store")
+        events = self._maps.get(station_id)
+        if events is None:
+            events = self._maps[station_id] = np.load(self.dir / f"{station_id}.npy", mmap_mode="r")
+        times = events["time"]
+        first = 0 if start is None else int(np.searchsorted(times, _to_epoch(start)))
+        last = len(times) if end is None else int(np.searchsorted(times, _to_epoch(end), "right"))
+        return events[first:last]
+
+
+_stores = {}
+
+
+def get_hourly_store():
+    store = _stores.get("hourly")
+    if store is None:
+        store = _stores["hourly"] = StationStore(root=TIDE_STORE_DIR, frequency="hourly")
+    return store
+
+
+def get_highlow_store():
+    store = _stores.get("highlow")
+    if store is None:
+        store = _stores["highlow"] = HighLowStore()
+    return store
+
+
+def get_tide_prediction_array(station_id, start=None, end=None):
+    """(datetime64 times, int32 hourly tide prediction in mm above Station Zero) for a station, zero copy"""
+    store = get_hourly_store()
+    first_time, values = store.read(f"{int(station_id):03d}", start, end)
+    return store.times(first_time, len(values)), values
+
+
+def get_tide_predictions(station_id, start=None, end=None):
+    """Hourly tide predictions as a DataFrame with `time` (UTC) and `tide_prediction_mm` (Station Zero)"""
+    times, values = get_tide_prediction_array(station_id, start, end)
+    prediction = values.astype(np.float64)
+    prediction[values == MISSING_VALUE] = np.nan
+    return pd.DataFrame({"time": pd.to_datetime(times, utc=True), "tide_prediction_mm": prediction})
+
+
+def get_high_low_tides(station_id, start=None, end=None):
+    """High/low tide predictions as a DataFrame with `time` (UTC), `tide_prediction_mm` and `tide_type`"""
+    events = get_highlow_store().read(f"{int(station_id):03d}", start, end)
+    return pd.DataFrame({
+        "time": pd.to_datetime(events["time"], unit="s", utc=True),
+        "tide_prediction_mm": events["height"],
+        "tide_type": np.where(events["high"], "High Tide", "Low Tide"),
+    })
+
+
+def ingest_station(fetcher, station_id, base_url=TIDES_BASE_URL):
+    """Fetch a station's hourly and high/low files, skipping any whose ETag hasn't changed"""
+    modes = {}
+    for kind, template, store in (
+        ("hourly", HOURLY_URL, get_hourly_store()),
+        ("highlow", HIGHLOW_URL, get_highlow_store()),
+    ):
+        entry = store.index.get(station_id, {})
+        headers = {"If-None-Match": entry["etag"]} if entry.get("etag") else {}
+        response = fetcher.get(template.format(base=base_url, station_id=station_id), headers=headers)
+        if response.status_code == 304:
+            modes[kind] = "unchanged"
+            continue
+        if response.status_code != 200:
+            logger.error(f"Error fetching {kind} tide predictions for station {station_id}: HTTP {response.status_code}")
+            modes[kind] = response.status_code
+            continue
+        fields = {"etag": response.headers.get("ETag"), "refreshed_at": int(time())}
+        if kind == "hourly":
+            times, values = parse_hourly_csv(response.content)
+            store.ingest(station_id, times, values, **fields)
+        else:
+            store.write_station(station_id, parse_highlow_csv(response.content), **fields)
+        modes[kind] = "updated"
+    # A missing file won't appear on a retry; any other error counts the station as failed
+    if any(isinstance(mode, int) and mode != 404 for mode in modes.values()):
+        return None
+    return modes
+
+
+def ingest_all_stations(station_ids=None, fetcher=None, base_url=TIDES_BASE_URL):
+    fetcher = fetcher or BulkFetcher()
+    if not station_ids:
+        from utils.download_and_pack_sealevel_data import get_available_station_numbers
+
+        station_ids = [number[1:] for number in get_available_station_numbers("hourly", fetcher=fetcher)]
+    summary = fetcher.run(station_ids, lambda station_id: ingest_station(fetcher, station_id, base_url))
+    logger.info(f"Tide predictions in {TIDE_STORE_DIR}: {summary}")
+    return summary
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Pack UHSLC hourly and high/low tide predictions into the tide store")
+    parser.add_argument("--stations", nargs="*", help="Station ids, e.g. 001 057 (default: all FD stations)")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent downloads")
+    parser.add_argument("--rate", type=float, default=4.0, help="Requests per second per host")
+    args = parser.parse_args()
+    ingest_all_stations(args.stations, BulkFetcher(max_workers=args.workers, rate_per_host=args.rate))